@@ -1,45 +1,51 @@
 # agents/__init__.py
-"""SmartShopSaver 代理人模組"""
-
-from .base_agent import BaseAgent, AgentRegistry, agent_registry
-from .ai_intent_analyzer import AIIntentAnalyzer
-from .finance_agent import FinanceAgent
-from .gmail_integration_agent import GmailIntegrationAgent
-from .price_tracker_agent_improved import PriceTrackerAgent
-from .product_review_agent_improved import ProductReviewAgent
-from .smart_recommendation_agent import SmartRecommendationAgent
-from .response_formatter import (
-    format_price_comparison,
-    format_tracking_list,
-    format_expense_summary,
-    format_product_recommendation
-)
-from .multi_platform_search import (
-    search_all_platforms,
-    search_pchome,
-    format_multi_platform_response
-)
-
-__all__ = [
+"""SmartShopSaver 代理人模組
+
+採用 PEP 562 延遲載入：代理人模組在第一次被取用時才 import，
+避免啟動時就載入所有子系統（requests、資料庫連線等）。
+"""
+
+import importlib
+
+# 名稱 → 所屬模組，供 __getattr__ 查表
+_LAZY = {
     # 基礎類別
-    'BaseAgent',
-    'AgentRegistry',
-    'agent_registry',
-    
+    'BaseAgent': 'agents.base_agent',
+    'AgentRegistry': 'agents.base_agent',
+    'agent_registry': 'agents.base_agent',
+
     # 代理人
-    'AIIntentAnalyzer',
-    'FinanceAgent',
-    'GmailIntegrationAgent',
-    'PriceTrackerAgent',
-    'ProductReviewAgent',
-    'SmartRecommendationAgent',
-    
+    'AIIntentAnalyzer': 'agents.ai_intent_analyzer',
+    'FinanceAgent': 'agents.finance_agent',
+    'GmailIntegrationAgent': 'agents.gmail_integration_agent',
+    'PriceTrackerAgent': 'agents.price_tracker_agent_improved',
+    'ProductReviewAgent': 'agents.product_review_agent_improved',
+    'SmartRecommendationAgent': 'agents.smart_recommendation_agent',
+
     # 工具函數
-    'format_price_comparison',
-    'format_tracking_list',
-    'format_expense_summary',
-    'format_product_recommendation',
-    'search_all_platforms',
-    'search_pchome',
-    'format_multi_platform_response',
-]
+    'format_price_comparison': 'agents.response_formatter',
+    'format_tracking_list': 'agents.response_formatter',
+    'format_expense_summary': 'agents.response_formatter',
+    'format_product_recommendation': 'agents.response_formatter',
+    'search_all_platforms': 'agents.multi_platform_search',
+    'search_pchome': 'agents.multi_platform_search',
+    'format_multi_platform_response': 'agents.multi_platform_search',
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name):
+    """第一次取用時才載入對應模組（PEP 562）"""
+    try:
+        module_name = _LAZY[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    module = importlib.import_module(module_name)
+    value = getattr(module, name)
+    globals()[name] = value  # 快取，之後直接走屬性查找
+    return value
+
+
+def __dir__():
+    return sorted(__all__)
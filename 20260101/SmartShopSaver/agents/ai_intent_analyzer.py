@@ -6,13 +6,137 @@ AI 意圖分析器 - 使用 OpenAI 理解用戶真實意圖
 
 import os
 import json
+import time
+import hashlib
 import logging
+import queue
+import threading
 import requests
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import OrderedDict, deque
 from typing import Dict, Optional, Tuple, List
-from datetime import datetime
+
+# 處理可選套件：有 Redis 時對話歷史可跨 worker 共享
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+    redis = None
+
+# 處理可選套件：orjson 序列化/解析比 stdlib json 快 2-5 倍
+try:
+    import orjson
+
+    def _json_dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+
+    _json_loads = orjson.loads
+except ImportError:
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode()
+
+    _json_loads = json.loads
 
 logger = logging.getLogger(__name__)
 
+# 備用分析的關鍵字組: (代理人, 權重)，同組命中一次即加權
+_FALLBACK_GROUPS = (
+    ('SmartRecommendation', 0.5),
+    ('SmartRecommendation', 0.3),
+    ('PriceTracker', 0.7),
+    ('PriceTracker', 0.3),
+    ('ProductReview', 0.7),
+    ('ProductReview', 0.3),
+    ('Finance', 0.7),
+    ('Finance', 0.3),
+    ('Gmail', 0.8),
+    ('Gmail', 0.2),
+)
+
+# 每組的關鍵字（索引對應 _FALLBACK_GROUPS）
+_FALLBACK_GROUP_KEYWORDS = (
+    ('買', '推薦', '建議', '想要', '需要', '選', '哪個', '什麼', '好'),
+    ('滑鼠', '鍵盤', '耳機', '手機', '筆電', '平板'),
+    ('價格', '多少錢', '追蹤', '降價', '便宜', '特價'),
+    ('通知', '提醒', '目標價'),
+    ('評價', '評論', '好不好', '好用', '值得', '怎麼樣'),
+    ('優點', '缺點', '心得', '體驗'),
+    ('記帳', '記錄', '花費', '花了', '消費', '支出'),
+    ('預算', '統計', '這個月', '本月', '今天'),
+    ('gmail', 'mail', '郵件', '信件', 'email'),
+    ('連接', '連結', '授權', '同步'),
+)
+
+# 展平成 keyword -> 所屬組位元遮罩：整則訊息只掃一趟關鍵字表，
+# 命中以位元 OR 累積，最後一次 tally 取代逐組重掃
+_KEYWORD_OWNER_MASK = {}
+for _idx, _kws in enumerate(_FALLBACK_GROUP_KEYWORDS):
+    for _kw in _kws:
+        _KEYWORD_OWNER_MASK[_kw] = _KEYWORD_OWNER_MASK.get(_kw, 0) | (1 << _idx)
+del _idx, _kws, _kw
+
+# 固定不變的 system prompt 模板：{agents} 於 init 填入一次。
+# 放在 system role 且每次呼叫位元組相同，可讓 OpenAI 的 prefix cache
+# 直接重用這段前綴的 KV cache，省掉每次重算約 800 token 的 prefill
+_SYSTEM_PROMPT_TEMPLATE = """你是一個智能助理的意圖分析器。請分析用戶訊息，判斷應該由哪個代理人處理。
+
+可用代理人：{agents}
+
+分析規則：
+1. 仔細理解用戶的真實需求，不要只看表面關鍵字
+2. 考慮對話上下文，理解用戶可能的後續問題
+3. 如果用戶想買東西、需要建議、比較產品 → SmartRecommendation
+4. 如果詢問價格、要追蹤降價 → PriceTracker
+5. 如果問產品好不好、評價、用戶體驗 → ProductReview
+6. 如果要記錄花費、查看消費 → Finance
+7. 如果提到郵件、Gmail → Gmail
+8. 不確定時，優先選擇 SmartRecommendation
+
+請返回 JSON 格式：
+{{
+    "agent": "最適合的代理人名稱",
+    "confidence": 0.0-1.0的信心度,
+    "analysis": {{
+        "intent": "用戶真實意圖（中文）",
+        "keywords": ["識別到的關鍵概念"],
+        "context": "上下文理解",
+        "reasoning": "選擇此代理人的原因",
+        "alternative": "備選代理人（如果有）"
+    }}
+}}
+
+只返回 JSON，不要其他文字。"""
+
+# 精簡版 system prompt：只列代理人名稱與一行說明，輸出只要 agent 與
+# confidence。路由只需要這兩個欄位，輸入輸出 token 大約減半
+_SYSTEM_PROMPT_COMPACT_TEMPLATE = """你是意圖分析器。判斷用戶訊息該由哪個代理人處理。
+
+可用代理人：
+{agents}
+
+不確定時選 SmartRecommendation。
+只返回 JSON：{{"agent": "代理人名稱", "confidence": 0.0-1.0}}"""
+
+# 批次版 system prompt：微批次路徑一次分類多則訊息，
+# 輸出 results 陣列；與精簡版共用一行式代理人說明
+_SYSTEM_PROMPT_BATCH_TEMPLATE = """你是意圖分析器。會收到多則互不相關的用戶訊息，請逐一判斷各自該由哪個代理人處理。
+
+可用代理人：
+{agents}
+
+不確定時選 SmartRecommendation。
+只返回 JSON：{{"results": [依訊息順序，每則一個 {{"agent": "代理人名稱", "confidence": 0.0-1.0}}]}}"""
+
+# 每次呼叫變動的 user prompt：只帶上下文與當前訊息，保持 system 前綴穩定
+_USER_PROMPT_TEMPLATE = """對話歷史：
+{ctx}
+
+當前用戶訊息："{msg}"
+"""
+
 class AIIntentAnalyzer:
     """AI 意圖分析器 - 理解用戶的真實需求"""
     
@@ -20,7 +144,21 @@ class AIIntentAnalyzer:
         self.api_key = os.getenv("OPENAI_API_KEY", "")
         self.api_base = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
         self.model = os.getenv("GPT_MODEL", "gpt-4o-mini")
-        
+
+        # 共用 Session：連線池 + keep-alive，避免每次呼叫都重新 TLS 握手
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=50,
+            max_retries=Retry(
+                total=2,
+                backoff_factor=0.1,
+                status_forcelist=[429, 500, 502, 503, 504]
+            )
+        )
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
         # 代理人能力描述
         self.agents_capabilities = {
             "UniversalRecommendation": {
@@ -127,12 +265,60 @@ class AIIntentAnalyzer:
             }
         }
         
+        # 能力描述固定不變：在 init 組好一次，之後只填入上下文與訊息
+        agents_desc_parts = []
+        for name, info in self.agents_capabilities.items():
+            agents_desc_parts.append(f"\n{name}:\n")
+            agents_desc_parts.append(f"  描述: {info['description']}\n")
+            agents_desc_parts.append(f"  能力: {', '.join(info['capabilities'][:3])}\n")
+        self._agents_desc = "".join(agents_desc_parts)
+        self._system_prompt = _SYSTEM_PROMPT_TEMPLATE.replace("{agents}", self._agents_desc)
+
+        # 精簡版：預設路由用，每個代理人只留一行說明
+        agents_desc_compact = "\n".join(
+            f"- {name}: {info['description']}"
+            for name, info in self.agents_capabilities.items()
+        )
+        self._system_prompt_compact = _SYSTEM_PROMPT_COMPACT_TEMPLATE.replace(
+            "{agents}", agents_desc_compact
+        )
+        self._system_prompt_batch = _SYSTEM_PROMPT_BATCH_TEMPLATE.replace(
+            "{agents}", agents_desc_compact
+        )
+
         # 對話歷史（用於上下文理解）
-        self.conversation_history = {}
-        
+        # 設定 REDIS_URL 時存到 Redis（多 worker 共享、水平擴展不掉上下文）；
+        # 否則退回行程內結構：外層 LRU 淘汰不活躍用戶，內層 deque(maxlen=10)
+        self.redis = None
+        redis_url = os.getenv("REDIS_URL", "")
+        if redis_url and REDIS_AVAILABLE:
+            try:
+                self.redis = redis.Redis.from_url(redis_url, decode_responses=True)
+                logger.info("對話歷史改用 Redis 儲存")
+            except Exception as e:
+                logger.warning(f"Redis 連線失敗，改用行程內對話歷史: {e}")
+                self.redis = None
+        elif redis_url:
+            logger.warning("已設定 REDIS_URL 但未安裝 redis 套件，改用行程內對話歷史")
+        self.conversation_history = OrderedDict()
+        self._history_max_users = 10000
+        self._history_ttl = 86400  # Redis 歷史保留一天
+
+        # 意圖分析結果快取（LRU）：重複訊息直接命中，省去 OpenAI 往返
+        self._intent_cache = OrderedDict()
+        self._intent_cache_maxsize = 2048
+
+        # AI 呼叫與本地備用方案並行：AI 在軟期限內回來就用 AI 結果，
+        # 否則先回備用結果，AI 結果完成後寫入快取供下次命中
+        self._ai_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="intent-ai")
+        self._ai_soft_deadline = float(os.getenv("INTENT_AI_SOFT_DEADLINE", "1.5"))
+
+        # 規則分析信心達此門檻時直接採用，不再呼叫 OpenAI
+        self._fallback_shortcut_threshold = float(os.getenv("INTENT_FALLBACK_SHORTCUT", "0.7"))
+
         logger.info("AI 意圖分析器初始化完成")
     
-    def analyze_intent(self, message: str, user_id: str = None) -> Tuple[str, float, Dict]:
+    def analyze_intent(self, message: str, user_id: Optional[str] = None) -> Tuple[str, float, Dict]:
         """
         使用 AI 分析用戶意圖
         返回: (代理人名稱, 信心度, 詳細分析)
@@ -143,88 +329,127 @@ class AIIntentAnalyzer:
         if not self.api_key:
             # 沒有 API Key 時使用進階規則分析
             return self._advanced_fallback_analysis(message, context)
-        
+
+        # 規則分析先行：明確訊息（高信心）直接返回，免去 OpenAI 往返
+        fb_agent, fb_confidence, fb_analysis = self._advanced_fallback_analysis(message, context)
+        if fb_confidence >= self._fallback_shortcut_threshold:
+            if user_id:
+                self._update_conversation_history(user_id, message, fb_agent)
+            logger.info(f"規則分析高信心短路 - Agent: {fb_agent}, Confidence: {fb_confidence}")
+            return fb_agent, fb_confidence, fb_analysis
+
         try:
+            # 查詢快取：相同（模型, 訊息, 上下文）直接回傳之前的分析結果
+            cache_key = self._intent_cache_key(message, context)
+            cached = self._intent_cache_get(cache_key)
+            if cached is not None:
+                agent, confidence, analysis = cached
+                if user_id:
+                    self._update_conversation_history(user_id, message, agent)
+                logger.info(f"AI 分析快取命中 - Agent: {agent}, Confidence: {confidence}")
+                return agent, confidence, analysis
+
             # 構建 AI prompt
             prompt = self._build_advanced_prompt(message, context)
-            
-            # 調用 OpenAI API
-            result = self._call_openai(prompt)
-            
+
+            # AI 呼叫丟進執行緒池，與本地備用分析並行
+            ai_future = self._ai_executor.submit(self._call_openai, prompt)
+
+            try:
+                result = ai_future.result(timeout=self._ai_soft_deadline)
+            except FutureTimeoutError:
+                # 超過軟期限：先回本地結果，AI 完成後寫入快取供下次使用
+                ai_future.add_done_callback(
+                    lambda f, key=cache_key: self._cache_late_ai_result(f, key)
+                )
+                logger.info("AI 分析超過軟期限，改用本地備用分析")
+                result = None
+
             if result:
                 agent = result.get("agent", "SmartRecommendation")
                 confidence = result.get("confidence", 0.5)
                 analysis = result.get("analysis", {})
-                
-                # 記錄對話歷史
+
+                # 寫入快取並記錄對話歷史
+                self._intent_cache_put(cache_key, (agent, confidence, analysis))
                 if user_id:
                     self._update_conversation_history(user_id, message, agent)
-                
+
                 logger.info(f"AI 分析結果 - Agent: {agent}, Confidence: {confidence}")
                 return agent, confidence, analysis
-            
+
         except Exception as e:
             logger.error(f"AI 分析失敗: {e}")
-        
+
         # 失敗時使用進階備用方案
         return self._advanced_fallback_analysis(message, context)
-    
-    def _build_advanced_prompt(self, message: str, context: List[Dict]) -> str:
-        """構建進階分析 prompt"""
-        
-        # 構建代理人說明
-        agents_desc = ""
-        for name, info in self.agents_capabilities.items():
-            agents_desc += f"\n{name}:\n"
-            agents_desc += f"  描述: {info['description']}\n"
-            agents_desc += f"  能力: {', '.join(info['capabilities'][:3])}\n"
-        
-        # 構建上下文
-        context_str = ""
-        if context:
-            recent = context[-3:]  # 最近3條對話
-            for item in recent:
-                context_str += f"用戶: {item.get('message', '')}\n"
-                context_str += f"處理: {item.get('agent', '')}\n"
-        
-        return f"""你是一個智能助理的意圖分析器。請分析用戶訊息，判斷應該由哪個代理人處理。
 
-可用代理人：{agents_desc}
+    def _cache_late_ai_result(self, future, cache_key: bytes):
+        """軟期限後才完成的 AI 結果仍寫入快取，讓下次相同訊息直接命中"""
+        try:
+            result = future.result()
+        except Exception:
+            return
+        if result:
+            self._intent_cache_put(cache_key, (
+                result.get("agent", "SmartRecommendation"),
+                result.get("confidence", 0.5),
+                result.get("analysis", {})
+            ))
 
-對話歷史：
-{context_str if context_str else "（新對話）"}
+    def _intent_cache_key(self, message: str, context: List[Dict]) -> bytes:
+        """計算快取鍵：(模型, 訊息, 上下文摘要) 的雜湊值"""
+        context_digest = "|".join(
+            f"{item.get('message', '')}>{item.get('agent', '')}" for item in context[-3:]
+        )
+        return hashlib.blake2b(
+            f"{self.model}|{message}|{context_digest}".encode(),
+            digest_size=16
+        ).digest()
 
-當前用戶訊息："{message}"
+    def _intent_cache_get(self, key: bytes) -> Optional[Tuple[str, float, Dict]]:
+        """讀取快取，命中時移到尾端（LRU）"""
+        result = self._intent_cache.get(key)
+        if result is not None:
+            self._intent_cache.move_to_end(key)
+        return result
 
-分析規則：
-1. 仔細理解用戶的真實需求，不要只看表面關鍵字
-2. 考慮對話上下文，理解用戶可能的後續問題
-3. 如果用戶想買東西、需要建議、比較產品 → SmartRecommendation
-4. 如果詢問價格、要追蹤降價 → PriceTracker
-5. 如果問產品好不好、評價、用戶體驗 → ProductReview
-6. 如果要記錄花費、查看消費 → Finance
-7. 如果提到郵件、Gmail → Gmail
-8. 不確定時，優先選擇 SmartRecommendation
-
-請返回 JSON 格式：
-{{
-    "agent": "最適合的代理人名稱",
-    "confidence": 0.0-1.0的信心度,
-    "analysis": {{
-        "intent": "用戶真實意圖（中文）",
-        "keywords": ["識別到的關鍵概念"],
-        "context": "上下文理解",
-        "reasoning": "選擇此代理人的原因",
-        "alternative": "備選代理人（如果有）"
-    }}
-}}
+    def _intent_cache_put(self, key: bytes, value: Tuple[str, float, Dict]):
+        """寫入快取，超出容量時淘汰最久未使用的項目"""
+        self._intent_cache[key] = value
+        self._intent_cache.move_to_end(key)
+        if len(self._intent_cache) > self._intent_cache_maxsize:
+            self._intent_cache.popitem(last=False)
+    
+    def _build_advanced_prompt(self, message: str, context: List[Dict]) -> str:
+        """構建進階分析 prompt（能力說明已於 init 預先組好）"""
+        # 構建上下文
+        context_parts = []
+        for item in context[-3:]:  # 最近3條對話
+            context_parts.append(f"用戶: {item.get('message', '')}\n")
+            context_parts.append(f"處理: {item.get('agent', '')}\n")
+        context_str = "".join(context_parts)
 
-只返回 JSON，不要其他文字。"""
+        return _USER_PROMPT_TEMPLATE.format(
+            ctx=context_str if context_str else "（新對話）",
+            msg=message
+        )
     
-    def _call_openai(self, prompt: str) -> Optional[Dict]:
-        """調用 OpenAI API"""
+    def _call_openai(self, prompt: str, verbose: bool = False,
+                     system_prompt: Optional[str] = None,
+                     cache_key: Optional[str] = None,
+                     max_tokens: Optional[int] = None) -> Optional[Dict]:
+        """調用 OpenAI API
+
+        verbose=False（預設）用精簡 prompt、只取 agent/confidence；
+        verbose=True 用完整 prompt 拿到詳細 analysis（離線除錯用）。
+        system_prompt/cache_key/max_tokens 可個別覆寫，
+        供批次路徑帶自己的回應格式與 token 預算。
+        """
         try:
             url = f"{self.api_base.rstrip('/')}/chat/completions"
+            if system_prompt is None:
+                system_prompt = self._system_prompt if verbose else self._system_prompt_compact
             headers = {
                 "Authorization": f"Bearer {self.api_key}",
                 "Content-Type": "application/json"
@@ -234,105 +459,109 @@ class AIIntentAnalyzer:
                 "model": self.model,
                 "messages": [
                     {
+                        # 固定前綴（角色 + 能力說明 + 規則）走 prefix cache
                         "role": "system",
-                        "content": "你是一個精準的意圖分析器，擅長理解用戶的真實需求，不被表面文字迷惑。"
+                        "content": system_prompt
                     },
                     {
                         "role": "user",
                         "content": prompt
                     }
                 ],
+                # 穩定的快取鍵，提示供應端重用相同前綴的 KV cache
+                "prompt_cache_key": cache_key or (
+                    "intent_verbose_v1" if verbose else "intent_v1"
+                ),
                 "temperature": 0.3,
-                "max_tokens": 500,
-                "response_format": {"type": "json_object"}
+                "max_tokens": max_tokens or (500 if verbose else 60),
+                "response_format": {"type": "json_object"},
+                # 串流回應：邊生成邊接收，縮短等待完整回應的時間
+                "stream": True
             }
-            
-            response = requests.post(url, headers=headers, json=payload, timeout=10)
-            
+
+            response = self._session.post(
+                url, headers=headers, data=_json_dumps(payload), timeout=10, stream=True
+            )
+
             if response.status_code == 200:
-                data = response.json()
-                content = data['choices'][0]['message']['content']
-                return json.loads(content)
+                content = self._collect_stream_content(response)
+                return _json_loads(content) if content else None
             else:
                 logger.error(f"OpenAI API 錯誤: {response.status_code}")
                 return None
-                
+
         except Exception as e:
             logger.error(f"調用 OpenAI 失敗: {e}")
             return None
+
+    @staticmethod
+    def _collect_stream_content(response) -> str:
+        """逐行讀取 SSE 串流，拼接 delta.content 成完整 JSON 字串"""
+        parts = []
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            chunk = line[5:].strip()
+            if chunk == "[DONE]":
+                break
+            try:
+                delta = _json_loads(chunk)['choices'][0].get('delta', {})
+            except (ValueError, IndexError, KeyError):
+                continue
+            piece = delta.get('content')
+            if piece:
+                parts.append(piece)
+        return "".join(parts)
     
     def _advanced_fallback_analysis(self, message: str, context: List[Dict]) -> Tuple[str, float, Dict]:
         """進階備用分析方案（無 API 時）"""
         message_lower = message.lower()
-        
-        # 分析各個代理人的匹配度
-        scores = {}
-        
-        # SmartRecommendation - 推薦相關
-        recommendation_score = 0
-        if any(word in message_lower for word in ['買', '推薦', '建議', '想要', '需要', '選', '哪個', '什麼', '好']):
-            recommendation_score += 0.5
-        if any(word in message_lower for word in ['滑鼠', '鍵盤', '耳機', '手機', '筆電', '平板']):
-            recommendation_score += 0.3
+
+        # 單趟掃描關鍵字表，命中組以位元遮罩累積，最後一次 tally
+        hit_mask = 0
+        for keyword, owner_mask in _KEYWORD_OWNER_MASK.items():
+            if keyword in message_lower:
+                hit_mask |= owner_mask
+
+        scores = {
+            'SmartRecommendation': 0,
+            'PriceTracker': 0,
+            'ProductReview': 0,
+            'Finance': 0,
+            'Gmail': 0,
+        }
+        for idx, (agent_name, weight) in enumerate(_FALLBACK_GROUPS):
+            if hit_mask & (1 << idx):
+                scores[agent_name] += weight
+
+        # 問句傾向推薦
         if '?' in message or '？' in message or '嗎' in message:
-            recommendation_score += 0.2
-        scores['SmartRecommendation'] = recommendation_score
-        
-        # PriceTracker - 價格相關
-        price_score = 0
-        if any(word in message_lower for word in ['價格', '多少錢', '追蹤', '降價', '便宜', '特價']):
-            price_score += 0.7
-        if any(word in message_lower for word in ['通知', '提醒', '目標價']):
-            price_score += 0.3
-        scores['PriceTracker'] = price_score
-        
-        # ProductReview - 評價相關
-        review_score = 0
-        if any(word in message_lower for word in ['評價', '評論', '好不好', '好用', '值得', '怎麼樣']):
-            review_score += 0.7
-        if any(word in message_lower for word in ['優點', '缺點', '心得', '體驗']):
-            review_score += 0.3
-        scores['ProductReview'] = review_score
-        
-        # Finance - 財務相關
-        finance_score = 0
-        if any(word in message_lower for word in ['記帳', '記錄', '花費', '花了', '消費', '支出']):
-            finance_score += 0.7
-        if any(word in message_lower for word in ['預算', '統計', '這個月', '本月', '今天']):
-            finance_score += 0.3
-        scores['Finance'] = finance_score
-        
-        # Gmail - 郵件相關
-        gmail_score = 0
-        if any(word in message_lower for word in ['gmail', 'mail', '郵件', '信件', 'email']):
-            gmail_score += 0.8
-        if any(word in message_lower for word in ['連接', '連結', '授權', '同步']):
-            gmail_score += 0.2
-        scores['Gmail'] = gmail_score
-        
-        # 選擇最高分的代理人
-        if max(scores.values()) == 0:
+            scores['SmartRecommendation'] += 0.2
+
+        # 選擇最高分的代理人（單趟 argmax）
+        best_agent, best_score = max(scores.items(), key=lambda kv: kv[1])
+        if best_score == 0:
             # 沒有明確匹配，預設推薦
             best_agent = 'SmartRecommendation'
             confidence = 0.3
         else:
-            best_agent = max(scores, key=scores.get)
-            confidence = min(scores[best_agent], 0.9)
+            confidence = min(best_score, 0.9)
         
-        # 構建分析結果
+        # 構建分析結果（沿用已計算好的 message_lower，避免重複轉小寫）
         analysis = {
-            "intent": self._guess_intent(message),
-            "keywords": self._extract_keywords(message),
+            "intent": self._guess_intent(message, message_lower),
+            "keywords": self._extract_keywords(message, message_lower),
             "context": "基於規則分析",
             "reasoning": f"匹配度最高的功能是{best_agent}"
         }
         
         return best_agent, confidence, analysis
     
-    def _guess_intent(self, message: str) -> str:
+    def _guess_intent(self, message: str, message_lower: Optional[str] = None) -> str:
         """猜測用戶意圖"""
-        message_lower = message.lower()
-        
+        if message_lower is None:
+            message_lower = message.lower()
+
         if '買' in message_lower or '推薦' in message_lower:
             return "尋求產品推薦"
         elif '價格' in message_lower or '多少錢' in message_lower:
@@ -346,11 +575,12 @@ class AIIntentAnalyzer:
         else:
             return "一般諮詢"
     
-    def _extract_keywords(self, message: str) -> List[str]:
+    def _extract_keywords(self, message: str, message_lower: Optional[str] = None) -> List[str]:
         """提取關鍵詞"""
         keywords = []
-        message_lower = message.lower()
-        
+        if message_lower is None:
+            message_lower = message.lower()
+
         # 產品關鍵詞
         products = ['滑鼠', '鍵盤', '耳機', '手機', '筆電', '平板', 'iphone', 'airpods']
         for product in products:
@@ -367,28 +597,90 @@ class AIIntentAnalyzer:
     
     def _get_user_context(self, user_id: str) -> List[Dict]:
         """獲取用戶對話歷史"""
-        if user_id and user_id in self.conversation_history:
-            return self.conversation_history[user_id]
+        if not user_id:
+            return []
+
+        if self.redis is not None:
+            try:
+                entries = self.redis.lrange(f"conv:{user_id}", 0, -1)
+                # LPUSH 後最新在前，反轉回時間順序
+                return [_json_loads(e) for e in reversed(entries)]
+            except Exception as e:
+                logger.warning(f"讀取 Redis 對話歷史失敗: {e}")
+                return []
+
+        if user_id in self.conversation_history:
+            self.conversation_history.move_to_end(user_id)
+            return list(self.conversation_history[user_id])
         return []
-    
+
     def _update_conversation_history(self, user_id: str, message: str, agent: str):
         """更新對話歷史"""
         if not user_id:
             return
-        
-        if user_id not in self.conversation_history:
-            self.conversation_history[user_id] = []
-        
-        self.conversation_history[user_id].append({
-            "timestamp": datetime.now().isoformat(),
+
+        # 時間戳只供除錯，存 float 即可；要 ISO 字串時
+        # 再用 datetime.fromtimestamp(entry["ts"]).isoformat() 還原
+        entry = {
+            "ts": time.time(),
             "message": message,
             "agent": agent
-        })
-        
-        # 只保留最近10條記錄
-        if len(self.conversation_history[user_id]) > 10:
-            self.conversation_history[user_id] = self.conversation_history[user_id][-10:]
+        }
+
+        if self.redis is not None:
+            try:
+                key = f"conv:{user_id}"
+                pipe = self.redis.pipeline()
+                pipe.lpush(key, _json_dumps(entry))
+                pipe.ltrim(key, 0, 9)  # 只保留最近 10 條
+                pipe.expire(key, self._history_ttl)
+                pipe.execute()
+                return
+            except Exception as e:
+                logger.warning(f"寫入 Redis 對話歷史失敗: {e}")
+                # 落回行程內儲存
+
+        history = self.conversation_history.get(user_id)
+        if history is None:
+            # deque(maxlen=10) 自動淘汰最舊記錄，免去手動切片
+            history = self.conversation_history[user_id] = deque(maxlen=10)
+        self.conversation_history.move_to_end(user_id)
+
+        history.append(entry)
+
+        # 淘汰最久未活動的用戶，避免長期執行下記憶體無上限成長
+        if len(self.conversation_history) > self._history_max_users:
+            self.conversation_history.popitem(last=False)
     
+    def analyze_intent_batch(self, items: List[Tuple[str, List[Dict]]]) -> Optional[List[Tuple[str, float, Dict]]]:
+        """一次呼叫 OpenAI 分類多則訊息，攤平 HTTP 與 system prompt 的開銷"""
+        numbered = "\n".join(
+            f"{i + 1}. \"{message}\"" for i, (message, _context) in enumerate(items)
+        )
+        prompt = f"以下有 {len(items)} 則獨立的用戶訊息：\n{numbered}"
+        # 批次版 system prompt 定義 results 陣列的回應格式，
+        # token 預算按訊息數放大，避免多筆 JSON 被 60 token 上限截斷
+        result = self._call_openai(
+            prompt,
+            system_prompt=self._system_prompt_batch,
+            cache_key="intent_batch_v1",
+            max_tokens=60 * len(items)
+        )
+        if not result:
+            return None
+        results = result.get("results")
+        if not isinstance(results, list) or len(results) != len(items):
+            logger.error(f"批次意圖分析回應格式不符: 預期 {len(items)} 筆")
+            return None
+        return [
+            (
+                item.get("agent", "SmartRecommendation"),
+                item.get("confidence", 0.5),
+                item.get("analysis", {})
+            )
+            for item in results
+        ]
+
     def get_agent_suggestion(self, agent_name: str) -> str:
         """獲取代理人的使用建議"""
         if agent_name in self.agents_capabilities:
@@ -397,5 +689,77 @@ class AIIntentAnalyzer:
         return ""
 
 
+class BatchingIntentAnalyzer:
+    """微批次意圖分析器
+
+    把 50ms 視窗內到達的分類請求合併成一次 OpenAI 呼叫，
+    高流量時 N 次握手與 N 份 system prompt 攤平成 1 次。
+    介面與 AIIntentAnalyzer.analyze_intent 相同，可直接替換。
+    """
+
+    def __init__(self, analyzer: Optional[AIIntentAnalyzer] = None,
+                 window: float = 0.05, max_batch: int = 8):
+        self.analyzer = analyzer or AIIntentAnalyzer()
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(
+            target=self._flush_loop, name="intent-batcher", daemon=True
+        )
+        self._worker.start()
+
+    def analyze_intent(self, message: str, user_id: Optional[str] = None) -> Tuple[str, float, Dict]:
+        """排入批次佇列並等待結果；失敗時退回本地備用分析"""
+        context = self.analyzer._get_user_context(user_id) if user_id else []
+
+        if not self.analyzer.api_key:
+            return self.analyzer._advanced_fallback_analysis(message, context)
+
+        future = Future()
+        self._queue.put((future, message, context))
+        try:
+            agent, confidence, analysis = future.result(timeout=15)
+        except Exception as e:
+            logger.error(f"批次意圖分析失敗: {e}")
+            return self.analyzer._advanced_fallback_analysis(message, context)
+
+        if user_id:
+            self.analyzer._update_conversation_history(user_id, message, agent)
+        return agent, confidence, analysis
+
+    def _flush_loop(self):
+        """背景工作執行緒：湊滿 max_batch 或視窗到期即送出一批"""
+        while True:
+            batch = [self._queue.get()]  # 阻塞等第一筆
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch):
+        """送出一批並把結果分派回各自的 future"""
+        try:
+            results = self.analyzer.analyze_intent_batch(
+                [(message, context) for _future, message, context in batch]
+            )
+        except Exception as e:
+            logger.error(f"批次送出失敗: {e}")
+            results = None
+
+        for i, (future, message, context) in enumerate(batch):
+            if results is not None:
+                future.set_result(results[i])
+            else:
+                future.set_result(
+                    self.analyzer._advanced_fallback_analysis(message, context)
+                )
+
+
 # 創建全局實例
 ai_intent_analyzer = AIIntentAnalyzer()
@@ -3,6 +3,7 @@ from abc import ABC, abstractmethod
 from typing import Dict, List, Optional, Any
 import logging
 import os
+import re
 
 # 處理可選套件
 try:
@@ -138,27 +139,100 @@ class AgentRegistry:
     
     def __init__(self):
         self._agents: Dict[str, BaseAgent] = {}
+        self._factories: Dict[str, Any] = {}
+        # 路由關鍵字 -> 代理人名稱集合；所有代理人共用一趟掃描
+        self._keyword_agents: Dict[str, set] = {}
+        self._route_re = None
         self.logger = logging.getLogger('AgentRegistry')
-    
-    def register(self, agent_name: str, agent: BaseAgent):
-        """註冊代理人"""
+
+    def register(self, agent_name: str, agent: BaseAgent,
+                 keywords: Optional[List[str]] = None):
+        """註冊代理人（可附路由關鍵字，參與註冊器的單趟掃描路由）"""
         self._agents[agent_name] = agent
+        if keywords:
+            self._add_keywords(agent_name, keywords)
         self.logger.info(f"註冊代理人: {agent_name}")
-    
+
+    def register_factory(self, agent_name: str, factory,
+                         keywords: Optional[List[str]] = None):
+        """註冊代理人工廠：第一次取用時才建立實例（延遲初始化）
+
+        適合初始化成本高（資料庫連線等）的代理人，
+        讓 import 與 worker 冷啟動不用付這筆成本。
+        """
+        self._factories[agent_name] = factory
+        if keywords:
+            self._add_keywords(agent_name, keywords)
+        self.logger.info(f"註冊代理人工廠: {agent_name}")
+
+    def _add_keywords(self, agent_name: str, keywords: List[str]):
+        """登記路由關鍵字並標記 alternation 待重建"""
+        for kw in keywords:
+            self._keyword_agents.setdefault(kw.lower(), set()).add(agent_name)
+        self._route_re = None
+
+    def route(self, message: str) -> List[str]:
+        """一趟掃描找出可能處理此訊息的代理人名稱
+
+        所有已登記關鍵字合成單一 alternation，取代逐代理人各掃一次
+        can_handle。沒登記關鍵字的代理人仍以 can_handle 保底判斷。
+        """
+        message_lower = message.lower()
+        hits = set()
+
+        if self._keyword_agents:
+            if self._route_re is None:
+                # 長詞在前，重疊關鍵字優先配到較精確的那個
+                kws = sorted(self._keyword_agents, key=len, reverse=True)
+                self._route_re = re.compile(
+                    "|".join(map(re.escape, kws)), re.IGNORECASE
+                )
+            for m in self._route_re.finditer(message_lower):
+                hits.update(self._keyword_agents[m.group(0)])
+
+        # 沒有關鍵字的代理人走原本的 can_handle（只問已實例化者，
+        # 避免為了路由觸發延遲建立）
+        keyword_covered = {
+            name for agents in self._keyword_agents.values() for name in agents
+        }
+        for name, agent in self._agents.items():
+            if name not in keyword_covered and name not in hits:
+                try:
+                    if agent.can_handle(message):
+                        hits.add(name)
+                except Exception:
+                    pass
+
+        return list(hits)
+
     def get_agent(self, agent_name: str) -> Optional[BaseAgent]:
-        """獲取代理人"""
-        return self._agents.get(agent_name)
-    
+        """獲取代理人（必要時由工廠建立）"""
+        agent = self._agents.get(agent_name)
+        if agent is None and agent_name in self._factories:
+            try:
+                agent = self._factories[agent_name]()
+                self._agents[agent_name] = agent
+                self.logger.info(f"延遲建立代理人: {agent_name}")
+            except Exception as e:
+                self.logger.error(f"延遲建立代理人 {agent_name} 失敗: {e}")
+                return None
+        return agent
+
     def list_agents(self) -> List[str]:
-        """列出所有代理人"""
-        return list(self._agents.keys())
-    
+        """列出所有代理人（含尚未實例化的工廠）"""
+        return list({**self._factories, **self._agents})
+
     def get_all_agents_info(self) -> Dict[str, Dict[str, Any]]:
-        """獲取所有代理人資訊"""
-        return {
-            name: agent.get_agent_info() 
-            for name, agent in self._agents.items()
+        """獲取所有代理人資訊（未實例化者只回報狀態，不觸發建立）"""
+        info = {
+            name: {'name': name, 'status': 'lazy'}
+            for name in self._factories if name not in self._agents
         }
+        info.update(
+            (name, agent.get_agent_info())
+            for name, agent in self._agents.items()
+        )
+        return info
 
 # 全域代理人註冊器
 agent_registry = AgentRegistry()
@@ -8,6 +8,24 @@ from utils.database import get_db_manager
 
 logger = logging.getLogger(__name__)
 
+# 備用處理的正則與關鍵字：模組載入時建好，避免每次呼叫重建
+_AMOUNT_RE = re.compile(r'(\d+)')
+_RECORD_KW = frozenset(['記帳', '記錄', '花了', '花費'])
+_FOOD_KW = frozenset(['午餐', '早餐', '晚餐', '吃'])
+_TRANSPORT_KW = frozenset(['交通', '車', '油'])
+_ENTERTAINMENT_KW = frozenset(['娛樂', '電影', '遊戲'])
+_QUERY_KW = frozenset(['多少', '統計', '花費', '支出'])
+
+# can_handle 關鍵字：編譯成單一 regex alternation，一次 C 層掃描取代逐一比對
+_FINANCE_KEYWORD_RE = re.compile(
+    "|".join(map(re.escape, [
+        '財務', '記帳', '支出', '花費', '預算', '超支',
+        '花了多少', '這個月', '本月', '上個月', '上月', '開銷',
+        '省錢', '存錢', '理財', '帳單', '設定預算'
+    ])),
+    re.IGNORECASE
+)
+
 @tool
 def get_financial_summary(user_id: str, question: str) -> str:
     """
@@ -166,14 +184,7 @@ class FinanceAgent(BaseAgent):
     
     def can_handle(self, message: str) -> bool:
         """判斷是否可以處理此訊息"""
-        finance_keywords = [
-            '財務', '記帳', '支出', '花費', '預算', '超支',
-            '花了多少', '這個月', '本月', '上個月', '上月', '開銷',
-            '省錢', '存錢', '理財', '帳單', '設定預算'
-        ]
-        
-        message_lower = message.lower()
-        return any(keyword in message_lower for keyword in finance_keywords)
+        return bool(_FINANCE_KEYWORD_RE.search(message))
     
     def _process_message_internal(self, user_id: str, message: str) -> str:
         """處理用戶訊息"""
@@ -204,20 +215,20 @@ class FinanceAgent(BaseAgent):
         message_lower = message.lower()
         
         # 記帳
-        amount_match = re.search(r'(\d+)', message)
-        if amount_match and any(kw in message_lower for kw in ['記帳', '記錄', '花了', '花費']):
+        amount_match = _AMOUNT_RE.search(message)
+        if amount_match and any(kw in message_lower for kw in _RECORD_KW):
             amount = float(amount_match.group(1))
             category = "其他"
-            if '午餐' in message_lower or '早餐' in message_lower or '晚餐' in message_lower or '吃' in message_lower:
+            if any(kw in message_lower for kw in _FOOD_KW):
                 category = "飲食"
-            elif '交通' in message_lower or '車' in message_lower or '油' in message_lower:
+            elif any(kw in message_lower for kw in _TRANSPORT_KW):
                 category = "交通"
-            elif '娛樂' in message_lower or '電影' in message_lower or '遊戲' in message_lower:
+            elif any(kw in message_lower for kw in _ENTERTAINMENT_KW):
                 category = "娛樂"
             return add_expense(user_id, amount, category, "")
-        
+
         # 查詢
-        if any(kw in message_lower for kw in ['多少', '統計', '花費', '支出']):
+        if any(kw in message_lower for kw in _QUERY_KW):
             return get_financial_summary(user_id, message)
         
         # 設定預算
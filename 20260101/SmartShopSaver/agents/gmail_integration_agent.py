@@ -1,4 +1,5 @@
 import os
+import re
 import logging
 from typing import Dict
 from pathlib import Path
@@ -7,6 +8,36 @@ from .base_agent import BaseAgent, agent_registry
 
 logger = logging.getLogger(__name__)
 
+# can_handle 關鍵字：編譯成單一 regex alternation，一次 C 層掃描取代逐一比對
+_GMAIL_KEYWORD_RE = re.compile(
+    "|".join(map(re.escape, [
+        'gmail', 'mail', '郵件', 'email', '連接', '授權', '綁定',
+        '信件', '購物郵件', 'google'
+    ])),
+    re.IGNORECASE
+)
+
+# LINE UID 格式（U + 32 位十六進位），符合者本身就是 URL-safe，免 quote
+_LINE_UID_RE = re.compile(r'^U[0-9a-f]{32}$')
+
+# 連接回應模板：只有 {oauth_url} 會變動，避免每次重組多行字串
+_CONNECTION_TEMPLATE = """📧 **Gmail 連接設定**
+
+🔗 [點我登入 Gmail]({oauth_url})
+
+請在瀏覽器中開啟上方連結完成 Google 授權。
+
+✅ 授權後可使用：
+• 自動同步購物郵件
+• 消費分析與報表
+• AI 自動分類與記帳整合
+
+🔒 **安全保證**
+• 僅讀取購物郵件
+• 不會修改或刪除內容
+• 可隨時取消授權
+"""
+
 class GmailIntegrationAgent(BaseAgent):
     """Gmail 整合代理人 - 管理 Gmail 授權與郵件同步"""
 
@@ -20,7 +51,18 @@ class GmailIntegrationAgent(BaseAgent):
         else:
             self.public_base_url = self.public_base_url.rstrip("/")
 
+        # OAuth URL 前綴固定，預先拼好
+        self._oauth_prefix = (
+            f"{self.public_base_url}/google/start?uid=" if self.public_base_url else ""
+        )
+
         logger.info(f"Gmail 整合代理人初始化完成，base_url={self.public_base_url}")
+
+    def _build_oauth_url(self, user_id: str) -> str:
+        """組出 OAuth 連結；標準 LINE UID 不需 percent-encoding"""
+        if _LINE_UID_RE.match(user_id):
+            return self._oauth_prefix + user_id
+        return self._oauth_prefix + quote(user_id)
     
     def get_tools(self):
         return []
@@ -33,8 +75,7 @@ class GmailIntegrationAgent(BaseAgent):
 
     def can_handle(self, message: str) -> bool:
         """判斷是否可處理 Gmail 相關訊息"""
-        keywords = ['gmail', 'mail', '郵件', 'email', '連接', '授權', '綁定', '信件', '購物郵件', 'google']
-        return any(k in message.lower() for k in keywords)
+        return bool(_GMAIL_KEYWORD_RE.search(message))
 
     def _process_message_internal(self, user_id: str, message: str) -> str:
         """內部訊息處理"""
@@ -58,25 +99,7 @@ class GmailIntegrationAgent(BaseAgent):
         if not self.public_base_url:
             return "❌ 系統未設定 PUBLIC_BASE_URL，請先於 .env 檔設定公開網址。"
 
-        encoded_uid = quote(user_id)
-        oauth_url = f"{self.public_base_url}/google/start?uid={encoded_uid}"
-
-        return f"""📧 **Gmail 連接設定**
-
-🔗 [點我登入 Gmail]({oauth_url})
-
-請在瀏覽器中開啟上方連結完成 Google 授權。
-
-✅ 授權後可使用：
-• 自動同步購物郵件  
-• 消費分析與報表  
-• AI 自動分類與記帳整合  
-
-🔒 **安全保證**
-• 僅讀取購物郵件  
-• 不會修改或刪除內容  
-• 可隨時取消授權
-"""
+        return _CONNECTION_TEMPLATE.format(oauth_url=self._build_oauth_url(user_id))
 
     def _handle_view_emails(self, user_id: str) -> str:
         """查看郵件記錄"""
@@ -132,11 +155,9 @@ class GmailIntegrationAgent(BaseAgent):
 """
 
         if self.public_base_url and user_id:
-            encoded_uid = quote(user_id)
-            oauth_url = f"{self.public_base_url}/google/start?uid={encoded_uid}"
-            base_text += f"\n\n🔗 [點我登入 Gmail]({oauth_url})"
+            base_text += f"\n\n🔗 [點我登入 Gmail]({self._build_oauth_url(user_id)})"
         elif self.public_base_url:
-            base_text += f"\n\n🔗 [點我登入 Gmail]({self.public_base_url}/google/start?uid={{你的LINE_UID}})"
+            base_text += f"\n\n🔗 [點我登入 Gmail]({self._oauth_prefix}{{你的LINE_UID}})"
         else:
             base_text += "\n\n⚠️ 尚未設定 PUBLIC_BASE_URL，登入連結無法生成。"
 
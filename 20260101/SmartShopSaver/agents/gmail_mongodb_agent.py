@@ -5,15 +5,20 @@ Gmail 整合代理人 - MongoDB 版本
 """
 
 import os
-import sys
+import re
 import logging
 from pathlib import Path
 from typing import Dict, List, Optional, Any
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
-# 加入路徑
-current_dir = Path(__file__).parent.parent.resolve()
-sys.path.insert(0, str(current_dir))
+try:
+    from zoneinfo import ZoneInfo
+    _TZ = ZoneInfo("Asia/Taipei")
+except Exception:
+    _TZ = timezone(timedelta(hours=8))
+
+# 路徑由進入點（app.py / start.py）設定一次，
+# 這裡不再 resolve + 改 sys.path，避免每次匯入多付 syscall 也防止路徑重複累積
 
 logger = logging.getLogger(__name__)
 
@@ -27,7 +32,8 @@ try:
         start_google_oauth,
         finish_google_oauth,
         has_token,
-        build_gmail_service
+        build_gmail_service,
+        start_token_refresh_worker
     )
     GMAIL_UTILS_AVAILABLE = True
 except ImportError as e:
@@ -49,6 +55,42 @@ except ImportError as e:
 
 from agents.base_agent import BaseAgent, agent_registry
 
+# can_handle 關鍵字：單一 regex alternation，一次 C 層掃描
+_GMAIL_KW_RE = re.compile(
+    "|".join(map(re.escape, [
+        "gmail", "郵件", "email", "信件", "收據", "發票",
+        "自動記帳", "購物記錄", "消費記錄", "掃描郵件",
+        "支出", "統計", "報表", "消費統計", "消費查詢"
+    ])),
+    re.IGNORECASE
+)
+
+# 路由關鍵字：一趟掃描取出類別 token，取代逐一 in 比對
+# 順序即優先序（先匹配到的字在訊息裡最靠前，dispatch 表決定處理器）
+_ROUTER_RE = re.compile(
+    "(連結|授權|掃描|同步|查詢|查看|記錄|統計|分析|報表|支出|消費)"
+)
+
+# 掃描天數解析：一趟 regex 同時抓數字天數與「週/月」同義詞，
+# 取代逐一 substring 比對（也避免「第7天30分鐘」這類誤判）
+_DAYS_RE = re.compile(r"(\d+)\s*(?:天|day)|(週|周)|(月|month)", re.IGNORECASE)
+
+# token -> (優先序, 處理器名稱)；優先序沿用原本 if/elif 的判斷順序
+_ROUTE_HANDLERS = {
+    "連結": (0, "_handle_oauth"),
+    "授權": (0, "_handle_oauth"),
+    "掃描": (1, "_handle_scan"),
+    "同步": (1, "_handle_scan"),
+    "查詢": (2, "_handle_query"),
+    "查看": (2, "_handle_query"),
+    "記錄": (2, "_handle_query"),
+    "統計": (3, "_handle_stats"),
+    "分析": (3, "_handle_stats"),
+    "報表": (3, "_handle_stats"),
+    "支出": (4, "_handle_expense"),
+    "消費": (4, "_handle_expense"),
+}
+
 
 class GmailIntegrationAgent(BaseAgent):
     """Gmail 整合代理人 - 統整所有子代理人功能"""
@@ -88,6 +130,13 @@ class GmailIntegrationAgent(BaseAgent):
         else:
             self.public_base_url = self.public_base_url.rstrip("/")
         
+        # 背景刷新快過期的 token，讓掃描回覆不用等 refresh 往返
+        if GMAIL_UTILS_AVAILABLE:
+            try:
+                start_token_refresh_worker()
+            except Exception as e:
+                logger.warning(f"啟動 token 刷新執行緒失敗: {e}")
+
         logger.info("Gmail 整合代理人初始化完成")
     
     def get_tools(self) -> List:
@@ -107,39 +156,32 @@ class GmailIntegrationAgent(BaseAgent):
     
     def can_handle(self, message: str) -> bool:
         """判斷是否可以處理此訊息"""
-        gmail_keywords = [
-            "gmail", "郵件", "email", "信件", "收據", "發票",
-            "自動記帳", "購物記錄", "消費記錄", "掃描郵件",
-            "支出", "統計", "報表", "消費統計", "消費查詢"
-        ]
-        return any(kw in message.lower() for kw in gmail_keywords)
-    
+        return bool(_GMAIL_KW_RE.search(message))
+
     def _process_message_internal(self, user_id: str, message: str) -> str:
         """處理訊息 - 路由到適當的子代理人"""
-        
+
         if not self.db_connected:
             return "❌ 資料庫未連接，請檢查 MongoDB 設定"
-        
+
         message_lower = message.lower()
-        
-        # 路由邏輯
-        if "連結" in message_lower or "授權" in message_lower:
-            return self._handle_oauth(user_id)
-        
-        elif "掃描" in message_lower or "同步" in message_lower:
-            return self._handle_scan(user_id, message)
-        
-        elif "查詢" in message_lower or "查看" in message_lower or "記錄" in message_lower:
-            return self._handle_query(user_id, message)
-        
-        elif "統計" in message_lower or "分析" in message_lower or "報表" in message_lower:
-            return self._handle_stats(user_id, message)
-        
-        elif "支出" in message_lower or "消費" in message_lower:
-            return self._handle_expense(user_id, message)
-        
-        else:
+
+        # 路由邏輯：一趟掃描收集命中 token，依原 if/elif 優先序取處理器
+        best = None
+        for match in _ROUTER_RE.finditer(message_lower):
+            rank, handler_name = _ROUTE_HANDLERS[match.group(1)]
+            if best is None or rank < best[0]:
+                best = (rank, handler_name)
+                if rank == 0:
+                    break
+
+        if best is None:
             return self._get_help(user_id)
+
+        handler_name = best[1]
+        if handler_name == "_handle_oauth":
+            return self._handle_oauth(user_id)
+        return getattr(self, handler_name)(user_id, message)
     
     def _handle_oauth(self, user_id: str):
         """處理 OAuth 授權"""
@@ -149,11 +191,11 @@ class GmailIntegrationAgent(BaseAgent):
         if has_token(user_id):
             return "✅ Gmail 已連結！可以開始使用了"
     
-        base_url = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
-        if not base_url:
+        # base_url 已於 __init__ 讀入，避免每次授權都重查環境變數
+        if not self.public_base_url:
             return "❌ 請先在 .env 設定 PUBLIC_BASE_URL"
-    
-        redirect_uri = f"{base_url}/google/callback"
+
+        redirect_uri = f"{self.public_base_url}/google/callback"
     
         try:
             auth_url, _ = start_google_oauth(user_id, redirect_uri)
@@ -177,14 +219,17 @@ class GmailIntegrationAgent(BaseAgent):
         if not has_token(user_id):
             return "❌ 請先連結 Gmail (輸入：連結 Gmail)"
         
-        days = 30
-        if "7" in message or "七" in message or "週" in message:
-            days = 7
-        elif "14" in message:
-            days = 14
-        elif "30" in message or "月" in message:
+        m = _DAYS_RE.search(message)
+        if m:
+            if m.group(1):
+                days = int(m.group(1))
+            elif m.group(2):
+                days = 7
+            else:
+                days = 30
+        else:
             days = 30
-        
+
         try:
             tracker = GmailShoppingTracker(user_id, self.db)
             result = tracker.process_recent_emails(days=days, force=True)
@@ -229,9 +274,11 @@ class GmailIntegrationAgent(BaseAgent):
     def _handle_expense(self, user_id: str, message: str):
         """處理支出"""
         if "gmail" in self.sub_agents:
+            # now 只取一次：兩次 datetime.now() 會產生兩個不同時間戳
+            now = datetime.now(_TZ)
             return self.sub_agents["gmail"].process_emails_in_range(
-                start_date=datetime.now() - timedelta(days=30),
-                end_date=datetime.now(),
+                start_date=now - timedelta(days=30),
+                end_date=now,
                 force=False
             )
         else:
@@ -240,22 +287,24 @@ class GmailIntegrationAgent(BaseAgent):
     def _simple_query(self, user_id: str, message: str):
         """簡單查詢"""
         try:
+            now = datetime.now(_TZ)
             records = self.db.list_shopping_records(
                 user_id,
-                datetime.now() - timedelta(days=7),
-                datetime.now(),
+                now - timedelta(days=7),
+                now,
                 limit=5
             )
             
             if not records:
                 return "📭 最近沒有購物記錄"
             
-            result = "📊 最近的購物記錄：\n\n"
+            # list + join：線性時間組字串，避免 += 反覆重配
+            parts = ["📊 最近的購物記錄：\n\n"]
             for i, record in enumerate(records, 1):
-                result += f"{i}. {record.get('vendor', '未知')}\n"
-                result += f"   💰 NT$ {record.get('amount', 0):,.0f}\n"
-                result += f"   📅 {record.get('email_date', '')}\n\n"
-            return result
+                parts.append(f"{i}. {record.get('vendor', '未知')}\n")
+                parts.append(f"   💰 NT$ {record.get('amount', 0):,.0f}\n")
+                parts.append(f"   📅 {record.get('email_date', '')}\n\n")
+            return "".join(parts)
         except Exception as e:
             logger.error(f"查詢失敗: {e}")
             return "❌ 查詢失敗"
@@ -290,11 +339,28 @@ class GmailIntegrationAgent(BaseAgent):
         return text
 
 
-# 建立並註冊代理人
-gmail_integration_agent = GmailIntegrationAgent()
+# 延遲註冊代理人：第一次被取用時才建立（初始化會連 MongoDB，
+# 放在 import 階段會拖慢 worker 冷啟動）
+class _LazyGmailIntegrationAgent:
+    """模組層級的延遲代理：第一次屬性存取時才建立真正的代理人"""
+
+    _real = None
+
+    def __getattr__(self, name):
+        if self._real is None:
+            type(self)._real = GmailIntegrationAgent()
+        return getattr(self._real, name)
+
+
+gmail_integration_agent = _LazyGmailIntegrationAgent()
 
 try:
-    agent_registry.register("GmailIntegration", gmail_integration_agent)
-    logger.info("✅ Gmail 整合代理人已註冊成功")
+    agent_registry.register_factory(
+        "GmailIntegration", GmailIntegrationAgent,
+        keywords=["gmail", "郵件", "email", "信件", "收據", "發票",
+                  "自動記帳", "購物記錄", "消費記錄", "掃描郵件",
+                  "支出", "統計", "報表", "消費統計", "消費查詢"]
+    )
+    logger.info("✅ Gmail 整合代理人工廠已註冊成功")
 except Exception as e:
     logger.error(f"❌ 註冊 Gmail 整合代理人失敗: {e}")
@@ -9,6 +9,7 @@ expense_agent.py
 """
 
 from __future__ import annotations
+import time
 import calendar
 from datetime import datetime, timezone, timedelta
 from typing import List, Tuple, Dict, Any
@@ -19,10 +20,31 @@ try:
 except Exception:
     _TZ = timezone(timedelta(hours=8))
 
+# 處理可選套件：numpy 可一次算完總和與百分比
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    np = None
+
+
+# 月度統計 TTL 快取：(user_id, "YYYY-MM") -> (格式化結果, 寫入時間)
+# 同一用戶反覆查「統計」時省下整條聚合管線的往返
+_STATS_CACHE: Dict[Tuple[str, str], Tuple[str, float]] = {}
+_STATS_CACHE_TTL = 300.0  # 秒
+
 
-def _month_bounds(dt: datetime) -> Tuple[str, str, int, int]:
+def invalidate_stats(user_id: str):
+    """清除該用戶的統計快取（新增支出後呼叫）"""
+    for key in [k for k in _STATS_CACHE if k[0] == user_id]:
+        _STATS_CACHE.pop(key, None)
+
+
+def _month_bounds(dt: datetime) -> Tuple[str, str, datetime, datetime, int, int]:
     """
-    取得當月 [start, next_start) 與 (year, month)。
+    取得當月 [start, next_start) 的字串與 naive datetime 版本，與 (year, month)。
+    datetime 一併回傳，省去呼叫端用 strptime 重新解析字串。
     """
     year, month = dt.year, dt.month
     start = dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
@@ -30,7 +52,10 @@ def _month_bounds(dt: datetime) -> Tuple[str, str, int, int]:
         next_start = start.replace(year=year + 1, month=1)
     else:
         next_start = start.replace(month=month + 1)
-    return start.strftime("%Y-%m-%d"), next_start.strftime("%Y-%m-%d"), year, month
+    start_naive = start.replace(tzinfo=None)
+    next_naive = next_start.replace(tzinfo=None)
+    return (start.strftime("%Y-%m-%d"), next_start.strftime("%Y-%m-%d"),
+            start_naive, next_naive, year, month)
 
 
 def _format_monthly_stats(stats: List[Dict], year: int, month: int) -> str:
@@ -38,18 +63,28 @@ def _format_monthly_stats(stats: List[Dict], year: int, month: int) -> str:
     if not stats:
         return f"📊 {year}年{month}月 支出摘要：\n\n尚無消費記錄。"
 
-    total = sum((s.get('total', 0) or 0) for s in stats)
+    if NUMPY_AVAILABLE:
+        # 向量化：總和與百分比在一次 numpy 運算中算完
+        amounts = np.fromiter(
+            ((s.get('total', 0) or 0) for s in stats),
+            dtype=np.float64, count=len(stats)
+        )
+        total = amounts.sum()
+        pcts = amounts * 100.0 / total if total else np.zeros_like(amounts)
+    else:
+        amounts = [(s.get('total', 0) or 0) for s in stats]
+        total = sum(amounts)
+        pcts = [(a / total * 100) if total else 0.0 for a in amounts]
+
     lines = [f"📊 {year}年{month}月 支出摘要："]
     lines.append(f"總支出: {int(total):,} 元")
     lines.append("")
     lines.append("各類別支出:")
 
-    for stat in stats:
+    for stat, amount, pct in zip(stats, amounts, pcts):
         name = stat.get('_id', '其他') or '其他'
-        amount = stat.get('total', 0) or 0
-        pct = (amount / total * 100) if total else 0.0
         lines.append(f"• {name}: {int(amount):,} 元 ({pct:.0f}%)")
-    
+
     return "\n".join(lines)
 
 
@@ -62,8 +97,13 @@ def category_stats_30d(user_id: str, db=None) -> str:
         db: 資料庫管理器實例（可選）
     """
     now = datetime.now(_TZ)
-    start_s, next_start_s, year, month = _month_bounds(now)
-    
+    start_s, next_start_s, start_dt, next_dt, year, month = _month_bounds(now)
+
+    cache_key = (user_id, f"{year}-{month:02d}")
+    cached = _STATS_CACHE.get(cache_key)
+    if cached is not None and time.monotonic() - cached[1] < _STATS_CACHE_TTL:
+        return cached[0]
+
     try:
         # 如果沒有傳入 db，嘗試建立連接
         if db is None:
@@ -77,15 +117,17 @@ def category_stats_30d(user_id: str, db=None) -> str:
                     "user_id": user_id,
                     "$or": [
                         {"occurred_at": {"$gte": start_s, "$lt": next_start_s}},
-                        {"created_at": {"$gte": datetime.strptime(start_s, "%Y-%m-%d"), 
-                                       "$lt": datetime.strptime(next_start_s, "%Y-%m-%d")}}
+                        {"created_at": {"$gte": start_dt, "$lt": next_dt}}
                     ]
                 }
             },
             {
                 "$group": {
                     "_id": {"$ifNull": ["$category", "其他"]},
-                    "total": {"$sum": "$amount"},
+                    # 主管理器以 Decimal128 存 amount；$toDouble 讓混存的
+                    # float/Decimal128 都以 double 相加，回到 Python 端
+                    # 才不會拿到 numpy/sum 吃不下的 bson.Decimal128
+                    "total": {"$sum": {"$toDouble": {"$ifNull": ["$amount", 0]}}},
                     "count": {"$sum": 1}
                 }
             },
@@ -93,8 +135,10 @@ def category_stats_30d(user_id: str, db=None) -> str:
         ]
         
         stats = list(db.expenses.aggregate(pipeline))
-        return _format_monthly_stats(stats, year, month)
-        
+        formatted = _format_monthly_stats(stats, year, month)
+        _STATS_CACHE[cache_key] = (formatted, time.monotonic())
+        return formatted
+
     except Exception as e:
         return f"❌ 產生統計時發生錯誤：{e}"
 
@@ -17,17 +17,45 @@ try:
 except Exception:
     _TZ = timezone(timedelta(hours=8))
 
+# 處理可選套件：大量結果時用 pandas 向量化聚合
+try:
+    import pandas as pd
+    PANDAS_AVAILABLE = True
+except ImportError:
+    PANDAS_AVAILABLE = False
+    pd = None
 
-def _call_gpt(prompt: str, max_retries: int = 2, timeout_sec: int = 25) -> Optional[str]:
-    """簡易 GPT 呼叫"""
-    try:
+# 小結果集走 Python 路徑反而較快，超過此筆數才建 DataFrame
+_PANDAS_MIN_ROWS = 50
+
+# 超大結果集改走 factorize + bincount 的純數值核心
+_NUMPY_KERNEL_MIN_ROWS = 5000
+
+
+# 模組層共用的 OpenAI client：連線池跨呼叫重用，省掉每次 TLS 握手
+_OAI_CLIENT = None
+
+
+def _get_openai_client():
+    """延遲建立並快取 OpenAI client；沒有 API key 時回傳 None"""
+    global _OAI_CLIENT
+    if _OAI_CLIENT is None:
         import openai
-        
+
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             return None
-        
-        client = openai.OpenAI(api_key=api_key)
+        _OAI_CLIENT = openai.OpenAI(api_key=api_key)
+    return _OAI_CLIENT
+
+
+def _call_gpt(prompt: str, max_retries: int = 2, timeout_sec: int = 25) -> Optional[str]:
+    """簡易 GPT 呼叫"""
+    try:
+        client = _get_openai_client()
+        if client is None:
+            return None
+
         response = client.chat.completions.create(
             model=os.getenv("GPT_MODEL", "gpt-4o-mini"),
             messages=[{"role": "user", "content": prompt}],
@@ -56,29 +84,67 @@ def _search_records_db(
     end_dt = datetime.now(_TZ)
     end_s = end_dt.strftime("%Y-%m-%d")
     
-    # MongoDB 正則搜尋
-    regex_pattern = {"$regex": keyword, "$options": "i"}
-    
-    query = {
-        "user_id": user_id,
-        "$or": [
-            {"subject": regex_pattern},
-            {"vendor": regex_pattern},
-            {"description": regex_pattern},
-            {"snippet": regex_pattern}
-        ]
-    }
-    
     # 嘗試使用 shopping_records 集合
     collection = getattr(db, 'shopping_records', None)
     if collection is None and hasattr(db, 'db'):
         collection = db.db.shopping_records
-    
+
     if collection is None:
         return []
-    
-    cursor = collection.find(query).sort("email_date", -1).limit(limit)
-    
+
+    # 只取會用到的欄位，減少傳輸量
+    projection = {
+        "vendor": 1, "amount": 1, "category": 1,
+        "email_date": 1, "subject": 1, "snippet": 1
+    }
+
+    # 優先走 $text 搜尋（吃文字索引，IXSCAN）；
+    # 沒有索引或查無結果時退回原本的 $or regex（COLLSCAN 保底）
+    cursor = None
+    try:
+        text_query = {"user_id": user_id, "$text": {"$search": keyword}}
+        docs = list(
+            collection.find(text_query, projection)
+            .sort("email_date", -1).limit(limit).batch_size(min(limit, 100))
+        )
+        if docs:
+            cursor = docs
+    except Exception:
+        cursor = None
+
+    if cursor is None:
+        # 次選：search_blob（攝入時預組好的小寫欄位），單一 regex 取代四欄 $or
+        try:
+            blob_query = {
+                "user_id": user_id,
+                "search_blob": {"$regex": re.escape(keyword.lower())}
+            }
+            docs = list(
+                collection.find(blob_query, projection)
+                .sort("email_date", -1).limit(limit).batch_size(min(limit, 100))
+            )
+            if docs:
+                cursor = docs
+        except Exception:
+            cursor = None
+
+    if cursor is None:
+        # 舊資料沒有 search_blob 欄位，保底仍走原本的多欄 $or regex
+        regex_pattern = {"$regex": keyword, "$options": "i"}
+        query = {
+            "user_id": user_id,
+            "$or": [
+                {"subject": regex_pattern},
+                {"vendor": regex_pattern},
+                {"description": regex_pattern},
+                {"snippet": regex_pattern}
+            ]
+        }
+        cursor = (
+            collection.find(query, projection)
+            .sort("email_date", -1).limit(limit).batch_size(min(limit, 100))
+        )
+
     rows = []
     for r in cursor:
         d = r.get("email_date", "")
@@ -89,14 +155,15 @@ def _search_records_db(
         else:
             d_str = ""
         
+        # 解碼時就截斷長字串，之後的 GPT prompt 與摘要不再重切
         rows.append({
             "record_id": str(r.get("_id", "")),
-            "vendor": r.get("vendor", ""),
+            "vendor": (r.get("vendor") or "")[:80],
             "amount": float(r.get("amount", 0) or 0),
             "category": r.get("category", "其他"),
             "date": d_str,
-            "subject": r.get("subject", ""),
-            "snippet": r.get("snippet", ""),
+            "subject": (r.get("subject") or "")[:120],
+            "snippet": (r.get("snippet") or "")[:80],
         })
     
     return rows
@@ -107,17 +174,12 @@ def _gpt_summary(keyword: str, rows: List[Dict]) -> Optional[str]:
     if not rows:
         return f"🔎 找不到與「{keyword}」相關的已記錄消費（近 12 個月）。"
     
+    # 欄位已在查詢時投影並截斷，直接取前 200 筆，不再複製重組
     compact = [
-        {
-            "date": r["date"],
-            "vendor": r["vendor"][:80],
-            "amount": r["amount"],
-            "category": r["category"],
-            "subject": (r["subject"] or "")[:120],
-        }
+        {k: r[k] for k in ("date", "vendor", "amount", "category", "subject")}
         for r in rows[:200]
     ]
-    
+
     prompt = (
         "你是消費分析助手。以下是使用者在資料庫中，"
         "近 12 個月與某個關鍵字相關的紀錄（JSON 陣列）。"
@@ -135,20 +197,56 @@ def _gpt_summary(keyword: str, rows: List[Dict]) -> Optional[str]:
     return _call_gpt(prompt, max_retries=2, timeout_sec=25)
 
 
+def _top5_grouped(keys: List[str], amounts) -> List[tuple]:
+    """以 factorize + bincount 做分組求和，argpartition 取金額前 5 名"""
+    import numpy as np
+
+    codes, uniques = pd.factorize(keys, sort=False)
+    sums = np.bincount(codes, weights=amounts, minlength=len(uniques))
+    k = min(5, len(uniques))
+    top_idx = np.argpartition(-sums, k - 1)[:k]
+    top_idx = top_idx[np.argsort(-sums[top_idx], kind="stable")]
+    return [(uniques[i], float(sums[i])) for i in top_idx]
+
+
 def _fallback_summary(keyword: str, rows: List[Dict]) -> str:
     """GPT 不可用時的保底摘要"""
     if not rows:
         return f"🔎 找不到與「{keyword}」相關的已記錄消費（近 12 個月）。"
     
-    total = sum(r["amount"] for r in rows)
-    by_vendor = defaultdict(float)
-    by_cat = defaultdict(float)
-    for r in rows:
-        by_vendor[r["vendor"]] += r["amount"]
-        by_cat[r["category"]] += r["amount"]
-    
-    top_vendors = sorted(by_vendor.items(), key=lambda x: (-x[1], x[0]))[:5]
-    top_cats = sorted(by_cat.items(), key=lambda x: (-x[1], x[0]))[:5]
+    if PANDAS_AVAILABLE and len(rows) >= _NUMPY_KERNEL_MIN_ROWS:
+        # 超大結果集：factorize 編碼 + bincount 分組求和 + argpartition 取前 5，
+        # 整段都是 O(N) 的 C 核心，不經過 groupby 的排序
+        import numpy as np
+
+        amounts = np.fromiter((r["amount"] for r in rows), np.float64, count=len(rows))
+        total = float(amounts.sum())
+        top_vendors = _top5_grouped([r["vendor"] for r in rows], amounts)
+        top_cats = _top5_grouped([r["category"] for r in rows], amounts)
+    elif PANDAS_AVAILABLE and len(rows) >= _PANDAS_MIN_ROWS:
+        # 大結果集：聚合下沉到 pandas 的向量化 C 路徑
+        df = pd.DataFrame(rows, columns=["vendor", "amount", "category"])
+        total = float(df["amount"].sum())
+        top_vendors = [
+            (v, amt) for v, amt in
+            df.groupby("vendor")["amount"].sum()
+              .sort_values(ascending=False).head(5).items()
+        ]
+        top_cats = [
+            (c, amt) for c, amt in
+            df.groupby("category")["amount"].sum()
+              .sort_values(ascending=False).head(5).items()
+        ]
+    else:
+        total = sum(r["amount"] for r in rows)
+        by_vendor = defaultdict(float)
+        by_cat = defaultdict(float)
+        for r in rows:
+            by_vendor[r["vendor"]] += r["amount"]
+            by_cat[r["category"]] += r["amount"]
+
+        top_vendors = sorted(by_vendor.items(), key=lambda x: (-x[1], x[0]))[:5]
+        top_cats = sorted(by_cat.items(), key=lambda x: (-x[1], x[0]))[:5]
     
     lines = [
         f"🔎 關鍵字「{keyword}」的消費查詢（近 12 個月）",
@@ -2,14 +2,25 @@
 # -*- coding: utf-8 -*-
 """多平台商品搜尋模組"""
 
+import heapq
 import logging
 import requests
 import urllib.parse
 from typing import Dict, List, Optional
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger(__name__)
 
+# 共用 Session：連線池 + keep-alive，各平台呼叫免重複 TLS 握手
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20)
+_session.mount("https://", _adapter)
+_session.mount("http://", _adapter)
+
+# 常駐執行緒池：避免每次搜尋都建立/銷毀 ThreadPoolExecutor
+_EXECUTOR = ThreadPoolExecutor(max_workers=3, thread_name_prefix="platform-search")
+
 
 def search_pchome(keyword: str, limit: int = 10) -> List[Dict]:
     """搜尋 PChome 24h"""
@@ -17,7 +28,7 @@ def search_pchome(keyword: str, limit: int = 10) -> List[Dict]:
         encoded = urllib.parse.quote(keyword)
         url = f"https://ecshweb.pchome.com.tw/search/v3.3/all/results?q={encoded}&page=1&sort=sale/dc"
         
-        response = requests.get(url, timeout=10)
+        response = _session.get(url, timeout=10)
         if response.status_code == 200:
             data = response.json()
             products = data.get('prods', [])[:limit]
@@ -68,20 +79,19 @@ def search_all_platforms(keyword: str, limit: int = 5) -> Dict[str, List[Dict]]:
         'shopee': []
     }
     
-    with ThreadPoolExecutor(max_workers=3) as executor:
-        futures = {
-            executor.submit(search_pchome, keyword, limit): 'pchome',
-            executor.submit(search_momo, keyword, limit): 'momo',
-            executor.submit(search_shopee, keyword, limit): 'shopee',
-        }
-        
-        for future in as_completed(futures):
-            platform = futures[future]
-            try:
-                results[platform] = future.result()
-            except Exception as e:
-                logger.error(f"{platform} 搜尋失敗: {e}")
-    
+    futures = {
+        _EXECUTOR.submit(search_pchome, keyword, limit): 'pchome',
+        _EXECUTOR.submit(search_momo, keyword, limit): 'momo',
+        _EXECUTOR.submit(search_shopee, keyword, limit): 'shopee',
+    }
+
+    for future in as_completed(futures):
+        platform = futures[future]
+        try:
+            results[platform] = future.result()
+        except Exception as e:
+            logger.error(f"{platform} 搜尋失敗: {e}")
+
     return results
 
 
@@ -103,18 +113,19 @@ def format_multi_platform_response(results: Dict[str, List[Dict]], keyword: str)
     if not all_products:
         return f"❌ 找不到「{keyword}」的商品"
     
-    # 按價格排序
-    all_products.sort(key=lambda x: x.get('price', float('inf')))
-    
-    response = f"🔍 「{keyword}」比價結果\n\n"
-    
-    for i, product in enumerate(all_products[:5], 1):
-        response += f"{i}. {product['name'][:30]}...\n"
-        response += f"   💰 NT${product['price']:,}\n"
-        response += f"   🏪 {product['platform']}\n"
-        response += f"   🔗 {product['url']}\n\n"
-    
+    # 只需要最便宜的 5 筆：nsmallest 是 O(N log 5)，免整串排序
+    top5 = heapq.nsmallest(5, all_products, key=lambda x: x.get('price', float('inf')))
+
+    # list + join：線性時間組字串，避免 += 反覆重配
+    parts = [f"🔍 「{keyword}」比價結果\n\n"]
+
+    for i, product in enumerate(top5, 1):
+        parts.append(f"{i}. {product['name'][:30]}...\n")
+        parts.append(f"   💰 NT${product['price']:,}\n")
+        parts.append(f"   🏪 {product['platform']}\n")
+        parts.append(f"   🔗 {product['url']}\n\n")
+
     if len(all_products) > 5:
-        response += f"📊 共找到 {len(all_products)} 個結果"
-    
-    return response
+        parts.append(f"📊 共找到 {len(all_products)} 個結果")
+
+    return "".join(parts)
@@ -5,13 +5,124 @@
 import logging
 import requests
 import re
+import time
+import threading
 import urllib.parse
+from functools import lru_cache
+from collections import OrderedDict
 from typing import Dict, List, Optional
 from datetime import datetime
+from requests.adapters import HTTPAdapter
 from .base_agent import BaseAgent, agent_registry
 
 logger = logging.getLogger(__name__)
 
+# 處理可選套件：orjson 解析大型 JSON 快上數倍，沒裝則退回 stdlib
+try:
+    import orjson
+
+    def _json_loads(data):
+        return orjson.loads(data)
+except ImportError:
+    import json
+
+    def _json_loads(data):
+        return json.loads(data)
+
+# 共用 Session：連線池 + keep-alive，對 PChome 的重複查詢免重做 TLS 握手
+_SESSION = requests.Session()
+_SESSION.headers["Accept-Encoding"] = "gzip"
+_adapter = HTTPAdapter(pool_connections=10, pool_maxsize=50)
+_SESSION.mount("https://", _adapter)
+_SESSION.mount("http://", _adapter)
+
+# PChome 搜尋結果 TTL 快取：同商品名在多用戶/追蹤更新間重複查詢，
+# 5 分鐘內直接回快取結果，省掉整趟 HTTP 往返（LRU 上限防無限成長）
+_PCHOME_CACHE: "OrderedDict[str, tuple]" = OrderedDict()
+_PCHOME_CACHE_MAX = 1024
+_PCHOME_CACHE_TTL = 300.0  # 秒
+_PCHOME_CACHE_LOCK = threading.Lock()
+
+# 直接映射的熱門槽：hash(key) & 511 取槽位，一次比對就命中，
+# 擋在 TTL 快取前面，省掉鎖與 OrderedDict 探測（追蹤刷新迴圈會狂打同鍵）
+_HOT = [None] * 512  # 每槽 (hash, key, value, ts)
+
+# 意圖關鍵字：單一 alternation 一次掃描，named group 即路由桶
+# （can_handle 與 process_user_request 共用同一趟掃描結果的形式）
+# token 安排留意重疊詞：「目標價格」放在 query 桶才會沿用原本
+# 「價格→查詢」的判斷；「考慮」放短詞讓後面的「清單」仍掃得到
+_INTENT_RE = re.compile(
+    "(?P<remove>移除|刪除|取消)"
+    "|(?P<list>清單|列表)"
+    "|(?P<view>查看)"
+    "|(?P<track>追蹤|監控)"
+    "|(?P<query>查詢|查價|目標價格|價格|多少錢|最低價)"
+    "|(?P<misc>目標價|比價|通知|降價|便宜|特價|折扣|優惠|低於|售價|考慮|想買|猶豫)"
+)
+
+@lru_cache(maxsize=2048)
+def _quote_query(q: str) -> str:
+    """URL 編碼帶記憶化：重複查詢的中文商品名不必每次重新編碼"""
+    return urllib.parse.quote(q)
+
+
+@lru_cache(maxsize=512)
+def _classify(message_lower: str) -> frozenset:
+    """掃一次訊息取出所有命中的意圖桶；結果帶 LRU 快取，
+    can_handle 與 process_user_request 對同一訊息只付一次掃描成本"""
+    return frozenset(
+        m.lastgroup for m in _INTENT_RE.finditer(message_lower)
+    )
+
+
+# 預編譯 regex：模組載入時編一次，熱路徑不再重複查 re 內部快取
+# 目標價格的候選樣式，依原本的嘗試順序排列
+_PRICE_PATTERNS = [re.compile(p) for p in (
+    r'目標價格\s*[::：]?\s*(\d+)',
+    r'目標\s*[::：]?\s*(\d+)',
+    r'價格\s*[::：]?\s*(\d+)',
+    r'(\d{4,})\s*元',
+    r'NT\$?\s*(\d+)',
+    r'\$\s*(\d+)',
+)]
+
+# 商品名稱萃取用：去價格片段、去指令詞、去標點、縮空白
+_PRICE_STRIP_RE = re.compile(r'(目標價格|價格|元|\$|NT\$?)\s*\d+')
+_NOISE_KW_RE = re.compile("|".join(map(re.escape, [
+    '追蹤', '監控', '通知', '降價', '請幫我', '幫我',
+    '查詢', '查價', '移除', '刪除', '取消'
+])))
+_PUNCT_RE = re.compile(r'[，,。.！!？?]')
+_WS_RE = re.compile(r'\s+')
+
+# 幫助訊息是常數，模組載入時建一次
+_HELP_MESSAGE = """📊 **價格追蹤功能說明**
+
+🔍 **查詢價格**
+• 查詢 iPhone 15 價格
+• iPhone 15 多少錢
+
+📌 **追蹤商品**
+• 追蹤 iPhone 15 Pro 目標價格 35000
+• 監控 PS5 目標價格 15000
+
+📋 **查看清單**
+• 我的追蹤清單
+• 查看追蹤列表
+
+🗑️ **移除追蹤**
+• 移除追蹤 iPhone 15
+• 取消全部追蹤
+
+💡 系統會自動監控價格變化並通知您！"""
+
+# 配件過濾：一次 alternation 掃完商品名，取代逐詞 substring 比對
+_EXCLUDE_RE = re.compile("|".join(map(re.escape, [
+    '保護套', '保護殼', '手機殼', '皮套', '充電器', '充電線',
+    '傳輸線', '電池', '行動電源', '耳機套', '支架', '貼膜',
+    '保護貼', '配件', '周邊', '專用', '適用於'
+])))
+
 
 class PriceTrackerAgent(BaseAgent):
     """價格追蹤代理人"""
@@ -25,12 +136,48 @@ class PriceTrackerAgent(BaseAgent):
             self.db = get_db_manager()
             self.db_connected = True
             logger.info("MongoDB 連接成功")
+
+            # 清單/移除查詢走 (user_id, is_active) 複合索引，避免 COLLSCAN；
+            # 移除走 product_name_lc 等值查詢的專用索引
+            try:
+                self.db.db.product_name_tracking.create_index(
+                    [("user_id", 1), ("is_active", 1)]
+                )
+                self.db.db.product_name_tracking.create_index(
+                    [("user_id", 1), ("product_name_lc", 1), ("is_active", 1)]
+                )
+            except Exception as e:
+                logger.warning(f"建立追蹤索引失敗: {e}")
         except Exception as e:
             logger.warning(f"MongoDB 連接失敗: {e}")
             self.db = None
             self.db_connected = False
-        
+
+        # 每用戶的有效追蹤名稱集合：空清單/查無此名的情況在本地判掉，
+        # 不必跑一趟 Mongo（首次使用時才從 DB 載入）
+        self._active_names: Dict[str, set] = {}
+        self._active_names_lock = threading.Lock()
+
         logger.info("價格追蹤代理人初始化完成")
+
+    def _get_active_names(self, user_id: str) -> Optional[set]:
+        """取得該用戶目前追蹤中的商品名稱（小寫）；載入失敗回 None"""
+        with self._active_names_lock:
+            names = self._active_names.get(user_id)
+        if names is not None:
+            return names
+        try:
+            names = {
+                n.lower() for n in self.db.db.product_name_tracking.distinct(
+                    "product_name", {"user_id": user_id, "is_active": True}
+                ) if n
+            }
+        except Exception as e:
+            logger.warning(f"載入追蹤名稱快取失敗: {e}")
+            return None
+        with self._active_names_lock:
+            self._active_names[user_id] = names
+        return names
     
     def get_tools(self) -> List:
         return []
@@ -46,46 +193,39 @@ class PriceTrackerAgent(BaseAgent):
     
     def can_handle(self, message: str) -> bool:
         """判斷是否可以處理此訊息"""
-        price_keywords = [
-            '價格', '多少錢', '比價', '追蹤', '監控', '通知', '降價',
-            '便宜', '特價', '折扣', '優惠', '目標價', '低於', '售價',
-            '加入考慮', '考慮清單', '考慮', '想買', '猶豫',
-            '清單', '列表', '移除', '刪除', '取消', '查詢', '查看', '查價',
-            '最低價'
-        ]
-        
-        message_lower = message.lower()
-        return any(keyword in message_lower for keyword in price_keywords)
-    
+        return bool(_classify(message.strip().lower()))
+
     def _process_message_internal(self, user_id: str, message: str) -> str:
         return self.process_user_request(user_id, message)
-    
+
     def process_user_request(self, user_id: str, message: str) -> str:
         """處理用戶請求"""
         try:
             message_lower = message.strip().lower()
-            
+
+            # 共用 can_handle 已算好的分類結果，再依原 if/elif 優先序分派
+            hits = _classify(message_lower)
+
             # 1. 移除/刪除/取消功能
-            if any(kw in message_lower for kw in ['移除', '刪除', '取消']):
+            if "remove" in hits:
                 return self._handle_remove_tracking(user_id, message)
-            
+
             # 2. 查看清單功能
-            elif any(kw in message_lower for kw in ['清單', '列表']) or \
-                 ('查看' in message_lower and '追蹤' in message_lower):
+            elif "list" in hits or ("view" in hits and "track" in hits):
                 return self._handle_list_request(user_id)
-            
+
             # 3. 追蹤功能
-            elif any(kw in message_lower for kw in ['追蹤', '監控']):
+            elif "track" in hits:
                 return self._handle_track_request(user_id, message)
-            
+
             # 4. 查詢最低價功能
-            elif any(kw in message_lower for kw in ['查詢', '查價', '價格', '多少錢', '最低價']):
+            elif "query" in hits:
                 return self._handle_price_query(user_id, message)
-            
+
             # 5. 預設情況
             else:
                 return self._get_help_message()
-                
+
         except Exception as e:
             logger.error(f"處理請求失敗: {e}")
             return "❌ 系統錯誤，請稍後再試"
@@ -130,34 +270,54 @@ class PriceTrackerAgent(BaseAgent):
         """查看追蹤清單"""
         if not self.db_connected:
             return "❌ 資料庫未連接"
-        
+
+        # 本地就知道清單是空的，不必打 DB
+        names = self._get_active_names(user_id)
+        if names is not None and not names:
+            return "📊 您的追蹤清單目前是空的\n\n💡 輸入：追蹤 [商品名] 目標價格 [金額]"
+
         try:
-            trackings = list(self.db.db.product_name_tracking.find(
-                {"user_id": user_id, "is_active": True}
-            ))
+            # 聚合管線：差額與達標判斷下沉到伺服器算，
+            # 只回傳要顯示的欄位與算好的 diff/met
+            trackings = list(self.db.db.product_name_tracking.aggregate([
+                {"$match": {"user_id": user_id, "is_active": True}},
+                {"$project": {
+                    "_id": 0,
+                    "product_name": 1,
+                    "target_price": 1,
+                    "current_lowest_price": 1,
+                    "diff": {"$subtract": [
+                        "$current_lowest_price", "$target_price"
+                    ]},
+                    "met": {"$lte": [
+                        "$current_lowest_price", "$target_price"
+                    ]},
+                }},
+            ]))
             
             if not trackings:
                 return "📊 您的追蹤清單目前是空的\n\n💡 輸入：追蹤 [商品名] 目標價格 [金額]"
             
-            response = f"📊 **您的追蹤清單** (共 {len(trackings)} 項)\n\n"
-            
+            # list + join：線性時間組字串，避免 += 反覆重配
+            parts = [f"📊 **您的追蹤清單** (共 {len(trackings)} 項)\n\n"]
+
             for i, t in enumerate(trackings, 1):
                 name = t.get('product_name', '商品')
                 target = t.get('target_price', 0)
                 current = t.get('current_lowest_price', 0)
-                
-                response += f"📱 **{i}. {name}**\n"
-                response += f"   🎯 目標: NT${target:,}\n"
-                response += f"   💰 目前: NT${current:,}\n"
-                
-                if current > 0 and current <= target:
-                    response += "   ✅ 已達標！\n"
+
+                parts.append(f"📱 **{i}. {name}**\n")
+                parts.append(f"   🎯 目標: NT${target:,}\n")
+                parts.append(f"   💰 目前: NT${current:,}\n")
+
+                if current > 0 and t.get('met'):
+                    parts.append("   ✅ 已達標！\n")
                 elif current > 0:
-                    response += f"   📈 需降: NT${current - target:,}\n"
-                
-                response += "\n"
-            
-            return response
+                    parts.append(f"   📈 需降: NT${t.get('diff', current - target):,}\n")
+
+                parts.append("\n")
+
+            return "".join(parts)
             
         except Exception as e:
             logger.error(f"查詢清單失敗: {e}")
@@ -174,19 +334,38 @@ class PriceTrackerAgent(BaseAgent):
                     {"user_id": user_id, "is_active": True},
                     {"$set": {"is_active": False}}
                 )
+                with self._active_names_lock:
+                    self._active_names[user_id] = set()
                 return f"✅ 已移除全部 {result.modified_count} 個追蹤項目"
-            
+
             # 提取商品名稱
             product_name = self._extract_product_name(message)
             if not product_name:
                 return "❌ 請指定要移除的商品名稱\n\n範例：移除追蹤 iPhone 15"
-            
+
+            # 名稱快取裡完全對不上就直接回覆，省一趟 DB
+            names = self._get_active_names(user_id)
+            needle = product_name.lower()
+            if names is not None and not any(needle in n for n in names):
+                return f"❌ 找不到「{product_name}」的追蹤記錄"
+
+            # 先走 product_name_lc 等值查詢（可用索引），
+            # 沒中才退回無錨點 regex（舊資料沒有 lc 欄位的保底）
             result = self.db.db.product_name_tracking.update_one(
-                {"user_id": user_id, "product_name": {"$regex": product_name, "$options": "i"}, "is_active": True},
+                {"user_id": user_id, "product_name_lc": needle.strip(),
+                 "is_active": True},
                 {"$set": {"is_active": False}}
             )
-            
+            if result.modified_count == 0:
+                result = self.db.db.product_name_tracking.update_one(
+                    {"user_id": user_id, "product_name": {"$regex": product_name, "$options": "i"}, "is_active": True},
+                    {"$set": {"is_active": False}}
+                )
+
             if result.modified_count > 0:
+                # regex 只移除一筆，名稱快取直接作廢、下次再載
+                with self._active_names_lock:
+                    self._active_names.pop(user_id, None)
                 return f"✅ 已移除「{product_name}」的追蹤"
             else:
                 return f"❌ 找不到「{product_name}」的追蹤記錄"
@@ -199,18 +378,14 @@ class PriceTrackerAgent(BaseAgent):
         """提取產品名稱"""
         try:
             # 移除價格相關的數字
-            price_pattern = r'(目標價格|價格|元|\$|NT\$?)\s*\d+'
-            clean = re.sub(price_pattern, '', message)
-            
-            # 移除關鍵字
-            remove_keywords = ['追蹤', '監控', '通知', '降價', '請幫我', '幫我', 
-                             '查詢', '查價', '移除', '刪除', '取消']
-            for kw in remove_keywords:
-                clean = clean.replace(kw, ' ')
-            
+            clean = _PRICE_STRIP_RE.sub('', message)
+
+            # 移除關鍵字（單一 alternation，一次掃完取代逐詞 replace）
+            clean = _NOISE_KW_RE.sub(' ', clean)
+
             # 移除標點符號和多餘空白
-            clean = re.sub(r'[，,。.！!？?]', ' ', clean)
-            clean = re.sub(r'\s+', ' ', clean).strip()
+            clean = _PUNCT_RE.sub(' ', clean)
+            clean = _WS_RE.sub(' ', clean).strip()
             
             if len(clean) > 2:
                 return clean
@@ -223,17 +398,8 @@ class PriceTrackerAgent(BaseAgent):
     
     def _extract_target_price(self, message: str) -> Optional[float]:
         """提取目標價格"""
-        patterns = [
-            r'目標價格\s*[::：]?\s*(\d+)',
-            r'目標\s*[::：]?\s*(\d+)',
-            r'價格\s*[::：]?\s*(\d+)',
-            r'(\d{4,})\s*元',
-            r'NT\$?\s*(\d+)',
-            r'\$\s*(\d+)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, message)
+        for pattern in _PRICE_PATTERNS:
+            match = pattern.search(message)
             if match:
                 price = float(match.group(1))
                 if price >= 100:
@@ -250,25 +416,32 @@ class PriceTrackerAgent(BaseAgent):
                 return f"❌ 找不到「{product_name}」\n\n💡 建議使用更簡單的關鍵字"
             
             if self.db_connected and self.db:
-                tracking_data = {
-                    "user_id": user_id,
-                    "product_name": product_name,
-                    "actual_product_name": results.get('product_name', ''),
-                    "target_price": target_price,
-                    "current_lowest_price": results.get('min_price', 0),
-                    "lowest_price_platform": results.get('platform', ''),
-                    "lowest_price_url": results.get('url', ''),
-                    "created_at": datetime.now(),
-                    "updated_at": datetime.now(),
-                    "is_active": True
-                }
-                
+                # pipeline 形式的 update：updated_at 用伺服器時間，
+                # created_at 只在首次插入時設定，更新不再覆寫
                 self.db.db.product_name_tracking.update_one(
                     {"user_id": user_id, "product_name": product_name},
-                    {"$set": tracking_data},
+                    [{"$set": {
+                        "user_id": user_id,
+                        "product_name": product_name,
+                        "product_name_lc": product_name.strip().lower(),
+                        "actual_product_name": results.get('product_name', ''),
+                        "target_price": target_price,
+                        "current_lowest_price": results.get('min_price', 0),
+                        "lowest_price_platform": results.get('platform', ''),
+                        "lowest_price_url": results.get('url', ''),
+                        "updated_at": "$$NOW",
+                        "created_at": {"$ifNull": ["$created_at", "$$NOW"]},
+                        "is_active": True
+                    }}],
                     upsert=True
                 )
-                
+
+                # 同步名稱快取（尚未載入過就留給下次惰性載入）
+                with self._active_names_lock:
+                    names = self._active_names.get(user_id)
+                    if names is not None:
+                        names.add(product_name.lower())
+
                 current_price = results.get('min_price', 0)
                 
                 response = f"✅ **追蹤成功！**\n\n"
@@ -292,26 +465,95 @@ class PriceTrackerAgent(BaseAgent):
             logger.error(f"追蹤失敗: {e}")
             return "❌ 追蹤失敗"
     
+    def bulk_update_prices(self, rows: List[tuple]) -> int:
+        """批次更新多筆追蹤的最新價格
+
+        rows 為 (user_id, product_name, price) 的列表；
+        一次 bulk_write 送出全部更新，攤平每筆的網路往返成本。
+        刷新性質的寫入用 w=0 不等 ack：漏掉的下一輪排程會再補寫，
+        使用者觸發的追蹤寫入（_track_product_by_name）仍走預設 write concern。
+        """
+        if not rows or not self.db_connected:
+            return 0
+
+        from pymongo import UpdateOne, WriteConcern
+
+        now = datetime.now()
+        ops = [
+            UpdateOne(
+                {"user_id": u, "product_name": n},
+                {"$set": {"current_lowest_price": p, "updated_at": now}}
+            )
+            for u, n, p in rows
+        ]
+        try:
+            col = self.db.db.get_collection(
+                "product_name_tracking", write_concern=WriteConcern(w=0)
+            )
+            col.bulk_write(ops, ordered=False)
+            # 未確認寫入沒有 modified_count，回傳送出的筆數
+            return len(ops)
+        except Exception as e:
+            logger.error(f"批次更新價格失敗: {e}")
+            return 0
+
     def _search_pchome(self, product_name: str) -> Optional[Dict]:
-        """搜尋 PChome"""
+        """搜尋 PChome（附 TTL 快取）"""
+        cache_key = product_name.strip().lower()
+        now = time.monotonic()
+
+        # 熱門槽：單一索引 + 一次比對，免鎖免探測
+        h = hash(cache_key)
+        slot = _HOT[h & 511]
+        if (slot is not None and slot[0] == h and slot[1] == cache_key
+                and now - slot[3] < _PCHOME_CACHE_TTL):
+            return slot[2]
+
+        with _PCHOME_CACHE_LOCK:
+            cached = _PCHOME_CACHE.get(cache_key)
+            if cached is not None and now - cached[1] < _PCHOME_CACHE_TTL:
+                _PCHOME_CACHE.move_to_end(cache_key)
+                _HOT[h & 511] = (h, cache_key, cached[0], cached[1])
+                return cached[0]
+
+        result = self._search_pchome_uncached(product_name)
+
+        # 查無結果（None）不快取，下次還有機會拿到資料
+        if result is not None:
+            _HOT[h & 511] = (h, cache_key, result, now)
+            with _PCHOME_CACHE_LOCK:
+                _PCHOME_CACHE[cache_key] = (result, now)
+                _PCHOME_CACHE.move_to_end(cache_key)
+                while len(_PCHOME_CACHE) > _PCHOME_CACHE_MAX:
+                    _PCHOME_CACHE.popitem(last=False)
+
+        return result
+
+    def _search_pchome_uncached(self, product_name: str) -> Optional[Dict]:
+        """實際打 PChome API"""
         try:
-            encoded = urllib.parse.quote(product_name)
+            encoded = _quote_query(product_name)
             url = f"https://ecshweb.pchome.com.tw/search/v3.3/all/results?q={encoded}&page=1&sort=rel/dc"
             
-            response = requests.get(url, timeout=10)
+            response = _SESSION.get(url, timeout=10)
             if response.status_code == 200:
-                data = response.json()
+                data = _json_loads(response.content)
                 products = data.get('prods', [])
                 
                 if products:
                     # 過濾配件
                     filtered = self._filter_products(products, product_name)
                     if filtered:
-                        prices = [p.get('price', 0) for p in filtered if p.get('price')]
-                        if prices:
-                            min_price = min(prices)
-                            cheapest = min(filtered, key=lambda x: x.get('price', float('inf')))
-                            
+                        # 一趟迴圈同時找最低價與對應商品，
+                        # 取代「建價格列表、min 兩次」的三趟掃描
+                        min_price = float('inf')
+                        cheapest = None
+                        for p in filtered:
+                            pr = p.get('price')
+                            if pr and pr < min_price:
+                                min_price = pr
+                                cheapest = p
+                        if cheapest is not None:
                             return {
                                 'platform': 'PChome 24h',
                                 'min_price': min_price,
@@ -327,47 +569,43 @@ class PriceTrackerAgent(BaseAgent):
     
     def _filter_products(self, products: List[Dict], query: str) -> List[Dict]:
         """過濾配件商品"""
-        exclude_keywords = [
-            '保護套', '保護殼', '手機殼', '皮套', '充電器', '充電線',
-            '傳輸線', '電池', '行動電源', '耳機套', '支架', '貼膜',
-            '保護貼', '配件', '周邊', '專用', '適用於'
+        # 排除詞全是中文，無大小寫問題，省去每個商品名的 .lower() 複製
+        filtered = [
+            p for p in products
+            if not _EXCLUDE_RE.search(p.get('name', ''))
         ]
-        
-        filtered = []
-        for p in products:
-            name = p.get('name', '').lower()
-            if not any(ex in name for ex in exclude_keywords):
-                filtered.append(p)
-        
         return filtered[:10] if filtered else products[:10]
     
     def _get_help_message(self) -> str:
         """取得幫助訊息"""
-        return """📊 **價格追蹤功能說明**
+        return _HELP_MESSAGE
 
-🔍 **查詢價格**
-• 查詢 iPhone 15 價格
-• iPhone 15 多少錢
 
-📌 **追蹤商品**
-• 追蹤 iPhone 15 Pro 目標價格 35000
-• 監控 PS5 目標價格 15000
+# 延遲註冊代理人：第一次被取用時才建立（初始化會連 MongoDB，
+# 放在 import 階段會拖慢 worker 冷啟動）
+class _LazyPriceTrackerAgent:
+    """模組層級的延遲代理：第一次屬性存取時才建立真正的代理人"""
 
-📋 **查看清單**
-• 我的追蹤清單
-• 查看追蹤列表
+    _real = None
 
-🗑️ **移除追蹤**
-• 移除追蹤 iPhone 15
-• 取消全部追蹤
+    def __getattr__(self, name):
+        if self._real is None:
+            type(self)._real = PriceTrackerAgent()
+        return getattr(self._real, name)
 
-💡 系統會自動監控價格變化並通知您！"""
 
+price_tracker_agent = _LazyPriceTrackerAgent()
 
-# 註冊代理人
 try:
-    price_tracker_agent = PriceTrackerAgent()
-    agent_registry.register("PriceTracker", price_tracker_agent)
-    logger.info("✅ 價格追蹤代理人已註冊")
+    agent_registry.register_factory(
+        "PriceTracker", PriceTrackerAgent,
+        keywords=[
+            '價格', '多少錢', '比價', '追蹤', '監控', '通知', '降價',
+            '便宜', '特價', '折扣', '優惠', '目標價', '低於', '售價',
+            '考慮', '想買', '猶豫', '清單', '列表', '移除', '刪除',
+            '取消', '查詢', '查看', '查價', '最低價'
+        ]
+    )
+    logger.info("✅ 價格追蹤代理人工廠已註冊")
 except Exception as e:
     logger.error(f"❌ 價格追蹤代理人註冊失敗: {e}")
@@ -4,11 +4,87 @@
 
 import logging
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
 from typing import Dict, List, Optional
 from .base_agent import BaseAgent, agent_registry
 
 logger = logging.getLogger(__name__)
 
+# 模組層共用的 OpenAI client：連線池跨呼叫重用，省掉每次建構與 TLS 握手
+_OAI_CLIENT = None
+
+
+def _get_openai_client():
+    """延遲建立並快取 OpenAI client；沒有 API key 時回傳 None"""
+    global _OAI_CLIENT
+    if _OAI_CLIENT is None:
+        import openai
+
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            return None
+        _OAI_CLIENT = openai.OpenAI(api_key=api_key)
+    return _OAI_CLIENT
+
+
+# 進行中請求合流：同一查詢同時湧入時只打一次上游，其餘等同一個 Future
+_INFLIGHT: Dict[str, Future] = {}
+_INFLIGHT_LOCK = threading.Lock()
+
+# 近重複查詢快取：去空白標點後按字元排序當鍵，
+# 同字異序的問法（「iPhone 15 評價」「評價 iPhone 15」）共用同一筆回應
+_RESP_CACHE: "OrderedDict[str, tuple]" = OrderedDict()
+_RESP_CACHE_MAX = 256
+_RESP_CACHE_TTL = 600.0  # 秒
+_RESP_CACHE_LOCK = threading.Lock()
+
+_NORM_RE = re.compile(r"[\s，,。.！!？?、]+")
+
+# 備用回應模板：常數部分只建一次，每次只做 format
+_FALLBACK_TEMPLATE = """📦 **{query} 評價分析**
+
+由於 AI 服務暫時不可用，以下是一般性建議：
+
+💡 **購買建議**
+• 先確認自己的需求和預算
+• 比較不同平台的價格
+• 查看官方規格和保固條款
+• 參考網路上的開箱評測
+
+🔍 **資訊來源建議**
+• Mobile01 論壇
+• PTT 相關版面
+• YouTube 開箱影片
+• 電商平台評論
+
+如需更詳細的分析，請稍後再試！"""
+
+
+def _normalize_query(query: str) -> str:
+    """正規化查詢字串作為快取鍵"""
+    return "".join(sorted(_NORM_RE.sub("", query.lower())))
+
+
+def _cache_get(key: str) -> Optional[str]:
+    with _RESP_CACHE_LOCK:
+        cached = _RESP_CACHE.get(key)
+        if cached is not None and time.monotonic() - cached[1] < _RESP_CACHE_TTL:
+            _RESP_CACHE.move_to_end(key)
+            return cached[0]
+    return None
+
+
+def _cache_put(key: str, value: str):
+    with _RESP_CACHE_LOCK:
+        _RESP_CACHE[key] = (value, time.monotonic())
+        _RESP_CACHE.move_to_end(key)
+        while len(_RESP_CACHE) > _RESP_CACHE_MAX:
+            _RESP_CACHE.popitem(last=False)
+
 
 class ProductReviewAgent(BaseAgent):
     """產品評論代理人 - 使用 GPT 分析產品評價"""
@@ -42,15 +118,43 @@ class ProductReviewAgent(BaseAgent):
         return self.analyze_product(message)
     
     def analyze_product(self, query: str) -> str:
-        """分析產品評價"""
-        if not self.openai_api_key:
-            return self._get_fallback_response(query)
-        
+        """分析產品評價（相同查詢同時進來只打一次 GPT）"""
+        cache_key = _normalize_query(query)
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        key = query.strip()
+        with _INFLIGHT_LOCK:
+            future = _INFLIGHT.get(key)
+            if future is None:
+                future = Future()
+                _INFLIGHT[key] = future
+                is_owner = True
+            else:
+                is_owner = False
+
+        if not is_owner:
+            try:
+                return future.result(timeout=40)
+            except Exception:
+                return self._get_fallback_response(query)
+
+        try:
+            result = self._analyze_product_uncoalesced(query)
+            future.set_result(result)
+            return result
+        finally:
+            with _INFLIGHT_LOCK:
+                _INFLIGHT.pop(key, None)
+
+    def _analyze_product_uncoalesced(self, query: str) -> str:
+        """實際呼叫 GPT 分析"""
         try:
-            import openai
-            
-            client = openai.OpenAI(api_key=self.openai_api_key)
-            
+            client = _get_openai_client()
+            if client is None:
+                return self._get_fallback_response(query)
+
             response = client.chat.completions.create(
                 model=os.getenv("GPT_MODEL", "gpt-4o-mini"),
                 messages=[
@@ -60,38 +164,42 @@ class ProductReviewAgent(BaseAgent):
                 max_tokens=800,
                 temperature=0.7
             )
-            
-            return response.choices[0].message.content.strip()
-            
+
+            result = response.choices[0].message.content.strip()
+            # 只快取成功的 GPT 回應；fallback 不進快取
+            _cache_put(_normalize_query(query), result)
+            return result
+
+
         except Exception as e:
             logger.error(f"GPT 分析失敗: {e}")
             return self._get_fallback_response(query)
     
     def _get_fallback_response(self, query: str) -> str:
         """備用回應"""
-        return f"""📦 **{query} 評價分析**
+        return _FALLBACK_TEMPLATE.format(query=query)
 
-由於 AI 服務暫時不可用，以下是一般性建議：
 
-💡 **購買建議**
-• 先確認自己的需求和預算
-• 比較不同平台的價格
-• 查看官方規格和保固條款
-• 參考網路上的開箱評測
+# 延遲註冊代理人：第一次被取用時才建立，import 階段不付初始化成本
+class _LazyProductReviewAgent:
+    """模組層級的延遲代理：第一次屬性存取時才建立真正的代理人"""
 
-🔍 **資訊來源建議**
-• Mobile01 論壇
-• PTT 相關版面
-• YouTube 開箱影片
-• 電商平台評論
+    _real = None
+
+    def __getattr__(self, name):
+        if self._real is None:
+            type(self)._real = ProductReviewAgent()
+        return getattr(self._real, name)
 
-如需更詳細的分析，請稍後再試！"""
 
+product_review_agent = _LazyProductReviewAgent()
 
-# 註冊代理人
 try:
-    product_review_agent = ProductReviewAgent()
-    agent_registry.register("ProductReview", product_review_agent)
-    logger.info("✅ 產品評論代理人已註冊")
+    agent_registry.register_factory(
+        "ProductReview", ProductReviewAgent,
+        keywords=['評價', '評論', '好不好', '值得買', '推不推',
+                  '心得', '開箱', '使用感想']
+    )
+    logger.info("✅ 產品評論代理人工廠已註冊")
 except Exception as e:
     logger.error(f"❌ 產品評論代理人註冊失敗: {e}")
@@ -4,11 +4,90 @@
 
 import logging
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
 from typing import Dict, List, Optional
 from .base_agent import BaseAgent, agent_registry
 
 logger = logging.getLogger(__name__)
 
+# 模組層共用的 OpenAI client：連線池跨呼叫重用，省掉每次建構與 TLS 握手
+_OAI_CLIENT = None
+
+
+def _get_openai_client():
+    """延遲建立並快取 OpenAI client；沒有 API key 時回傳 None"""
+    global _OAI_CLIENT
+    if _OAI_CLIENT is None:
+        import openai
+
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            return None
+        _OAI_CLIENT = openai.OpenAI(api_key=api_key)
+    return _OAI_CLIENT
+
+
+# 進行中請求合流：同一查詢同時湧入時只打一次上游，其餘等同一個 Future
+_INFLIGHT: Dict[str, Future] = {}
+_INFLIGHT_LOCK = threading.Lock()
+
+# 近重複查詢快取：去空白標點後按字元排序當鍵，
+# 「推薦筆電 3萬」「3萬推薦筆電」這類同字異序問法共用同一筆回應
+_RESP_CACHE: "OrderedDict[str, tuple]" = OrderedDict()
+_RESP_CACHE_MAX = 256
+_RESP_CACHE_TTL = 600.0  # 秒
+_RESP_CACHE_LOCK = threading.Lock()
+
+_NORM_RE = re.compile(r"[\s，,。.！!？?、]+")
+
+# 備用回應模板：常數部分只建一次，每次只做 format
+_FALLBACK_TEMPLATE = """🎯 **購物建議**
+
+關於「{query}」，以下是一般性建議：
+
+💡 **選購要點**
+1. 先確認自己的實際需求
+2. 設定合理的預算範圍
+3. 比較不同品牌的規格和價格
+4. 查看用戶評論和專業評測
+
+🔍 **推薦資訊來源**
+• 電商平台比價
+• Mobile01 討論區
+• PTT 相關版面
+• YouTube 評測影片
+
+📱 **下一步**
+輸入更具體的需求（如預算、用途），我可以提供更精準的建議！
+
+如需 AI 智能推薦，請確認 OpenAI API Key 已正確設定。"""
+
+
+def _normalize_query(query: str) -> str:
+    """正規化查詢字串作為快取鍵"""
+    return "".join(sorted(_NORM_RE.sub("", query.lower())))
+
+
+def _cache_get(key: str) -> Optional[str]:
+    with _RESP_CACHE_LOCK:
+        cached = _RESP_CACHE.get(key)
+        if cached is not None and time.monotonic() - cached[1] < _RESP_CACHE_TTL:
+            _RESP_CACHE.move_to_end(key)
+            return cached[0]
+    return None
+
+
+def _cache_put(key: str, value: str):
+    with _RESP_CACHE_LOCK:
+        _RESP_CACHE[key] = (value, time.monotonic())
+        _RESP_CACHE.move_to_end(key)
+        while len(_RESP_CACHE) > _RESP_CACHE_MAX:
+            _RESP_CACHE.popitem(last=False)
+
 
 class SmartRecommendationAgent(BaseAgent):
     """智能推薦代理人 - 使用 GPT 提供購物建議"""
@@ -41,15 +120,43 @@ class SmartRecommendationAgent(BaseAgent):
         return self.get_recommendation(message)
     
     def get_recommendation(self, query: str) -> str:
-        """取得產品推薦"""
-        if not self.openai_api_key:
-            return self._get_fallback_response(query)
-        
+        """取得產品推薦（相同查詢同時進來只打一次 GPT）"""
+        cache_key = _normalize_query(query)
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        key = query.strip()
+        with _INFLIGHT_LOCK:
+            future = _INFLIGHT.get(key)
+            if future is None:
+                future = Future()
+                _INFLIGHT[key] = future
+                is_owner = True
+            else:
+                is_owner = False
+
+        if not is_owner:
+            try:
+                return future.result(timeout=40)
+            except Exception:
+                return self._get_fallback_response(query)
+
+        try:
+            result = self._get_recommendation_uncoalesced(query)
+            future.set_result(result)
+            return result
+        finally:
+            with _INFLIGHT_LOCK:
+                _INFLIGHT.pop(key, None)
+
+    def _get_recommendation_uncoalesced(self, query: str) -> str:
+        """實際呼叫 GPT 推薦"""
         try:
-            import openai
-            
-            client = openai.OpenAI(api_key=self.openai_api_key)
-            
+            client = _get_openai_client()
+            if client is None:
+                return self._get_fallback_response(query)
+
             response = client.chat.completions.create(
                 model=os.getenv("GPT_MODEL", "gpt-4o-mini"),
                 messages=[
@@ -59,41 +166,41 @@ class SmartRecommendationAgent(BaseAgent):
                 max_tokens=1000,
                 temperature=0.7
             )
-            
-            return response.choices[0].message.content.strip()
-            
+
+            result = response.choices[0].message.content.strip()
+            # 只快取成功的 GPT 回應；fallback 不進快取
+            _cache_put(_normalize_query(query), result)
+            return result
+
+
         except Exception as e:
             logger.error(f"GPT 推薦失敗: {e}")
             return self._get_fallback_response(query)
     
     def _get_fallback_response(self, query: str) -> str:
         """備用回應"""
-        return f"""🎯 **購物建議**
+        return _FALLBACK_TEMPLATE.format(query=query)
 
-關於「{query}」，以下是一般性建議：
 
-💡 **選購要點**
-1. 先確認自己的實際需求
-2. 設定合理的預算範圍
-3. 比較不同品牌的規格和價格
-4. 查看用戶評論和專業評測
+# 延遲註冊代理人：第一次被取用時才建立，import 階段不付初始化成本
+class _LazySmartRecommendationAgent:
+    """模組層級的延遲代理：第一次屬性存取時才建立真正的代理人"""
 
-🔍 **推薦資訊來源**
-• 電商平台比價
-• Mobile01 討論區
-• PTT 相關版面
-• YouTube 評測影片
+    _real = None
 
-📱 **下一步**
-輸入更具體的需求（如預算、用途），我可以提供更精準的建議！
+    def __getattr__(self, name):
+        if self._real is None:
+            type(self)._real = SmartRecommendationAgent()
+        return getattr(self._real, name)
 
-如需 AI 智能推薦，請確認 OpenAI API Key 已正確設定。"""
 
+smart_recommendation_agent = _LazySmartRecommendationAgent()
 
-# 註冊代理人
 try:
-    smart_recommendation_agent = SmartRecommendationAgent()
-    agent_registry.register("SmartRecommendation", smart_recommendation_agent)
-    logger.info("✅ 智能推薦代理人已註冊")
+    agent_registry.register_factory(
+        "SmartRecommendation", SmartRecommendationAgent,
+        keywords=['推薦', '建議', '哪個好', '選擇', '比較', '該買', '想買']
+    )
+    logger.info("✅ 智能推薦代理人工廠已註冊")
 except Exception as e:
     logger.error(f"❌ 智能推薦代理人註冊失敗: {e}")
@@ -8,11 +8,14 @@ SmartShopSaver - AI 驅動的智能購物助理
 
 import sys
 import os
+import re
+import atexit
 import threading
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from datetime import datetime
-from flask import Flask, request, jsonify, make_response, redirect
+from flask import Flask, Response, request, jsonify, make_response, redirect
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -28,7 +31,12 @@ from linebot.exceptions import InvalidSignatureError
 from linebot.models import MessageEvent, TextMessage, TextSendMessage
 
 # ========== 設定 ==========
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+# 等級可由環境變數調整（生產環境設 WARNING 可省下熱路徑的 INFO 記錄成本）
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    force=True
+)
 logger = logging.getLogger(__name__)
 
 CHANNEL_ACCESS_TOKEN = os.getenv("CHANNEL_ACCESS_TOKEN")
@@ -42,6 +50,14 @@ app = Flask(__name__)
 line_bot_api = LineBotApi(CHANNEL_ACCESS_TOKEN) if CHANNEL_ACCESS_TOKEN else None
 handler = WebhookHandler(CHANNEL_SECRET) if CHANNEL_SECRET else None
 
+# Webhook 工作池：固定大小取代每事件 new Thread，
+# 突發流量下執行緒數有上限、也省掉每次建立執行緒的成本
+WEBHOOK_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("WEBHOOK_WORKERS", "16")),
+    thread_name_prefix="wh"
+)
+atexit.register(WEBHOOK_EXECUTOR.shutdown, wait=False)
+
 # ========== MongoDB ==========
 db = None
 db_connected = False
@@ -52,91 +68,157 @@ try:
     db_connected = True
     logger.info("✅ MongoDB 連接成功")
 except Exception as e:
-    logger.warning(f"⚠️ MongoDB 連接失敗: {e}")
+    logger.warning("⚠️ MongoDB 連接失敗: %s", e)
 
 # ========== 代理人載入 ==========
-AGENT_MAPPING = {}
+# 代理人模組改為第一次用到才 import：Cloud Run 冷啟動不再付
+# 五個代理人模組的載入與初始化成本，/health 也能更快就緒
+class _LazyAgent:
+    """延遲載入代理：首次處理訊息時才 import 模組並實例化"""
+
+    def __init__(self, module_path: str, attr: str, *args):
+        self._module_path = module_path
+        self._attr = attr
+        self._args = args
+        self._inst = None
+        self._lock = threading.Lock()
+
+    def _resolve(self):
+        if self._inst is None:
+            with self._lock:
+                if self._inst is None:
+                    import importlib
+                    mod = importlib.import_module(self._module_path)
+                    target = getattr(mod, self._attr)
+                    self._inst = (target(*self._args)
+                                  if isinstance(target, type) else target)
+                    logger.info("✅ 延遲載入代理人: %s", self._module_path)
+        return self._inst
+
+    def process_message(self, *args, **kwargs):
+        return self._resolve().process_message(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+
+AGENT_MAPPING = {
+    "Finance": _LazyAgent("agents.finance_agent", "finance_agent"),
+    "PriceTracker": _LazyAgent(
+        "agents.price_tracker_agent_improved", "PriceTrackerAgent", line_bot_api
+    ),
+    "SmartRecommendation": _LazyAgent(
+        "agents.smart_recommendation_agent", "smart_recommendation_agent"
+    ),
+    "ProductReview": _LazyAgent(
+        "agents.product_review_agent_improved", "product_review_agent"
+    ),
+    "Gmail": _LazyAgent("agents.gmail_integration_agent", "GmailIntegrationAgent"),
+}
 
 try:
     from agents.ai_intent_analyzer import AIIntentAnalyzer
     ai_intent_analyzer = AIIntentAnalyzer()
     logger.info("✅ AI 意圖分析器載入成功")
 except Exception as e:
-    logger.warning(f"⚠️ AI 意圖分析器載入失敗: {e}")
+    logger.warning("⚠️ AI 意圖分析器載入失敗: %s", e)
     ai_intent_analyzer = None
 
-try:
-    from agents.finance_agent import finance_agent
-    AGENT_MAPPING["Finance"] = finance_agent
-    logger.info("✅ 財務代理人載入成功")
-except Exception as e:
-    logger.warning(f"⚠️ 財務代理人載入失敗: {e}")
 
-try:
-    from agents.price_tracker_agent_improved import PriceTrackerAgent
-    price_tracker_agent = PriceTrackerAgent(line_bot_api)
-    AGENT_MAPPING["PriceTracker"] = price_tracker_agent
-    logger.info("✅ 價格追蹤代理人載入成功")
-except Exception as e:
-    logger.warning(f"⚠️ 價格追蹤代理人載入失敗: {e}")
+# ========== 背景預熱 ==========
+# 延遲載入讓 /health 立刻就緒，但第一則真實訊息仍要付「首次 import +
+# 初始化」的代價；背景執行緒在啟動後先把各代理人解析好，
+# 新實例的第一位用戶就不用等
+def _warmup_agents():
+    for name, agent in AGENT_MAPPING.items():
+        try:
+            agent._resolve()
+        except Exception as e:
+            logger.warning("⚠️ 代理人預熱失敗 %s: %s", name, e)
 
-try:
-    from agents.smart_recommendation_agent import smart_recommendation_agent
-    AGENT_MAPPING["SmartRecommendation"] = smart_recommendation_agent
-    logger.info("✅ 智能推薦代理人載入成功")
-except Exception as e:
-    logger.warning(f"⚠️ 智能推薦代理人載入失敗: {e}")
 
-try:
-    from agents.product_review_agent_improved import product_review_agent
-    AGENT_MAPPING["ProductReview"] = product_review_agent
-    logger.info("✅ 產品評論代理人載入成功")
-except Exception as e:
-    logger.warning(f"⚠️ 產品評論代理人載入失敗: {e}")
+if os.getenv("AGENT_WARMUP", "1") != "0":
+    threading.Thread(target=_warmup_agents, daemon=True, name="agent-warmup").start()
 
-try:
-    from agents.gmail_integration_agent import GmailIntegrationAgent
-    gmail_agent = GmailIntegrationAgent()
-    AGENT_MAPPING["Gmail"] = gmail_agent
-    logger.info("✅ Gmail 代理人載入成功")
-except Exception as e:
-    logger.warning(f"⚠️ Gmail 代理人載入失敗: {e}")
+
+# ========== 意圖快取 ==========
+# 常見片語（「本月支出」「推薦電競滑鼠」）重複率極高，
+# 意圖分類結果以 TTL + LRU 記住，免去重複的 OpenAI 往返
+import hashlib
+from collections import OrderedDict
+
+ENABLE_INTENT_CACHE = os.getenv("ENABLE_INTENT_CACHE", "1") != "0"
+
+# 時區位移（秒），預設 UTC+8（台北），夜間提醒判斷用
+_TZ_OFFSET_SEC = int(os.getenv("TZ_OFFSET_SEC", "28800"))
+_INTENT_CACHE: "OrderedDict[bytes, tuple]" = OrderedDict()
+_INTENT_CACHE_MAX = 10_000
+_INTENT_CACHE_TTL = int(os.getenv("INTENT_CACHE_TTL", "86400"))
+_INTENT_CACHE_LOCK = threading.Lock()
+
+
+def _intent_cache_key(message: str) -> bytes:
+    return hashlib.blake2b(message.encode("utf-8"), digest_size=16).digest()
+
+
+def _intent_cache_get(key: bytes):
+    import time
+    with _INTENT_CACHE_LOCK:
+        cached = _INTENT_CACHE.get(key)
+        if cached is not None and time.monotonic() - cached[2] < _INTENT_CACHE_TTL:
+            _INTENT_CACHE.move_to_end(key)
+            return cached[0], cached[1]
+    return None
+
+
+def _intent_cache_put(key: bytes, agent_name: str, confidence: float):
+    import time
+    with _INTENT_CACHE_LOCK:
+        _INTENT_CACHE[key] = (agent_name, confidence, time.monotonic())
+        _INTENT_CACHE.move_to_end(key)
+        while len(_INTENT_CACHE) > _INTENT_CACHE_MAX:
+            _INTENT_CACHE.popitem(last=False)
 
 
 # ========== 訊息處理 ==========
+# 建議字串為常數，import 時就 join 好，每則訊息只剩一次 dict 查找加串接
+_SUGGESTIONS_RAW = {
+    "Finance": [
+        "💡 財務功能：",
+        "• 查看本月支出統計",
+        "• 設定預算上限",
+        "• 分析消費類別"
+    ],
+    "ProductReview": [
+        "💡 產品評論功能：",
+        "• 顯示正負面評論比例",
+        "• 整理主要優缺點",
+        "• 比較多平台評價"
+    ],
+    "PriceTracker": [
+        "💡 價格追蹤功能：",
+        "• 設定降價通知",
+        "• 追蹤歷史價格曲線",
+        "• 顯示跨平台最低價"
+    ],
+    "Gmail": [
+        "💡 Gmail 功能：",
+        "• 同步購物郵件",
+        "• 自動整理收據",
+        "• 追蹤訂單狀態"
+    ]
+}
+_SUGGESTION_SUFFIX = {
+    name: "\n\n" + "\n".join(lines) for name, lines in _SUGGESTIONS_RAW.items()
+}
+
+
 def _add_intelligent_suggestions(agent_name: str, response: str) -> str:
     """自動加上 💡 建議功能"""
-    suggestions = {
-        "Finance": [
-            "💡 財務功能：",
-            "• 查看本月支出統計",
-            "• 設定預算上限",
-            "• 分析消費類別"
-        ],
-        "ProductReview": [
-            "💡 產品評論功能：",
-            "• 顯示正負面評論比例",
-            "• 整理主要優缺點",
-            "• 比較多平台評價"
-        ],
-        "PriceTracker": [
-            "💡 價格追蹤功能：",
-            "• 設定降價通知",
-            "• 追蹤歷史價格曲線",
-            "• 顯示跨平台最低價"
-        ],
-        "Gmail": [
-            "💡 Gmail 功能：",
-            "• 同步購物郵件",
-            "• 自動整理收據",
-            "• 追蹤訂單狀態"
-        ]
-    }
     if "💡" in response:
         return response
-    if agent_name in suggestions:
-        response += "\n\n" + "\n".join(suggestions[agent_name])
-    return response
+    suffix = _SUGGESTION_SUFFIX.get(agent_name)
+    return response + suffix if suffix else response
 
 
 def process_user_message(user_id: str, message: str) -> str:
@@ -145,12 +227,20 @@ def process_user_message(user_id: str, message: str) -> str:
         # 增強口語化理解
         message = enhance_message_understanding(message)
         
-        # 嘗試使用 AI 意圖分析
+        # 嘗試使用 AI 意圖分析（熱門片語先查快取）
         if ai_intent_analyzer and OPENAI_API_KEY:
             try:
-                agent_name, confidence, _ = ai_intent_analyzer.analyze_intent(message, user_id)
-                logger.info(f"🧠 意圖分析: {agent_name} ({confidence:.2%})")
-                
+                cache_key = _intent_cache_key(message) if ENABLE_INTENT_CACHE else None
+                cached = _intent_cache_get(cache_key) if cache_key else None
+                if cached is not None:
+                    agent_name, confidence = cached
+                else:
+                    agent_name, confidence, _ = ai_intent_analyzer.analyze_intent(message, user_id)
+                    # 低信心的分類不進快取，避免釘死劣質判斷
+                    if cache_key and confidence >= 0.5:
+                        _intent_cache_put(cache_key, agent_name, confidence)
+                logger.info("🧠 意圖分析: %s (%.2f%%)", agent_name, confidence * 100)
+
                 if agent_name in AGENT_MAPPING:
                     agent = AGENT_MAPPING[agent_name]
                     response = agent.process_message(user_id, message)
@@ -161,60 +251,65 @@ def process_user_message(user_id: str, message: str) -> str:
                     
                     return response
             except Exception as e:
-                logger.warning(f"AI 分析失敗，使用規則匹配: {e}")
+                logger.warning("AI 分析失敗，使用規則匹配: %s", e)
         
         # 規則匹配（備用）
         return rule_based_routing(user_id, message)
         
     except Exception as e:
-        logger.error(f"處理訊息失敗: {e}", exc_info=True)
+        logger.error("處理訊息失敗: %s", e, exc_info=True)
         return "⚠️ 抱歉，目前無法理解您的需求，請稍後再試。"
 
 
+# 規則路由關鍵字：named group 即代理人名稱，一趟掃描取代五輪 substring 比對
+# 優先序沿用原本 if/elif 的判斷順序
+_ROUTE_RE = re.compile(
+    "(?P<Gmail>gmail|郵件|連接|授權|掃描)"
+    "|(?P<Finance>記帳|支出|花費|預算|本月)"
+    "|(?P<PriceTracker>價格|追蹤|比價|查詢|多少錢|清單)"
+    "|(?P<ProductReview>評價|評論|好不好|值得買)"
+    "|(?P<SmartRecommendation>推薦|建議|選擇)",
+    re.IGNORECASE
+)
+_ROUTE_PRIORITY = ("Gmail", "Finance", "PriceTracker",
+                   "ProductReview", "SmartRecommendation")
+
+
 def rule_based_routing(user_id: str, message: str) -> str:
     """規則匹配路由"""
     msg_lower = message.lower()
-    
-    # Gmail 相關
-    if any(kw in msg_lower for kw in ['gmail', '郵件', '連接', '授權', '掃描']):
-        if "Gmail" in AGENT_MAPPING:
-            return AGENT_MAPPING["Gmail"].process_message(user_id, message)
-    
-    # 記帳相關
-    if any(kw in msg_lower for kw in ['記帳', '支出', '花費', '預算', '本月']):
-        if "Finance" in AGENT_MAPPING:
-            return AGENT_MAPPING["Finance"].process_message(user_id, message)
-    
-    # 價格追蹤相關
-    if any(kw in msg_lower for kw in ['價格', '追蹤', '比價', '查詢', '多少錢', '清單']):
-        if "PriceTracker" in AGENT_MAPPING:
-            return AGENT_MAPPING["PriceTracker"].process_message(user_id, message)
-    
-    # 評價相關
-    if any(kw in msg_lower for kw in ['評價', '評論', '好不好', '值得買']):
-        if "ProductReview" in AGENT_MAPPING:
-            return AGENT_MAPPING["ProductReview"].process_message(user_id, message)
-    
-    # 推薦相關
-    if any(kw in msg_lower for kw in ['推薦', '建議', '選擇']):
-        if "SmartRecommendation" in AGENT_MAPPING:
-            return AGENT_MAPPING["SmartRecommendation"].process_message(user_id, message)
-    
+
+    # 一趟掃描收集命中的代理人，再依原本的優先序分派；
+    # 該代理人未載入時落到下一順位（與舊版 if/elif 行為一致）
+    hits = {m.lastgroup for m in _ROUTE_RE.finditer(msg_lower)}
+    for name in _ROUTE_PRIORITY:
+        if name in hits and name in AGENT_MAPPING:
+            return AGENT_MAPPING[name].process_message(user_id, message)
+
     # 預設回應
     return get_help_message()
 
 
+# 口語化替換表：單一 alternation 一趟掃完，取代九次全字串 replace
+# 長鍵在前，維持最長匹配（「好不好用」先於「好不好」之類的片語）
+_REPL = {
+    "有啥": "有什麼", "咋樣": "怎麼樣", "啥時候": "什麼時候",
+    "多少$": "多少錢", "多少￥": "多少錢", "想買個": "我想買",
+    "想要個": "我想要", "幫我看看": "請幫我查詢", "有沒有": "是否有",
+    "好不好用": "評價如何"
+}
+_REPL_RE = re.compile(
+    "|".join(re.escape(k) for k in sorted(_REPL, key=len, reverse=True))
+)
+
+
 def enhance_message_understanding(msg: str) -> str:
     """增強口語化理解"""
-    replacements = {
-        "有啥": "有什麼", "咋樣": "怎麼樣", "啥時候": "什麼時候",
-        "多少$": "多少錢", "多少￥": "多少錢", "想買個": "我想買",
-        "想要個": "我想要", "幫我看看": "請幫我查詢", "有沒有": "是否有",
-        "好不好用": "評價如何"
-    }
-    for old, new in replacements.items():
-        msg = msg.replace(old, new)
-    return msg
+    # 純 ASCII（網址、指令、型號）不可能命中任何中文替換鍵，
+    # isascii 是 C 層單趟掃描，直接原樣返回
+    if msg.isascii():
+        return msg
+    return _REPL_RE.sub(lambda m: _REPL[m.group(0)], msg)
 
 
 def get_help_message() -> str:
@@ -241,39 +336,100 @@ def get_help_message() -> str:
 
 
 # ========== Flask 路由 ==========
+# 健康檢查內容在啟動後即固定，預先序列化成 bytes，
+# 探針每幾秒打一次也只是回傳常數，不再每次建 dict + JSON 編碼
+import json as _json
+
+_HEALTH_BYTES = _json.dumps({
+    "status": "ok",
+    "message": "SmartShopSaver is running",
+    "db_connected": db_connected,
+    "ai_enabled": bool(OPENAI_API_KEY),
+    "agents_loaded": list(AGENT_MAPPING.keys())
+}).encode("utf-8")
+
+
 @app.route("/")
 @app.route("/health")
 def health():
     """健康檢查"""
-    return {
-        "status": "ok",
-        "message": "SmartShopSaver is running",
-        "db_connected": db_connected,
-        "ai_enabled": bool(OPENAI_API_KEY),
-        "agents_loaded": list(AGENT_MAPPING.keys())
-    }, 200
+    return Response(_HEALTH_BYTES, status=200, mimetype="application/json")
 
 
 @app.route("/callback", methods=["POST"])
 def callback():
     """LINE Webhook"""
     signature = request.headers.get("X-Line-Signature", "")
-    body = request.get_data(as_text=True)
-    
-    # 非同步處理
-    threading.Thread(target=process_webhook, args=(body, signature)).start()
+    # cache=False：不在 request 物件上多留一份 body 副本；
+    # SDK 的 handle() 要吃 str（內部會再 encode 算 HMAC），這裡只解碼一次
+    body = request.get_data(cache=False, as_text=False).decode("utf-8")
+
+    # 非同步處理（交給固定大小的工作池）
+    try:
+        WEBHOOK_EXECUTOR.submit(process_webhook, body, signature)
+    except RuntimeError:
+        # 程式關閉中，池已不收工作
+        return "Shutting down", 503
     return "OK", 200
 
 
+# 重送去重：LINE 重試風暴下同一份 body 可能在前一份還沒處理完時再送到，
+# 以 body 雜湊記錄 30 秒內已受理的 webhook，重複者直接略過
+_WEBHOOK_SEEN: "OrderedDict[bytes, float]" = OrderedDict()
+_WEBHOOK_SEEN_MAX = 1024
+_WEBHOOK_SEEN_TTL = 30.0  # 秒
+_WEBHOOK_SEEN_LOCK = threading.Lock()
+
+
+def _webhook_seen(body) -> bool:
+    """回報這份 body 是否在 TTL 內已受理過；未受理則登記"""
+    key = hashlib.blake2b(
+        body.encode("utf-8") if isinstance(body, str) else body,
+        digest_size=16
+    ).digest()
+    now = time.monotonic()
+    with _WEBHOOK_SEEN_LOCK:
+        ts = _WEBHOOK_SEEN.get(key)
+        if ts is not None and now - ts < _WEBHOOK_SEEN_TTL:
+            return True
+        _WEBHOOK_SEEN[key] = now
+        _WEBHOOK_SEEN.move_to_end(key)
+        while len(_WEBHOOK_SEEN) > _WEBHOOK_SEEN_MAX:
+            _WEBHOOK_SEEN.popitem(last=False)
+    return False
+
+
 def process_webhook(body, signature):
     """處理 Webhook"""
     try:
+        if _webhook_seen(body):
+            logger.info("⏭️ 略過重複送達的 webhook")
+            return
         if handler:
             handler.handle(body, signature)
     except InvalidSignatureError:
         logger.error("❌ Invalid signature")
     except Exception as e:
-        logger.error(f"Webhook 處理錯誤: {e}", exc_info=True)
+        logger.error("Webhook 處理錯誤: %s", e, exc_info=True)
+
+
+def _split_response(text, max_len):
+    """超長回覆切段：優先在換行處斷開，避免把句子（或字）切成兩半
+
+    純整數位移運算，一次掃描產生所有切點後才做切片，
+    不會為每段額外配置中間 list。
+    """
+    parts = []
+    start = 0
+    n = len(text)
+    while n - start > max_len:
+        cut = text.rfind("\n", start + max_len // 2, start + max_len)
+        if cut == -1:
+            cut = start + max_len
+        parts.append(text[start:cut])
+        start = cut
+    parts.append(text[start:])
+    return parts
 
 
 if handler:
@@ -285,43 +441,52 @@ if handler:
             text = event.message.text.strip()
             reply_token = event.reply_token
             
-            logger.info(f"📨 收到訊息: {text} from {user_id}")
+            logger.info("📨 收到訊息: %s from %s", text, user_id)
             
-            # 更新用戶活動
+            # 更新用戶活動：單趟 upsert，只有首次接觸才補抓 LINE profile
             if db_connected and db:
                 try:
-                    db.update_user_activity(user_id)
-                    if not db.get_user(user_id):
+                    existed = db.touch_user(user_id)
+                    if not existed:
                         try:
                             profile = line_bot_api.get_profile(user_id)
-                            db.create_user(user_id, profile.display_name)
+                            db.set_display_name(user_id, profile.display_name)
                         except:
-                            db.create_user(user_id, "LINE用戶")
+                            pass
                 except Exception as e:
-                    logger.warning(f"用戶資料處理失敗: {e}")
+                    logger.warning("用戶資料處理失敗: %s", e)
             
             # 處理訊息
             response = process_user_message(user_id, text)
             
-            # 夜間提醒
-            hour = datetime.now().hour
+            # 夜間提醒：整數 epoch 運算取小時，免去建構 datetime 物件
+            hour = ((int(time.time()) + _TZ_OFFSET_SEC) // 3600) % 24
             if hour >= 22 or hour < 5:
                 response += "\n\n🌙 夜深了，記得早點休息喔！"
             
-            # 回覆訊息（處理超長訊息）
+            # 回覆訊息（處理超長訊息）：reply_message 一次最多可帶 5 則，
+            # 常見的 2-5 段長回覆只要 1 趟 HTTPS；超過 5 段的尾段並行 push
             MAX_LENGTH = 4900
             if len(response) > MAX_LENGTH:
-                parts = [response[i:i+MAX_LENGTH] for i in range(0, len(response), MAX_LENGTH)]
-                line_bot_api.reply_message(reply_token, TextSendMessage(text=parts[0]))
-                for part in parts[1:]:
-                    line_bot_api.push_message(user_id, TextSendMessage(text=part))
+                parts = _split_response(response, MAX_LENGTH)
+                line_bot_api.reply_message(
+                    reply_token,
+                    [TextSendMessage(text=p) for p in parts[:5]]
+                )
+                if len(parts) > 5:
+                    list(WEBHOOK_EXECUTOR.map(
+                        lambda p: line_bot_api.push_message(
+                            user_id, TextSendMessage(text=p)
+                        ),
+                        parts[5:]
+                    ))
             else:
                 line_bot_api.reply_message(reply_token, TextSendMessage(text=response))
             
-            logger.info(f"✅ 已回覆 {user_id}")
+            logger.info("✅ 已回覆 %s", user_id)
             
         except Exception as e:
-            logger.error(f"訊息處理失敗: {e}", exc_info=True)
+            logger.error("訊息處理失敗: %s", e, exc_info=True)
             try:
                 line_bot_api.reply_message(
                     event.reply_token,
@@ -332,6 +497,33 @@ if handler:
 
 
 # ========== Gmail OAuth 路由 ==========
+# HTML 殼層是常數，模組載入時就編成 bytes；授權頁只剩一次 replace，
+# 成功頁原封不動回傳
+_OAUTH_START_TMPL = """
+<html>
+<head><meta charset="utf-8"><title>連結 Gmail</title></head>
+<body style="font-family:Arial;text-align:center;margin-top:100px;">
+    <h1>📧 連結 Gmail 帳號</h1>
+    <p>請點擊下方按鈕授權</p>
+    <a href="{auth_url}" style="display:inline-block;padding:12px 24px;
+       background:#1a73e8;color:white;text-decoration:none;border-radius:8px;">
+       使用 Google 帳號登入
+    </a>
+</body>
+</html>
+""".encode("utf-8")
+
+_OAUTH_OK_HTML = """
+<html>
+<head><meta charset="utf-8"><title>授權成功</title></head>
+<body style="font-family:Arial;text-align:center;margin-top:100px;">
+    <h1>✅ 授權成功！</h1>
+    <p>請返回 LINE 使用 Gmail 功能</p>
+</body>
+</html>
+""".encode("utf-8")
+
+
 @app.route("/google/start", methods=["GET"])
 def google_oauth_start():
     """Gmail OAuth 入口"""
@@ -348,21 +540,12 @@ def google_oauth_start():
         result = start_google_oauth(uid, redirect_uri)
         auth_url = result[0] if isinstance(result, tuple) else result
         
-        return f"""
-        <html>
-        <head><meta charset="utf-8"><title>連結 Gmail</title></head>
-        <body style="font-family:Arial;text-align:center;margin-top:100px;">
-            <h1>📧 連結 Gmail 帳號</h1>
-            <p>請點擊下方按鈕授權</p>
-            <a href="{auth_url}" style="display:inline-block;padding:12px 24px;
-               background:#1a73e8;color:white;text-decoration:none;border-radius:8px;">
-               使用 Google 帳號登入
-            </a>
-        </body>
-        </html>
-        """
+        return Response(
+            _OAUTH_START_TMPL.replace(b"{auth_url}", auth_url.encode("utf-8")),
+            mimetype="text/html"
+        )
     except Exception as e:
-        logger.error(f"OAuth 啟動失敗: {e}")
+        logger.error("OAuth 啟動失敗: %s", e)
         return f"<h3>❌ 無法建立授權連結</h3><p>{e}</p>", 500
 
 
@@ -385,17 +568,9 @@ def google_oauth_callback():
         
         finish_google_oauth(code, redirect_uri, uid)
         
-        return """
-        <html>
-        <head><meta charset="utf-8"><title>授權成功</title></head>
-        <body style="font-family:Arial;text-align:center;margin-top:100px;">
-            <h1>✅ 授權成功！</h1>
-            <p>請返回 LINE 使用 Gmail 功能</p>
-        </body>
-        </html>
-        """
+        return Response(_OAUTH_OK_HTML, mimetype="text/html")
     except Exception as e:
-        logger.error(f"OAuth 回調失敗: {e}")
+        logger.error("OAuth 回調失敗: %s", e)
         return f"<h3>❌ 授權失敗</h3><p>{e}</p>", 400
 
 
@@ -412,4 +587,6 @@ if __name__ == "__main__":
     print(f"✅ 載入代理人: {list(AGENT_MAPPING.keys())}")
     print("=" * 60)
     
-    app.run(host="0.0.0.0", port=port, debug=False)
+    # threaded=True：開發伺服器也能並發處理 webhook，
+    # 阻塞中的 LINE API 往返不會卡住其他請求
+    app.run(host="0.0.0.0", port=port, debug=False, threaded=True)
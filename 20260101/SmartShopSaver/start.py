@@ -4,6 +4,7 @@ SmartShopSaver 智能啟動腳本
 自動檢查並安裝缺少的套件，然後執行主程式
 """
 
+import importlib.util
 import subprocess
 import sys
 import os
@@ -37,37 +38,52 @@ OPTIONAL_PACKAGES = {
     'litellm': 'litellm',
 }
 
-def check_and_install_package(import_name, install_name):
-    """檢查套件是否已安裝，如果沒有則安裝"""
+def find_missing_packages(packages):
+    """回傳尚未安裝的套件安裝名稱列表
+
+    用 find_spec 只查模組是否存在，不像 __import__ 會真的執行
+    openai、pymongo 這些重量級模組的頂層程式碼，啟動快又省記憶體。
+    """
+    missing = []
+    for import_name, install_name in packages.items():
+        if importlib.util.find_spec(import_name) is not None:
+            print(f"✓ {import_name} 已安裝")
+        else:
+            print(f"✗ {import_name} 未安裝")
+            missing.append(install_name)
+    return missing
+
+def install_packages(install_names):
+    """一次 pip 呼叫裝齊所有缺少的套件
+
+    每次 spawn pip 都要付一次直譯器啟動與 resolver 冷啟動成本，
+    批次安裝讓 N 個缺套件只跑一趟。
+    """
+    if not install_names:
+        return True
+    print(f"正在安裝: {' '.join(install_names)} ...")
     try:
-        __import__(import_name)
-        print(f"✓ {import_name} 已安裝")
+        subprocess.check_call([
+            sys.executable, "-m", "pip", "install",
+            "--disable-pip-version-check", *install_names
+        ])
+        print("  ✓ 安裝成功")
         return True
-    except ImportError:
-        print(f"✗ {import_name} 未安裝，正在安裝 {install_name}...")
-        try:
-            subprocess.check_call([sys.executable, "-m", "pip", "install", install_name])
-            print(f"  ✓ {install_name} 安裝成功")
-            return True
-        except subprocess.CalledProcessError:
-            print(f"  ✗ {install_name} 安裝失敗")
-            return False
+    except subprocess.CalledProcessError:
+        print("  ✗ 安裝失敗")
+        return False
 
 print("\n檢查必要套件...")
 print("-" * 40)
 
-# 檢查並安裝必要套件
-all_installed = True
-for import_name, install_name in REQUIRED_PACKAGES.items():
-    if not check_and_install_package(import_name, install_name):
-        all_installed = False
+# 檢查並批次安裝必要套件
+all_installed = install_packages(find_missing_packages(REQUIRED_PACKAGES))
 
 print("\n檢查可選套件...")
 print("-" * 40)
 
 # 檢查可選套件（不影響主程式執行）
-for import_name, install_name in OPTIONAL_PACKAGES.items():
-    check_and_install_package(import_name, install_name)
+install_packages(find_missing_packages(OPTIONAL_PACKAGES))
 
 if not all_installed:
     print("\n⚠ 警告：部分必要套件安裝失敗")
@@ -83,16 +99,15 @@ print("=" * 60)
 try:
     # 方法 1：使用 subprocess 執行
     # subprocess.run([sys.executable, "app.py"], cwd=PROJECT_DIR)
-    
+
     # 方法 2：直接執行（在同一個進程中）
+    # runpy 會走標準 import 機制，__pycache__ 的 .pyc 快取照常生效，
+    # 不像 exec(compile(...)) 每次啟動都從原始碼重新編譯
     app_file = PROJECT_DIR / "app.py"
     if app_file.exists():
         print(f"\n執行 {app_file}...\n")
-        with open(app_file, 'r', encoding='utf-8') as f:
-            app_code = f.read()
-        
-        # 執行 app.py
-        exec(compile(app_code, str(app_file), 'exec'), {'__name__': '__main__', '__file__': str(app_file)})
+        import runpy
+        runpy.run_path(str(app_file), run_name='__main__')
     else:
         print(f"錯誤：找不到 {app_file}")
         
@@ -1,10 +1,22 @@
 # config.py - 配置管理工具
 import os
 import json
+from functools import lru_cache
 from typing import Dict, Any, Optional
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 
-@dataclass
+# 處理可選套件：orjson 解析 JSON 快上數倍，沒裝則退回 stdlib
+try:
+    import orjson
+
+    def _json_loadb(data: bytes):
+        return orjson.loads(data)
+except ImportError:
+    def _json_loadb(data: bytes):
+        return json.loads(data)
+
+# slots：實例不帶 __dict__，省記憶體；frozen：配置一經載入即唯讀
+@dataclass(slots=True, frozen=True)
 class SmartShopSaverConfig:
     """SmartShopSaver 配置類別"""
     # LINE Bot 設定
@@ -38,22 +50,14 @@ class SmartShopSaverConfig:
     @classmethod
     def from_file(cls, config_file: str) -> 'SmartShopSaverConfig':
         """從配置文件創建配置"""
-        with open(config_file, 'r', encoding='utf-8') as f:
-            config_data = json.load(f)
-        
+        with open(config_file, 'rb') as f:
+            config_data = _json_loadb(f.read())
+
         return cls(**config_data)
     
     def to_dict(self) -> Dict[str, Any]:
         """轉換為字典"""
-        return {
-            'line_channel_access_token': self.line_channel_access_token,
-            'line_channel_secret': self.line_channel_secret,
-            'openai_api_key': self.openai_api_key,
-            'app_host': self.app_host,
-            'app_port': self.app_port,
-            'app_debug': self.app_debug,
-            'data_dir': self.data_dir
-        }
+        return asdict(self)
     
     def save_to_file(self, config_file: str):
         """保存到配置文件"""
@@ -61,31 +65,36 @@ class SmartShopSaverConfig:
         with open(config_file, 'w', encoding='utf-8') as f:
             json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
 
+@lru_cache(maxsize=1)
+def _load_config() -> SmartShopSaverConfig:
+    """載入配置：檔案存在檢查與 JSON 解析只在首次（或 reload 後）執行"""
+    # 優先從配置文件讀取，其次從環境變數
+    config_file = "config/config.json"
+    if os.path.exists(config_file):
+        return SmartShopSaverConfig.from_file(config_file)
+    return SmartShopSaverConfig.from_env()
+
+
 class ConfigManager:
     """配置管理器"""
-    
+
     _config: Optional[SmartShopSaverConfig] = None
-    
+
     @classmethod
     def get_config(cls) -> SmartShopSaverConfig:
         """獲取配置"""
         if cls._config is None:
-            # 優先從配置文件讀取，其次從環境變數
-            config_file = "config/config.json"
-            if os.path.exists(config_file):
-                cls._config = SmartShopSaverConfig.from_file(config_file)
-            else:
-                cls._config = SmartShopSaverConfig.from_env()
-        
+            cls._config = _load_config()
         return cls._config
-    
+
     @classmethod
     def set_config(cls, config: SmartShopSaverConfig):
         """設定配置"""
         cls._config = config
-    
+
     @classmethod
     def reload_config(cls):
         """重新載入配置"""
         cls._config = None
+        _load_config.cache_clear()
         return cls.get_config()
@@ -1,13 +1,58 @@
 import os
 import logging
+import threading
 from datetime import datetime
 from typing import Dict, List, Optional, Any
-from pymongo import MongoClient, ASCENDING, DESCENDING
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+from pymongo import MongoClient, ReturnDocument, IndexModel, UpdateOne, ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError, ConnectionFailure, ServerSelectionTimeoutError
+from bson import ObjectId
+from bson.decimal128 import Decimal128
 import json
+import time
+from collections import OrderedDict
 
 logger = logging.getLogger(__name__)
 
+# 財務摘要快取：摘要內容以分鐘為單位才會變動，查詢卻每則訊息都可能打一次，
+# 以 (user_id, 年, 月) 為鍵做 TTL + LRU，寫入支出／預算時主動失效
+_FIN_CACHE: "OrderedDict[tuple, tuple]" = OrderedDict()
+_FIN_CACHE_MAX = 10_000
+_FIN_CACHE_TTL = 60.0  # 秒
+_FIN_CACHE_LOCK = threading.Lock()
+
+
+def _fin_cache_get(key: tuple):
+    with _FIN_CACHE_LOCK:
+        cached = _FIN_CACHE.get(key)
+        if cached is not None and time.monotonic() - cached[1] < _FIN_CACHE_TTL:
+            _FIN_CACHE.move_to_end(key)
+            return cached[0]
+    return None
+
+
+def _fin_cache_put(key: tuple, value: Dict):
+    with _FIN_CACHE_LOCK:
+        _FIN_CACHE[key] = (value, time.monotonic())
+        _FIN_CACHE.move_to_end(key)
+        while len(_FIN_CACHE) > _FIN_CACHE_MAX:
+            _FIN_CACHE.popitem(last=False)
+
+
+def _fin_cache_invalidate(user_id: str):
+    with _FIN_CACHE_LOCK:
+        for key in [k for k in _FIN_CACHE if k[0] == user_id]:
+            del _FIN_CACHE[key]
+
+
+def _money(value) -> Decimal128:
+    """金額以 Decimal128 入庫：$sum 彙總不再有浮點累積誤差"""
+    return Decimal128(str(value))
+
+
+def _from_money(value):
+    """讀出時把 Decimal128 還原成 float，呼叫端介面不變（舊的 float 文件原樣通過）"""
+    return float(value.to_decimal()) if isinstance(value, Decimal128) else value
+
 class MongoDBManager:
     """MongoDB 管理器類"""
     
@@ -32,72 +77,117 @@ class MongoDBManager:
         self.database_name = database_name
         self.client = None
         self.db = None
-        
+
+        # 活動時間去抖動：同一用戶 60 秒內連發訊息只寫一次 last_active，
+        # 聊得快的用戶可省下數十倍的 users 集合寫入
+        self._activity_last: Dict[str, float] = {}
+        self._activity_lock = threading.Lock()
+
         self._connect()
     
     def _connect(self):
         """建立資料庫連接"""
         try:
+            # 明確設定連線池：預設 maxPoolSize=10 在 webhook 並發下會排隊，
+            # minPoolSize 預留常駐連線避免突發流量時重付 TCP+TLS 握手
             self.client = MongoClient(
                 self.connection_string,
-                serverSelectionTimeoutMS=5000  # 5秒超時
+                maxPoolSize=int(os.getenv("MONGO_POOL_MAX", "50")),
+                minPoolSize=int(os.getenv("MONGO_POOL_MIN", "5")),
+                maxIdleTimeMS=60000,
+                waitQueueTimeoutMS=5000,
+                serverSelectionTimeoutMS=5000,  # 5秒超時
+                retryWrites=True,
+                # 線路壓縮：subject/snippet 這類文字 payload 可壓 3-5 倍，
+                # 驅動會自動略過沒安裝的演算法、退回 zlib
+                compressors="zstd,snappy,zlib",
+                zlibCompressionLevel=-1
             )
             # 測試連接
             self.client.server_info()
             self.db = self.client[self.database_name]
-            logger.info(f"成功連接到 MongoDB 資料庫: {self.database_name}")
+            logger.info("成功連接到 MongoDB 資料庫: %s", self.database_name)
             
             # 建立索引
             self._create_indexes()
             
         except (ConnectionFailure, ServerSelectionTimeoutError) as e:
-            logger.error(f"無法連接到 MongoDB: {e}")
+            logger.error("無法連接到 MongoDB: %s", e)
             raise
     
     def _create_indexes(self):
-        """建立資料庫索引"""
+        """建立資料庫索引
+
+        複合索引鍵序依 ESR 原則（等值 → 排序 → 範圍）排列，
+        查詢都帶 user_id 等值條件，單欄位索引對這些查詢無用、只拖慢寫入。
+        每個集合用一次 create_indexes 批次建立，省往返。
+        """
         try:
             # 用戶集合索引
-            self.db.users.create_index([("line_user_id", ASCENDING)], unique=True)
-            
+            self.db.users.create_indexes([
+                IndexModel([("line_user_id", ASCENDING)], unique=True),
+            ])
+
             # 商品集合索引
-            self.db.products.create_index([("url", ASCENDING)], unique=True)
-            self.db.products.create_index([("name", ASCENDING)])
-            
-            # 價格歷史索引
-            self.db.price_history.create_index([("product_id", ASCENDING), ("timestamp", DESCENDING)])
-            
+            self.db.products.create_indexes([
+                IndexModel([("url", ASCENDING)], unique=True),
+                IndexModel([("name", ASCENDING)]),
+            ])
+
+            # 價格歷史索引：bucket 模式，一件商品一天一份文件
+            self.db.price_history.create_indexes([
+                IndexModel([("product_id", ASCENDING), ("bucket_day", DESCENDING)], unique=True),
+            ])
+
             # 追蹤列表索引
-            self.db.user_tracking.create_index([("user_id", ASCENDING), ("product_id", ASCENDING)], unique=True)
-            
+            self.db.user_tracking.create_indexes([
+                IndexModel([("user_id", ASCENDING), ("product_id", ASCENDING)], unique=True),
+            ])
+
             # 考慮清單索引
-            self.db.user_consideration.create_index([("user_id", ASCENDING)])
-            self.db.user_consideration.create_index([("user_id", ASCENDING), ("product_name", ASCENDING)])
-            self.db.user_consideration.create_index([("created_at", DESCENDING)])
-            
-            # 財務助理索引
-            self.db.expenses.create_index([("user_id", ASCENDING), ("created_at", DESCENDING)])
-            self.db.expenses.create_index([("category", ASCENDING)])
-            self.db.expenses.create_index([("shopping_record_id", ASCENDING)])
-            self.db.expenses.create_index([("source", ASCENDING)])
-            
+            self.db.user_consideration.create_indexes([
+                IndexModel([("user_id", ASCENDING)]),
+                IndexModel([("user_id", ASCENDING), ("product_name", ASCENDING)]),
+                IndexModel([("created_at", DESCENDING)]),
+            ])
+
+            # 財務助理索引：
+            # (user_id, category, created_at) 讓月度分類彙總走索引掃描，
+            # (user_id, shopping_record_id, source) 覆蓋 Gmail 自動記帳的查刪
+            self.db.expenses.create_indexes([
+                IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)]),
+                IndexModel([("user_id", ASCENDING), ("category", ASCENDING), ("created_at", DESCENDING)]),
+                IndexModel([("user_id", ASCENDING), ("shopping_record_id", ASCENDING), ("source", ASCENDING)]),
+            ])
+
             # 預算索引
-            self.db.user_budget.create_index([("user_id", ASCENDING)], unique=True)
-            
+            self.db.user_budget.create_indexes([
+                IndexModel([("user_id", ASCENDING)], unique=True),
+            ])
+
+            # 月度財務彙總（$merge 落地的 rollup，讀取時 O(1) find_one）
+            self.db.finance_summary_monthly.create_indexes([
+                IndexModel([("user_id", ASCENDING), ("period", ASCENDING)], unique=True),
+            ])
+
             # Gmail 自動記帳索引
-            self.db.gmail_processed.create_index([("user_id", ASCENDING), ("message_id", ASCENDING)], unique=True)
-            self.db.gmail_processed.create_index([("processed_at", DESCENDING)])
-            
-            # 購物記錄索引
-            self.db.shopping_records.create_index([("user_id", ASCENDING), ("message_id", ASCENDING)], unique=True)
-            self.db.shopping_records.create_index([("user_id", ASCENDING), ("email_date", DESCENDING)])
-            self.db.shopping_records.create_index([("category", ASCENDING)])
-            self.db.shopping_records.create_index([("created_at", DESCENDING)])
-            
+            self.db.gmail_processed.create_indexes([
+                IndexModel([("user_id", ASCENDING), ("message_id", ASCENDING)], unique=True),
+                IndexModel([("processed_at", DESCENDING)]),
+            ])
+
+            # 購物記錄索引：(user_id, email_date, category) 覆蓋
+            # 時間範圍查詢與統計，免回表
+            self.db.shopping_records.create_indexes([
+                IndexModel([("user_id", ASCENDING), ("message_id", ASCENDING)], unique=True),
+                IndexModel([("user_id", ASCENDING), ("email_date", DESCENDING), ("category", ASCENDING)]),
+                IndexModel([("created_at", DESCENDING)]),
+            ])
+
             logger.info("資料庫索引建立完成")
-            
+
         except Exception as e:
-            logger.error(f"建立索引時發生錯誤: {e}")
+            logger.error("建立索引時發生錯誤: %s", e)
     
     def close_connection(self):
         """關閉資料庫連接"""
@@ -110,11 +200,14 @@ class MongoDBManager:
     def create_user(self, line_user_id: str, display_name: str = None) -> bool:
         """創建新用戶"""
         try:
+            # 每個方法只取一次時鐘：少幾次 localtime 呼叫，
+            # 同一筆文件的各時間欄位也保證一致
+            now = datetime.now()
             user_data = {
                 "line_user_id": line_user_id,
                 "display_name": display_name,
-                "created_at": datetime.now(),
-                "last_active": datetime.now(),
+                "created_at": now,
+                "last_active": now,
                 "preferences": {},
                 "settings": {
                     "price_alert_threshold": 0.1,
@@ -123,106 +216,251 @@ class MongoDBManager:
             }
             
             result = self.db.users.insert_one(user_data)
-            logger.info(f"用戶創建成功: {line_user_id}")
+            logger.info("用戶創建成功: %s", line_user_id)
             return True
             
         except Exception as e:
-            logger.error(f"創建用戶失敗: {e}")
+            logger.error("創建用戶失敗: %s", e)
             return False
     
-    def get_user(self, line_user_id: str) -> Optional[Dict]:
-        """獲取用戶資料"""
+    def get_user(self, line_user_id: str, fields: Optional[List[str]] = None) -> Optional[Dict]:
+        """獲取用戶資料
+
+        fields 指定只取哪些欄位，省下 preferences/settings 等未用欄位的傳輸。
+        """
         try:
-            return self.db.users.find_one({"line_user_id": line_user_id})
+            return self.db.users.find_one(
+                {"line_user_id": line_user_id},
+                projection={f: 1 for f in fields} if fields else None
+            )
         except Exception as e:
-            logger.error(f"獲取用戶資料失敗: {e}")
+            logger.error("獲取用戶資料失敗: %s", e)
             return None
     
+    def touch_user(self, line_user_id: str) -> bool:
+        """單趟 upsert 更新活動時間，不存在就順便建立
+
+        回傳用戶先前是否已存在；取代「update + get + create」三趟往返，
+        呼叫端只在回傳 False（首次接觸）時才需要補抓 LINE profile。
+        60 秒內重複接觸直接短路（上次已寫過，必定存在）。
+        """
+        try:
+            if not self._should_flush_activity(line_user_id):
+                return True
+
+            now = datetime.now()
+            before = self.db.users.find_one_and_update(
+                {"line_user_id": line_user_id},
+                {
+                    "$set": {"last_active": now},
+                    "$setOnInsert": {
+                        "display_name": "LINE用戶",
+                        "created_at": now,
+                        "preferences": {},
+                        "settings": {
+                            "price_alert_threshold": 0.1,
+                            "notifications_enabled": True
+                        }
+                    }
+                },
+                upsert=True,
+                return_document=ReturnDocument.BEFORE,
+                projection={"_id": 1}
+            )
+            return before is not None
+        except Exception as e:
+            logger.error("更新用戶活動失敗: %s", e)
+            # 失敗時當作已存在，避免呼叫端多打 profile API
+            return True
+
+    def set_display_name(self, line_user_id: str, display_name: str) -> bool:
+        """更新用戶顯示名稱（touch_user 首次接觸後補填）"""
+        try:
+            self.db.users.update_one(
+                {"line_user_id": line_user_id},
+                {"$set": {"display_name": display_name}}
+            )
+            return True
+        except Exception as e:
+            logger.error("更新顯示名稱失敗: %s", e)
+            return False
+
+    def _should_flush_activity(self, line_user_id: str, window: float = 60.0) -> bool:
+        """活動時間是否需要落盤；需要時順便刷新記錄"""
+        now = time.monotonic()
+        with self._activity_lock:
+            if now - self._activity_last.get(line_user_id, 0.0) < window:
+                return False
+            self._activity_last[line_user_id] = now
+            # 上限防呆：極端多用戶時丟掉最舊的記錄（重寫一次無害）
+            if len(self._activity_last) > 100_000:
+                self._activity_last.clear()
+        return True
+
     def update_user_activity(self, line_user_id: str):
-        """更新用戶最後活動時間"""
+        """更新用戶最後活動時間（60 秒去抖動）"""
         try:
+            if not self._should_flush_activity(line_user_id):
+                return
             self.db.users.update_one(
                 {"line_user_id": line_user_id},
                 {"$set": {"last_active": datetime.now()}}
             )
         except Exception as e:
-            logger.error(f"更新用戶活動時間失敗: {e}")
+            logger.error("更新用戶活動時間失敗: %s", e)
     
     # ========== 商品管理 ==========
     
     def save_product(self, product_data: Dict) -> Optional[str]:
-        """保存商品資料"""
+        """保存商品資料
+
+        單趟 upsert 取代「先查再寫」：少一次網路往返，也沒有查與寫
+        之間的競爭窗口。
+        """
         try:
-            existing = self.db.products.find_one({"url": product_data["url"]})
-            
-            if existing:
-                self.db.products.update_one(
-                    {"_id": existing["_id"]},
-                    {"$set": {
-                        **product_data,
-                        "updated_at": datetime.now()
-                    }}
-                )
-                return str(existing["_id"])
-            else:
-                product_data.update({
-                    "created_at": datetime.now(),
-                    "updated_at": datetime.now()
-                })
-                result = self.db.products.insert_one(product_data)
-                return str(result.inserted_id)
-                
+            now = datetime.now()
+            doc = self.db.products.find_one_and_update(
+                {"url": product_data["url"]},
+                {
+                    "$set": {**product_data, "updated_at": now},
+                    "$setOnInsert": {"created_at": now}
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+                projection={"_id": 1}
+            )
+            return str(doc["_id"]) if doc else None
+
         except Exception as e:
-            logger.error(f"保存商品失敗: {e}")
+            logger.error("保存商品失敗: %s", e)
             return None
     
-    def get_product(self, product_id: str = None, url: str = None) -> Optional[Dict]:
+    def get_product(self, product_id: str = None, url: str = None,
+                    fields: Optional[List[str]] = None) -> Optional[Dict]:
         """獲取商品資料"""
         try:
-            from bson import ObjectId
-            
+            projection = {f: 1 for f in fields} if fields else None
             if product_id:
-                return self.db.products.find_one({"_id": ObjectId(product_id)})
+                return self.db.products.find_one(
+                    {"_id": ObjectId(product_id)}, projection=projection)
             elif url:
-                return self.db.products.find_one({"url": url})
-            
+                return self.db.products.find_one({"url": url}, projection=projection)
+
         except Exception as e:
-            logger.error(f"獲取商品資料失敗: {e}")
+            logger.error("獲取商品資料失敗: %s", e)
             return None
     
     # ========== 價格歷史管理 ==========
-    
+    #
+    # bucket 模式：一件商品一天共用一份文件，當日報價都 $push 進
+    # points 陣列。文件數從「每次報價一份」降為「每天一份」，
+    # 索引項跟著縮小一個量級，讀取一檔 30 天走勢也只要抓 30 份文件。
+    # $slice 保底 500 點，避免異常爬蟲把單日文件撐爆。
+
+    _PRICE_BUCKET_CAP = 500
+
+    @staticmethod
+    def _price_bucket_op(product_id: str, points: List[Dict], bucket_day: datetime):
+        """組出單一商品單日 bucket 的 upsert 操作"""
+        return UpdateOne(
+            {"product_id": ObjectId(product_id), "bucket_day": bucket_day},
+            {
+                "$push": {
+                    "points": {
+                        "$each": points,
+                        "$slice": -MongoDBManager._PRICE_BUCKET_CAP
+                    }
+                },
+                "$setOnInsert": {"created_at": bucket_day}
+            },
+            upsert=True
+        )
+
     def save_price_history(self, product_id: str, price: float, source: str = "scraped"):
         """保存價格歷史"""
         try:
-            from bson import ObjectId
-            
-            price_data = {
-                "product_id": ObjectId(product_id),
-                "price": price,
-                "source": source,
-                "timestamp": datetime.now()
-            }
-            
-            self.db.price_history.insert_one(price_data)
-            logger.info(f"價格歷史保存成功: 商品 {product_id}, 價格 {price}")
-            
+            now = datetime.now()
+            bucket_day = datetime(now.year, now.month, now.day)
+            point = {"ts": now, "price": _money(price), "source": source}
+            self.db.price_history.update_one(
+                {"product_id": ObjectId(product_id), "bucket_day": bucket_day},
+                {
+                    "$push": {
+                        "points": {"$each": [point], "$slice": -self._PRICE_BUCKET_CAP}
+                    },
+                    "$setOnInsert": {"created_at": bucket_day}
+                },
+                upsert=True
+            )
+            logger.info("價格歷史保存成功: 商品 %s, 價格 %s", product_id, price)
+
         except Exception as e:
-            logger.error(f"保存價格歷史失敗: {e}")
-    
+            logger.error("保存價格歷史失敗: %s", e)
+
+    def bulk_save_price_history(self, entries: List[Dict]) -> int:
+        """批次保存價格歷史
+
+        entries 每筆需含 product_id、price，可選 source。
+        先按商品分組，同商品當日的多筆報價合成一個 $each，
+        再一次 bulk_write 送出；unordered 讓伺服器可以平行處理，
+        部分失敗只記 log，不中斷整批。
+        """
+        if not entries:
+            return 0
+        try:
+            now = datetime.now()
+            bucket_day = datetime(now.year, now.month, now.day)
+            grouped: Dict[str, List[Dict]] = {}
+            for e in entries:
+                grouped.setdefault(str(e["product_id"]), []).append({
+                    "ts": now,
+                    "price": _money(e["price"]),
+                    "source": e.get("source", "scraped")
+                })
+            ops = [
+                self._price_bucket_op(pid, points, bucket_day)
+                for pid, points in grouped.items()
+            ]
+            counts = [len(points) for points in grouped.values()]
+            self.db.price_history.bulk_write(ops, ordered=False)
+            return sum(counts)
+        except BulkWriteError as e:
+            errors = e.details.get('writeErrors') or []
+            logger.error("批次保存價格歷史部分失敗: %s", errors)
+            failed = sum(counts[err["index"]] for err in errors)
+            return sum(counts) - failed
+        except Exception as e:
+            logger.error("批次保存價格歷史失敗: %s", e)
+            return 0
+
     def get_price_history(self, product_id: str, limit: int = 30) -> List[Dict]:
-        """獲取價格歷史"""
+        """獲取價格歷史
+
+        取最近的 bucket 攤平成單點列表，維持舊版
+        （product_id / price / source / timestamp，新到舊）的回傳格式。
+        最壞情況一天只有一點，抓 limit 個 bucket 必夠湊滿 limit 點。
+        """
         try:
-            from bson import ObjectId
-            
             cursor = self.db.price_history.find(
-                {"product_id": ObjectId(product_id)}
-            ).sort("timestamp", DESCENDING).limit(limit)
-            
-            return list(cursor)
-            
+                {"product_id": ObjectId(product_id)},
+                projection={"_id": 0, "points": 1}
+            ).sort("bucket_day", DESCENDING).limit(limit)
+
+            pid = ObjectId(product_id)
+            docs = []
+            for bucket in cursor:
+                for point in bucket.get("points", []):
+                    docs.append({
+                        "product_id": pid,
+                        "price": _from_money(point.get("price")),
+                        "source": point.get("source"),
+                        "timestamp": point.get("ts")
+                    })
+            docs.sort(key=lambda d: d["timestamp"], reverse=True)
+            return docs[:limit]
+
         except Exception as e:
-            logger.error(f"獲取價格歷史失敗: {e}")
+            logger.error("獲取價格歷史失敗: %s", e)
             return []
     
     # ========== 用戶追蹤管理 ==========
@@ -230,12 +468,9 @@ class MongoDBManager:
     def add_user_tracking(self, line_user_id: str, product_id: str, target_price: float = None) -> bool:
         """添加用戶追蹤商品"""
         try:
-            from bson import ObjectId
-            
-            user = self.get_user(line_user_id)
-            if not user:
-                self.create_user(line_user_id)
-            
+            # touch_user 單趟 upsert，取代 get_user + create_user 兩趟
+            self.touch_user(line_user_id)
+
             tracking_data = {
                 "user_id": line_user_id,
                 "product_id": ObjectId(product_id),
@@ -250,11 +485,11 @@ class MongoDBManager:
                 upsert=True
             )
             
-            logger.info(f"用戶追蹤添加成功: {line_user_id} -> 商品 {product_id}")
+            logger.info("用戶追蹤添加成功: %s -> 商品 %s", line_user_id, product_id)
             return True
             
         except Exception as e:
-            logger.error(f"添加用戶追蹤失敗: {e}")
+            logger.error("添加用戶追蹤失敗: %s", e)
             return False
     
     def get_user_tracking_products(self, line_user_id: str) -> List[Dict]:
@@ -286,14 +521,12 @@ class MongoDBManager:
             return list(self.db.user_tracking.aggregate(pipeline))
             
         except Exception as e:
-            logger.error(f"獲取用戶追蹤商品失敗: {e}")
+            logger.error("獲取用戶追蹤商品失敗: %s", e)
             return []
     
     def remove_user_tracking(self, line_user_id: str, product_id: str) -> bool:
         """移除用戶追蹤"""
         try:
-            from bson import ObjectId
-            
             result = self.db.user_tracking.update_one(
                 {"user_id": line_user_id, "product_id": ObjectId(product_id)},
                 {"$set": {"is_active": False}}
@@ -302,7 +535,7 @@ class MongoDBManager:
             return result.modified_count > 0
             
         except Exception as e:
-            logger.error(f"移除用戶追蹤失敗: {e}")
+            logger.error("移除用戶追蹤失敗: %s", e)
             return False
     
     # ========== 考慮清單管理 ==========
@@ -310,16 +543,16 @@ class MongoDBManager:
     def add_user_consideration(self, user_id: str, product_name: str, price_info: Dict = None) -> bool:
         """添加商品到用戶考慮清單"""
         try:
-            user = self.get_user(user_id)
-            if not user:
-                self.create_user(user_id)
-            
+            # touch_user 單趟 upsert，取代 get_user + create_user 兩趟
+            self.touch_user(user_id)
+
+            now = datetime.now()
             consideration_data = {
                 "user_id": user_id,
                 "product_name": product_name,
                 "price_info": price_info or {},
-                "created_at": datetime.now(),
-                "updated_at": datetime.now(),
+                "created_at": now,
+                "updated_at": now,
                 "is_active": True
             }
             
@@ -335,25 +568,28 @@ class MongoDBManager:
                 upsert=True
             )
             
-            logger.info(f"用戶考慮清單添加成功: {user_id} -> {product_name}")
+            logger.info("用戶考慮清單添加成功: %s -> %s", user_id, product_name)
             return True
             
         except Exception as e:
-            logger.error(f"添加考慮清單失敗: {e}")
+            logger.error("添加考慮清單失敗: %s", e)
             return False
     
-    def get_user_considerations(self, user_id: str) -> List[Dict]:
+    def get_user_considerations(self, user_id: str,
+                                fields: Optional[List[str]] = None) -> List[Dict]:
         """獲取用戶的考慮清單"""
         try:
+            # batch_size 壓低首批 getMore 的大小，縮短看到第一筆的時間
             cursor = self.db.user_consideration.find(
                 {"user_id": user_id, "is_active": True},
+                projection={f: 1 for f in fields} if fields else None,
                 sort=[("created_at", DESCENDING)]
-            )
-            
+            ).batch_size(100)
+
             return list(cursor)
             
         except Exception as e:
-            logger.error(f"獲取考慮清單失敗: {e}")
+            logger.error("獲取考慮清單失敗: %s", e)
             return []
     
     def get_user_consideration(self, user_id: str, product_name: str) -> Optional[Dict]:
@@ -366,7 +602,7 @@ class MongoDBManager:
             })
             
         except Exception as e:
-            logger.error(f"獲取考慮記錄失敗: {e}")
+            logger.error("獲取考慮記錄失敗: %s", e)
             return None
     
     def remove_user_consideration(self, user_id: str, product_name: str) -> bool:
@@ -379,12 +615,12 @@ class MongoDBManager:
             
             success = result.modified_count > 0
             if success:
-                logger.info(f"考慮清單移除成功: {user_id} -> {product_name}")
+                logger.info("考慮清單移除成功: %s -> %s", user_id, product_name)
             
             return success
             
         except Exception as e:
-            logger.error(f"移除考慮清單失敗: {e}")
+            logger.error("移除考慮清單失敗: %s", e)
             return False
     
     def update_consideration_price(self, user_id: str, product_name: str, price_info: Dict) -> bool:
@@ -409,7 +645,7 @@ class MongoDBManager:
             return result.modified_count > 0
             
         except Exception as e:
-            logger.error(f"更新考慮清單價格失敗: {e}")
+            logger.error("更新考慮清單價格失敗: %s", e)
             return False
     
     # ========== 財務管理功能 ==========
@@ -421,14 +657,19 @@ class MongoDBManager:
             from dateutil.relativedelta import relativedelta
             
             now = datetime.now()
-            
+
             if last_month:
                 month_start = datetime(now.year, now.month, 1) - relativedelta(months=1)
                 next_month = datetime(now.year, now.month, 1)
             else:
                 month_start = datetime(now.year, now.month, 1)
                 next_month = month_start + relativedelta(months=1)
-            
+
+            cache_key = (user_id, month_start.year, month_start.month)
+            cached = _fin_cache_get(cache_key)
+            if cached is not None:
+                return dict(cached, categories=dict(cached["categories"]))
+
             expenses_pipeline = [
                 {
                     "$match": {
@@ -436,6 +677,8 @@ class MongoDBManager:
                         "created_at": {"$gte": month_start, "$lt": next_month}
                     }
                 },
+                # 先投影再分組：每筆文件只上傳兩個欄位，不載整份 document
+                {"$project": {"_id": 0, "category": 1, "amount": 1}},
                 {
                     "$group": {
                         "_id": "$category",
@@ -443,19 +686,21 @@ class MongoDBManager:
                     }
                 }
             ]
-            
+
             category_expenses = list(self.db.expenses.aggregate(expenses_pipeline))
-            categories = {item["_id"]: item["total"] for item in category_expenses}
+            categories = {item["_id"]: _from_money(item["total"]) for item in category_expenses}
             total_spending = sum(categories.values())
-            
+
             budget_doc = self.db.user_budget.find_one({"user_id": user_id})
             budget = budget_doc.get("budget", 0) if budget_doc else 0
-            
-            return {
+
+            summary = {
                 "total_spending": total_spending,
                 "budget": budget,
                 "categories": categories
             }
+            _fin_cache_put(cache_key, summary)
+            return dict(summary, categories=dict(categories))
             
         except ImportError:
             logger.error("請安裝 python-dateutil: pip install python-dateutil")
@@ -471,29 +716,108 @@ class MongoDBManager:
                     "categories": []
                 }
             except Exception as e:
-                logger.error(f"獲取財務摘要失敗: {e}")
+                logger.error("獲取財務摘要失敗: %s", e)
                 return None
         except Exception as e:
-            logger.error(f"獲取財務摘要失敗: {e}")
+            logger.error("獲取財務摘要失敗: %s", e)
             return None
     
+    def refresh_finance_summary_monthly(self, user_id: Optional[str] = None,
+                                        month_start: Optional[datetime] = None) -> bool:
+        """把每月分類彙總 $merge 進 finance_summary_monthly
+
+        預先具體化讓摘要讀取變成 O(1) find_one，伺服器不必每次重算；
+        不帶參數時重算全部，帶 user_id／month_start 時只算該用戶當月
+        （寫入支出後的增量刷新走這條，範圍小、走索引）。
+        """
+        try:
+            match: Dict[str, Any] = {}
+            if user_id:
+                match["user_id"] = user_id
+            if month_start is not None:
+                from dateutil.relativedelta import relativedelta
+                match["created_at"] = {
+                    "$gte": month_start,
+                    "$lt": month_start + relativedelta(months=1)
+                }
+
+            pipeline = [
+                {"$match": match},
+                {"$project": {"_id": 0, "user_id": 1, "category": 1,
+                              "amount": 1, "created_at": 1}},
+                {"$group": {
+                    "_id": {
+                        "user_id": "$user_id",
+                        "period": {"$dateToString": {"format": "%Y-%m",
+                                                     "date": "$created_at"}},
+                        "category": {"$ifNull": ["$category", "未分類"]}
+                    },
+                    "total": {"$sum": "$amount"}
+                }},
+                {"$group": {
+                    "_id": {"user_id": "$_id.user_id", "period": "$_id.period"},
+                    "total_spending": {"$sum": "$total"},
+                    "categories": {"$push": {"k": "$_id.category", "v": "$total"}}
+                }},
+                {"$project": {
+                    "_id": 0,
+                    "user_id": "$_id.user_id",
+                    "period": "$_id.period",
+                    "total_spending": 1,
+                    "categories": {"$arrayToObject": "$categories"},
+                    "refreshed_at": "$$NOW"
+                }},
+                {"$merge": {
+                    "into": "finance_summary_monthly",
+                    "on": ["user_id", "period"],
+                    "whenMatched": "replace",
+                    "whenNotMatched": "insert"
+                }}
+            ]
+            self.db.expenses.aggregate(pipeline)
+            return True
+        except Exception as e:
+            logger.error("刷新月度財務彙總失敗: %s", e)
+            return False
+
+    def get_finance_summary_rollup(self, user_id: str, period: str) -> Optional[Dict]:
+        """讀取預先彙總的月度摘要（period 格式 YYYY-MM）"""
+        try:
+            doc = self.db.finance_summary_monthly.find_one(
+                {"user_id": user_id, "period": period},
+                projection={"_id": 0}
+            )
+            if doc:
+                doc["total_spending"] = _from_money(doc.get("total_spending"))
+                doc["categories"] = {
+                    k: _from_money(v) for k, v in doc.get("categories", {}).items()
+                }
+            return doc
+        except Exception as e:
+            logger.error("讀取月度財務彙總失敗: %s", e)
+            return None
+
     def add_user_expense(self, user_id: str, amount: float, category: str, description: str = "") -> bool:
         """新增用戶支出記錄"""
         try:
+            now = datetime.now()
             expense_data = {
                 "user_id": user_id,
-                "amount": amount,
+                "amount": _money(amount),
                 "category": category,
                 "description": description,
-                "created_at": datetime.now()
+                "created_at": now
             }
             
             self.db.expenses.insert_one(expense_data)
-            logger.info(f"支出記錄新增成功: {user_id} - {category} NT${amount}")
+            _fin_cache_invalidate(user_id)
+            self.refresh_finance_summary_monthly(
+                user_id, datetime(now.year, now.month, 1))
+            logger.info("支出記錄新增成功: %s - %s NT$%s", user_id, category, amount)
             return True
             
         except Exception as e:
-            logger.error(f"新增支出記錄失敗: {e}")
+            logger.error("新增支出記錄失敗: %s", e)
             return False
     
     def set_user_budget(self, user_id: str, budget: float) -> bool:
@@ -511,62 +835,140 @@ class MongoDBManager:
                 upsert=True
             )
             
-            logger.info(f"預算設定成功: {user_id} - NT${budget}")
+            _fin_cache_invalidate(user_id)
+            logger.info("預算設定成功: %s - NT$%s", user_id, budget)
             return True
             
         except Exception as e:
-            logger.error(f"設定預算失敗: {e}")
+            logger.error("設定預算失敗: %s", e)
             return False
     
-    def get_user_expenses(self, user_id: str, limit: int = 50) -> List[Dict]:
-        """獲取用戶的支出記錄"""
+    def get_user_expenses(self, user_id: str, limit: int = 50,
+                          after_created_at: Optional[datetime] = None) -> List[Dict]:
+        """獲取用戶的支出記錄
+
+        after_created_at 為上一頁最後一筆的 created_at：keyset 分頁直接
+        從索引定位下一頁，不像 skip 要掃過前面所有文件。
+        """
         try:
+            query: Dict[str, Any] = {"user_id": user_id}
+            if after_created_at is not None:
+                query["created_at"] = {"$lt": after_created_at}
+
             cursor = self.db.expenses.find(
-                {"user_id": user_id},
+                query,
                 sort=[("created_at", DESCENDING)]
-            ).limit(limit)
-            
-            return list(cursor)
-            
+            ).batch_size(min(limit, 100)).limit(limit)
+
+            docs = list(cursor)
+            for doc in docs:
+                doc["amount"] = _from_money(doc.get("amount"))
+            return docs
+
         except Exception as e:
-            logger.error(f"獲取支出記錄失敗: {e}")
+            logger.error("獲取支出記錄失敗: %s", e)
             return []
     
     # ========== Gmail 自動記帳功能 ==========
     
     def is_gmail_message_processed(self, user_id: str, message_id: str) -> bool:
-        """檢查 Gmail 訊息是否已處理"""
+        """檢查 Gmail 訊息是否已處理
+
+        只投影 _id：(user_id, message_id) 索引直接覆蓋，
+        不必為了測存在性抓整份文件回來。
+        """
         try:
-            result = self.db.gmail_processed.find_one({
-                "user_id": user_id,
-                "message_id": message_id
-            })
+            result = self.db.gmail_processed.find_one(
+                {"user_id": user_id, "message_id": message_id},
+                projection={"_id": 1}
+            )
             return result is not None
         except Exception as e:
-            logger.error(f"檢查郵件處理狀態失敗: {e}")
+            logger.error("檢查郵件處理狀態失敗: %s", e)
             return False
     
     def mark_gmail_message_processed(self, user_id: str, message_id: str, 
                                      subject: str = "", email_date: str = "") -> bool:
         """標記 Gmail 訊息為已處理"""
         try:
+            now = datetime.now()
+            # created_at 移入 $setOnInsert：重複標記不再覆寫建立時間，
+            # 每次 re-mark 也少寫三個欄位（user_id/message_id 由 filter 帶入）
             self.db.gmail_processed.update_one(
                 {"user_id": user_id, "message_id": message_id},
-                {"$set": {
-                    "user_id": user_id,
-                    "message_id": message_id,
-                    "subject": subject,
-                    "email_date": email_date,
-                    "processed_at": datetime.now(),
-                    "created_at": datetime.now()
-                }},
+                {
+                    "$set": {
+                        "subject": subject,
+                        "email_date": email_date,
+                        "processed_at": now
+                    },
+                    "$setOnInsert": {"created_at": now}
+                },
                 upsert=True
             )
             return True
         except Exception as e:
-            logger.error(f"標記郵件處理失敗: {e}")
+            logger.error("標記郵件處理失敗: %s", e)
             return False
     
+    def bulk_mark_gmail_processed(self, user_id: str, messages: List[Dict]) -> int:
+        """批次標記 Gmail 訊息為已處理
+
+        messages 每筆需含 message_id，可選 subject、email_date。
+        掃信迴圈收集一批後一次 flush，N 趟往返變 1 趟。
+        """
+        if not messages:
+            return 0
+        try:
+            now = datetime.now()
+            ops = [
+                UpdateOne(
+                    {"user_id": user_id, "message_id": m["message_id"]},
+                    {"$set": {
+                        "subject": m.get("subject", ""),
+                        "email_date": m.get("email_date", ""),
+                        "processed_at": now
+                    }, "$setOnInsert": {"created_at": now}},
+                    upsert=True
+                )
+                for m in messages
+            ]
+            result = self.db.gmail_processed.bulk_write(ops, ordered=False)
+            return result.upserted_count + result.modified_count
+        except BulkWriteError as e:
+            logger.error("批次標記郵件部分失敗: %s", e.details.get('writeErrors'))
+            return e.details.get("nUpserted", 0) + e.details.get("nModified", 0)
+        except Exception as e:
+            logger.error("批次標記郵件處理失敗: %s", e)
+            return 0
+
+    def bulk_save_shopping_records(self, user_id: str, records: List[Dict]) -> int:
+        """批次儲存購物記錄
+
+        records 每筆需含 message_id，其餘欄位同 save_shopping_record。
+        """
+        if not records:
+            return 0
+        try:
+            now = datetime.now()
+            ops = [
+                UpdateOne(
+                    {"user_id": user_id, "message_id": r["message_id"]},
+                    {"$set": {**r, "user_id": user_id, "updated_at": now},
+                     "$setOnInsert": {"created_at": now}},
+                    upsert=True
+                )
+                for r in records
+            ]
+            result = self.db.shopping_records.bulk_write(ops, ordered=False)
+            return result.upserted_count + result.modified_count
+        except BulkWriteError as e:
+            logger.error("批次儲存購物記錄部分失敗: %s", e.details.get('writeErrors'))
+            return e.details.get("nUpserted", 0) + e.details.get("nModified", 0)
+        except Exception as e:
+            logger.error("批次儲存購物記錄失敗: %s", e)
+            return 0
+
     def save_shopping_record(self, user_id: str, message_id: str, 
                             vendor: str, amount: float, category: str,
                             email_date: str, subject: str = "", 
@@ -574,8 +976,7 @@ class MongoDBManager:
                             raw_source: str = "GPT") -> Optional[str]:
         """儲存購物記錄"""
         try:
-            from bson import ObjectId
-            
+            now = datetime.now()
             record_data = {
                 "user_id": user_id,
                 "message_id": message_id,
@@ -587,27 +988,25 @@ class MongoDBManager:
                 "snippet": snippet,
                 "confidence": confidence,
                 "raw_source": raw_source,
-                "created_at": datetime.now(),
-                "updated_at": datetime.now()
+                "updated_at": now
             }
-            
-            result = self.db.shopping_records.update_one(
+
+            # find_one_and_update 一趟拿回 _id，更新既有記錄時
+            # 不用再補一次 find_one
+            doc = self.db.shopping_records.find_one_and_update(
                 {"user_id": user_id, "message_id": message_id},
-                {"$set": record_data},
-                upsert=True
+                {
+                    "$set": record_data,
+                    "$setOnInsert": {"created_at": now}
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+                projection={"_id": 1}
             )
-            
-            if result.upserted_id:
-                return str(result.upserted_id)
-            else:
-                existing = self.db.shopping_records.find_one({
-                    "user_id": user_id, 
-                    "message_id": message_id
-                })
-                return str(existing["_id"]) if existing else None
-            
+            return str(doc["_id"]) if doc else None
+
         except Exception as e:
-            logger.error(f"儲存購物記錄失敗: {e}")
+            logger.error("儲存購物記錄失敗: %s", e)
             return None
     
     def get_shopping_record_by_message(self, user_id: str, message_id: str) -> Optional[Dict]:
@@ -618,7 +1017,7 @@ class MongoDBManager:
                 "message_id": message_id
             })
         except Exception as e:
-            logger.error(f"獲取購物記錄失敗: {e}")
+            logger.error("獲取購物記錄失敗: %s", e)
             return None
     
     def add_gmail_expense(self, user_id: str, shopping_record_id: str,
@@ -626,61 +1025,89 @@ class MongoDBManager:
                          occurred_at: str = None) -> bool:
         """從購物記錄新增 Gmail 自動支出"""
         try:
-            from bson import ObjectId
-            
-            existing = self.db.expenses.find_one({
-                "user_id": user_id,
-                "shopping_record_id": shopping_record_id,
-                "source": "gmail_auto"
-            })
-            
-            if existing:
-                self.db.expenses.update_one(
-                    {"_id": existing["_id"]},
-                    {"$set": {
-                        "amount": amount,
-                        "category": category,
-                        "description": description,
-                        "updated_at": datetime.now()
-                    }}
-                )
-                logger.info(f"更新 Gmail 自動記帳: {description} NT${amount}")
-            else:
-                expense_data = {
-                    "user_id": user_id,
-                    "shopping_record_id": shopping_record_id,
-                    "amount": amount,
+            now = datetime.now()
+            update = {
+                "$set": {
+                    "amount": _money(amount),
                     "category": category,
                     "description": description,
-                    "source": "gmail_auto",
-                    "created_at": datetime.now()
-                }
-                
-                if occurred_at:
-                    expense_data["occurred_at"] = occurred_at
-                
-                self.db.expenses.insert_one(expense_data)
-                logger.info(f"新增 Gmail 自動記帳: {description} NT${amount}")
-            
+                    "updated_at": now
+                },
+                "$setOnInsert": {"created_at": now}
+            }
+            if occurred_at:
+                update["$setOnInsert"]["occurred_at"] = occurred_at
+
+            # 單趟 upsert 取代「先查再分支新增/更新」兩趟
+            result = self.db.expenses.update_one(
+                {
+                    "user_id": user_id,
+                    "shopping_record_id": shopping_record_id,
+                    "source": "gmail_auto"
+                },
+                update,
+                upsert=True
+            )
+            _fin_cache_invalidate(user_id)
+            self.refresh_finance_summary_monthly(
+                user_id, datetime(now.year, now.month, 1))
+
+            if result.upserted_id:
+                logger.info("新增 Gmail 自動記帳: %s NT$%s", description, amount)
+            else:
+                logger.info("更新 Gmail 自動記帳: %s NT$%s", description, amount)
+
             return True
-            
+
         except Exception as e:
-            logger.error(f"新增 Gmail 支出失敗: {e}")
+            logger.error("新增 Gmail 支出失敗: %s", e)
             return False
     
-    def get_shopping_records(self, user_id: str, limit: int = 50) -> List[Dict]:
-        """獲取用戶的購物記錄列表"""
+    def get_shopping_records(self, user_id: str, limit: int = 50,
+                             fields: Optional[List[str]] = None,
+                             after_email_date: Optional[str] = None) -> List[Dict]:
+        """獲取用戶的購物記錄列表
+
+        預設排除 snippet／raw_source 這兩個最重又少用的欄位，
+        需要完整欄位時以 fields 明確指定。
+        after_email_date 為上一頁最後一筆的 email_date，keyset 分頁用。
+        """
         try:
+            query: Dict[str, Any] = {"user_id": user_id}
+            if after_email_date is not None:
+                query["email_date"] = {"$lt": after_email_date}
+
             cursor = self.db.shopping_records.find(
-                {"user_id": user_id},
+                query,
+                projection=({f: 1 for f in fields} if fields
+                            else {"snippet": 0, "raw_source": 0}),
                 sort=[("email_date", DESCENDING)]
-            ).limit(limit)
-            
+            ).batch_size(min(limit, 100)).limit(limit)
+
             return list(cursor)
-            
+
         except Exception as e:
-            logger.error(f"獲取購物記錄列表失敗: {e}")
+            logger.error("獲取購物記錄列表失敗: %s", e)
             return []
+
+    def stream_shopping_records(self, user_id: str, limit: int = 0):
+        """逐筆串流用戶購物記錄
+
+        回傳游標而非整份 list：邊解碼邊處理，不把全部結果留在記憶體；
+        排除 snippet（最大的欄位）省下大半傳輸量。
+        """
+        try:
+            cursor = self.db.shopping_records.find(
+                {"user_id": user_id},
+                projection={"snippet": 0},
+                sort=[("email_date", DESCENDING)]
+            ).batch_size(50)
+            if limit:
+                cursor = cursor.limit(limit)
+            return cursor
+        except Exception as e:
+            logger.error("串流購物記錄失敗: %s", e)
+            return iter(())
     
     def count_shopping_records_in_range(self, user_id: str, 
                                        start_date: str, end_date: str) -> int:
@@ -695,12 +1122,13 @@ class MongoDBManager:
             })
             return count
         except Exception as e:
-            logger.error(f"統計購物記錄失敗: {e}")
+            logger.error("統計購物記錄失敗: %s", e)
             return 0
     
-    def get_shopping_records_in_range(self, user_id: str, 
+    def get_shopping_records_in_range(self, user_id: str,
                                      start_date: str, end_date: str,
-                                     limit: int = 100) -> List[Dict]:
+                                     limit: int = 100,
+                                     fields: Optional[List[str]] = None) -> List[Dict]:
         """獲取時間範圍內的購物記錄"""
         try:
             cursor = self.db.shopping_records.find(
@@ -711,46 +1139,63 @@ class MongoDBManager:
                         "$lte": end_date
                     }
                 },
+                projection=({f: 1 for f in fields} if fields
+                            else {"snippet": 0, "raw_source": 0}),
                 sort=[("email_date", DESCENDING)]
-            ).limit(limit)
-            
+            ).batch_size(min(limit, 100)).limit(limit)
+
             return list(cursor)
-            
+
         except Exception as e:
-            logger.error(f"獲取時間範圍購物記錄失敗: {e}")
+            logger.error("獲取時間範圍購物記錄失敗: %s", e)
             return []
     
     def delete_shopping_record(self, user_id: str, record_id: str) -> bool:
-        """刪除購物記錄及相關的自動記帳"""
+        """刪除購物記錄及相關的自動記帳
+
+        兩個刪除包在同一個 session 交易裡：一趟提交、也不會留下
+        孤兒支出記錄；單機 MongoDB 不支援交易時退回逐一刪除
+        （刪除具冪等性，重跑無害）。
+        """
         try:
-            from bson import ObjectId
-            
-            self.db.expenses.delete_many({
+            expense_filter = {
                 "user_id": user_id,
                 "shopping_record_id": record_id,
                 "source": "gmail_auto"
-            })
-            
-            result = self.db.shopping_records.delete_one({
-                "_id": ObjectId(record_id),
-                "user_id": user_id
-            })
-            
+            }
+            record_filter = {"_id": ObjectId(record_id), "user_id": user_id}
+
+            try:
+                with self.client.start_session() as session:
+                    with session.start_transaction():
+                        self.db.expenses.delete_many(expense_filter, session=session)
+                        result = self.db.shopping_records.delete_one(
+                            record_filter, session=session)
+            except Exception as e:
+                logger.warning("交易刪除不可用，退回逐一刪除: %s", e)
+                self.db.expenses.delete_many(expense_filter)
+                result = self.db.shopping_records.delete_one(record_filter)
+
+            _fin_cache_invalidate(user_id)
+
             return result.deleted_count > 0
-            
+
         except Exception as e:
-            logger.error(f"刪除購物記錄失敗: {e}")
+            logger.error("刪除購物記錄失敗: %s", e)
             return False
 
 # 全局資料庫實例
 db_manager = None
+_db_manager_lock = threading.Lock()
 
 def get_db_manager() -> MongoDBManager:
-    """獲取資料庫管理器實例"""
+    """獲取資料庫管理器實例（執行緒安全，整個行程共用一個連線池）"""
     global db_manager
     if db_manager is None:
-        connection_string = os.getenv("MONGODB_URI")
-        if not connection_string:
-            raise ValueError("請設定 MONGODB_URI 環境變數")
-        db_manager = MongoDBManager(connection_string)
+        with _db_manager_lock:
+            if db_manager is None:
+                connection_string = os.getenv("MONGODB_URI")
+                if not connection_string:
+                    raise ValueError("請設定 MONGODB_URI 環境變數")
+                db_manager = MongoDBManager(connection_string)
     return db_manager
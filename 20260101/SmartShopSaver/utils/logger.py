@@ -1,69 +1,123 @@
 # logger.py - 統一日誌管理工具
 import logging
 import os
-from datetime import datetime
+import threading
 from typing import Optional
 
 class Logger:
     """統一日誌管理類別"""
-    
+
     _instances = {}
-    
+    _lock = threading.Lock()
+
     @classmethod
-    def get_logger(cls, name: str, level: int = logging.INFO, 
+    def get_logger(cls, name: str, level: int = logging.INFO,
                    log_file: Optional[str] = None) -> logging.Logger:
         """
-        獲取或創建日誌記錄器
-        
+        獲取或創建日誌記錄器（執行緒安全）
+
+        兩個執行緒同時初始化同名 logger 會各掛一份 handler，
+        之後每行日誌都重複輸出；雙重檢查鎖讓 handler 只掛一次，
+        命中快取的路徑則完全不進鎖。
+
         Args:
             name: 日誌記錄器名稱
             level: 日誌級別
             log_file: 日誌文件路徑（可選）
-            
+
         Returns:
             配置好的日誌記錄器
         """
-        if name not in cls._instances:
-            logger = logging.getLogger(name)
-            logger.setLevel(level)
-            
-            # 如果還沒有處理器，添加處理器
-            if not logger.handlers:
-                # 控制台處理器
-                console_handler = logging.StreamHandler()
-                console_handler.setLevel(level)
-                
-                # 格式化器
-                formatter = logging.Formatter(
-                    '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-                )
-                console_handler.setFormatter(formatter)
-                logger.addHandler(console_handler)
-                
-                # 文件處理器（如果指定了文件路徑）
-                if log_file:
-                    os.makedirs(os.path.dirname(log_file), exist_ok=True)
-                    file_handler = logging.FileHandler(log_file, encoding='utf-8')
-                    file_handler.setLevel(level)
-                    file_handler.setFormatter(formatter)
-                    logger.addHandler(file_handler)
-            
-            cls._instances[name] = logger
-        
-        return cls._instances[name]
-
-    @staticmethod
-    def setup_basic_logging(level: int = logging.INFO):
-        """設定基本日誌配置"""
+        cached = cls._instances.get(name)
+        if cached is not None:
+            return cached
+
+        with cls._lock:
+            if name not in cls._instances:
+                logger = logging.getLogger(name)
+                logger.setLevel(level)
+
+                # 如果還沒有處理器，添加處理器
+                if not logger.handlers:
+                    # 控制台處理器
+                    console_handler = logging.StreamHandler()
+                    console_handler.setLevel(level)
+
+                    # 格式化器
+                    formatter = logging.Formatter(
+                        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+                    )
+                    console_handler.setFormatter(formatter)
+                    logger.addHandler(console_handler)
+
+                    # 文件處理器（如果指定了文件路徑）
+                    if log_file:
+                        os.makedirs(os.path.dirname(log_file), exist_ok=True)
+                        file_handler = logging.FileHandler(log_file, encoding='utf-8')
+                        file_handler.setLevel(level)
+                        file_handler.setFormatter(formatter)
+                        logger.addHandler(file_handler)
+
+                cls._instances[name] = logger
+
+            return cls._instances[name]
+
+    _queue_listener = None
+
+    @classmethod
+    def setup_basic_logging(cls, level: int = logging.INFO):
+        """設定基本日誌配置
+
+        日誌經 QueueHandler 先進佇列、由背景 QueueListener 負責真正的
+        console/檔案寫入：熱路徑上的 logger.info 只剩無鎖 enqueue，
+        不會卡在 write() 系統呼叫上。檔案改用午夜輪替，
+        延續原本按日期分檔的命名習慣。
+        """
+        import atexit
+        import queue
+        from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
         os.makedirs("logs", exist_ok=True)
+
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+        )
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+        file_handler = TimedRotatingFileHandler(
+            "logs/smartshopsaver.log",
+            when="midnight",
+            encoding='utf-8'
+        )
+        file_handler.setFormatter(formatter)
+
+        log_queue = queue.Queue(-1)
+        queue_handler = QueueHandler(log_queue)
+        # QueueHandler.prepare 會先用自己的 formatter 把訊息定稿，
+        # 設成純 %(message)s 以免監聽端再套格式時重複前綴
+        queue_handler.setFormatter(logging.Formatter('%(message)s'))
         logging.basicConfig(
             level=level,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.StreamHandler(),
-                logging.FileHandler(
-                    f"logs/smartshopsaver_{datetime.now().strftime('%Y%m%d')}.log",
-                    encoding='utf-8'
-                )
-            ]
+            handlers=[queue_handler],
+            force=True
+        )
+
+        if cls._queue_listener is None:
+            atexit.register(cls._stop_queue_listener)
+        else:
+            cls._stop_queue_listener()
+        cls._queue_listener = QueueListener(
+            log_queue, console_handler, file_handler, respect_handler_level=True
         )
+        cls._queue_listener.start()
+
+    @classmethod
+    def _stop_queue_listener(cls):
+        """停止背景日誌監聽器（冪等，供 atexit 與重複設定使用）"""
+        listener = cls._queue_listener
+        cls._queue_listener = None
+        if listener is not None:
+            try:
+                listener.stop()
+            except Exception:
+                pass
@@ -4,22 +4,137 @@
 
 import os
 import json
+import time
 import logging
+import functools
+import threading
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Any
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
-# Token 存儲目錄
+# 處理可選套件：orjson 解析 JSON 快上數倍，沒裝則退回 stdlib
+try:
+    import orjson
+
+    def _json_loadb(data: bytes):
+        return orjson.loads(data)
+
+    def _json_dumpb(obj) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:
+    def _json_loadb(data: bytes):
+        return json.loads(data)
+
+    def _json_dumpb(obj) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+# Token 存儲目錄（Mongo 不可用時的檔案後備）
 TOKENS_DIR = Path("tokens")
 TOKENS_DIR.mkdir(exist_ok=True)
 
+# token 首選存放層是 MongoDB：process 本來就保持連線池溫熱，
+# 一次 _id 查找取代每次建 service 的 open + json.load 系統呼叫
+_token_db_unavailable = False
+
+
+def _token_db():
+    """取得 Mongo token 存放層；不可用時回 None 改走 tokens/ 檔案"""
+    global _token_db_unavailable
+    if _token_db_unavailable:
+        return None
+    try:
+        from utils.mail_utils.mongodb_adapter import get_db_manager
+        return get_db_manager()
+    except Exception as e:
+        _token_db_unavailable = True
+        logger.warning(f"Mongo token 存放層不可用，退回檔案模式: {e}")
+        return None
+
+
+def _load_token_data(user_id: str) -> Optional[Dict]:
+    """讀取用戶 token 資料（Mongo 優先，檔案後備），沒有則回 None"""
+    db = _token_db()
+    if db is not None:
+        return db.get_token(user_id)
+    token_path = get_token_path(user_id)
+    if not token_path.exists():
+        return None
+    return _json_loadb(token_path.read_bytes())
+
+
+def _save_token_data(user_id: str, token_data: Dict):
+    """寫入用戶 token 資料（Mongo 優先，檔案後備以原子改寫落盤）"""
+    db = _token_db()
+    if db is not None:
+        db.save_token(user_id, token_data)
+        return
+    token_path = get_token_path(user_id)
+    tmp_path = token_path.with_suffix(".json.tmp")
+    tmp_path.write_bytes(_json_dumpb(token_data))
+    os.replace(tmp_path, token_path)
+
+
+# has_token 的 TTL 快取：user_id -> (結果, 寫入時間)
+# 每則訊息都會查 token 狀態，快取省掉重複的檔案系統 stat
+_TOKEN_STATUS_CACHE: Dict[str, Tuple[bool, float]] = {}
+_TOKEN_STATUS_TTL = 60.0  # 秒
+
+# 檔案模式的目錄清單快取：一次 scandir 換掉 N 個 stat 系統呼叫
+_TOKEN_NAMES_TTL = 5.0  # 秒
+_token_names_cache: Tuple[float, frozenset] = (0.0, frozenset())
+
+
+def _cached_token_names() -> frozenset:
+    """列出 tokens/ 下所有 token 的 user_id（5 秒 TTL）"""
+    global _token_names_cache
+    ts, names = _token_names_cache
+    now = time.monotonic()
+    if ts and now - ts < _TOKEN_NAMES_TTL:
+        return names
+    names = frozenset(
+        e.name[:-5] for e in os.scandir(TOKENS_DIR) if e.name.endswith(".json")
+    )
+    _token_names_cache = (now, names)
+    return names
+
 
 def has_token(user_id: str) -> bool:
-    """檢查用戶是否有有效的 OAuth token"""
-    token_path = TOKENS_DIR / f"{user_id}.json"
-    return token_path.exists()
+    """檢查用戶是否有有效的 OAuth token（60 秒 TTL 快取）"""
+    cached = _TOKEN_STATUS_CACHE.get(user_id)
+    now = time.monotonic()
+    if cached is not None and now - cached[1] < _TOKEN_STATUS_TTL:
+        return cached[0]
+
+    db = _token_db()
+    if db is not None:
+        exists = db.has_token(user_id)
+    else:
+        exists = user_id in _cached_token_names()
+    _TOKEN_STATUS_CACHE[user_id] = (exists, now)
+    return exists
+
+
+def has_tokens(user_ids: List[str]) -> set:
+    """批次檢查多個用戶的 token，回傳持有 token 的 ID 集合
+
+    Mongo 模式一趟 $in 查詢；檔案模式一次 scandir 做集合交集，
+    取代逐一 has_token 的 N 趟查詢 / N 個 stat。
+    """
+    if not user_ids:
+        return set()
+    db = _token_db()
+    if db is not None:
+        return db.has_tokens(user_ids)
+    return set(user_ids) & _cached_token_names()
+
+
+def invalidate_token_cache(user_id: str):
+    """清除 token 狀態快取（授權完成或撤銷後呼叫）"""
+    global _token_names_cache
+    _TOKEN_STATUS_CACHE.pop(user_id, None)
+    _token_names_cache = (0.0, frozenset())
 
 
 def get_token_path(user_id: str) -> Path:
@@ -116,13 +231,13 @@ def finish_google_oauth(code: str, redirect_uri: str, user_id: str) -> bool:
             "client_id": credentials.client_id,
             "client_secret": credentials.client_secret,
             "scopes": credentials.scopes,
+            "expiry": credentials.expiry.isoformat() if credentials.expiry else None,
             "created_at": datetime.now().isoformat()
         }
         
-        token_path = get_token_path(user_id)
-        with open(token_path, "w") as f:
-            json.dump(token_data, f)
-        
+        _save_token_data(user_id, token_data)
+
+        invalidate_token_cache(user_id)
         logger.info(f"OAuth token 已儲存: {user_id}")
         return True
         
@@ -131,40 +246,75 @@ def finish_google_oauth(code: str, redirect_uri: str, user_id: str) -> bool:
         return False
 
 
+def _token_cache_version(user_id: str):
+    """取得 token 的版本戳記（刷新後會改變），沒有 token 回 None
+
+    Mongo 模式用 expiry 字串當版本（refresh 必改 expiry），
+    檔案模式用 mtime；兩者都讓快取在 token 更新後自動失效。
+    """
+    db = _token_db()
+    if db is not None:
+        doc = db.get_token(user_id)
+        if doc is None:
+            return None
+        return doc.get("expiry") or ""
+    token_path = get_token_path(user_id)
+    if not token_path.exists():
+        return None
+    return token_path.stat().st_mtime
+
+
+@functools.lru_cache(maxsize=1024)
+def _build_service_cached(user_id: str, token_version):
+    """依 (user_id, token 版本) 快取 Gmail service
+
+    service 建立要解析 discovery 文件，每次重建都是白付的 CPU；
+    版本戳記進快取鍵讓 token 刷新後自動換新 service。
+    """
+    from google.oauth2.credentials import Credentials
+    from googleapiclient.discovery import build
+
+    token_data = _load_token_data(user_id)
+    if token_data is None:
+        raise FileNotFoundError(f"找不到用戶 {user_id} 的 token")
+
+    credentials = Credentials(
+        token=token_data.get("token"),
+        refresh_token=token_data.get("refresh_token"),
+        token_uri=token_data.get("token_uri"),
+        client_id=token_data.get("client_id"),
+        client_secret=token_data.get("client_secret"),
+        scopes=token_data.get("scopes")
+    )
+
+    try:
+        # static_discovery 用套件內建 schema，免去抓取/解析線上 discovery 文件
+        return build("gmail", "v1", credentials=credentials,
+                     cache_discovery=False, static_discovery=True)
+    except TypeError:
+        # 舊版 google-api-python-client 沒有 static_discovery 參數
+        return build("gmail", "v1", credentials=credentials,
+                     cache_discovery=False)
+
+
 def build_gmail_service(user_id: str):
     """
-    建立 Gmail API 服務
-    
+    建立 Gmail API 服務（同一 token 檔重複呼叫會回傳快取的 service）
+
     Args:
         user_id: LINE 用戶 ID
-        
+
     Returns:
         Gmail API service 物件
     """
     try:
-        from google.oauth2.credentials import Credentials
-        from googleapiclient.discovery import build
-        
-        token_path = get_token_path(user_id)
-        
-        if not token_path.exists():
+        version = _token_cache_version(user_id)
+
+        if version is None:
             raise FileNotFoundError(f"找不到用戶 {user_id} 的 token")
-        
-        with open(token_path) as f:
-            token_data = json.load(f)
-        
-        credentials = Credentials(
-            token=token_data.get("token"),
-            refresh_token=token_data.get("refresh_token"),
-            token_uri=token_data.get("token_uri"),
-            client_id=token_data.get("client_id"),
-            client_secret=token_data.get("client_secret"),
-            scopes=token_data.get("scopes")
-        )
-        
-        service = build("gmail", "v1", credentials=credentials)
-        return service
-        
+
+        return _build_service_cached(user_id, version)
+
     except ImportError:
         logger.error("請安裝 google-api-python-client: pip install google-api-python-client")
         raise
@@ -173,28 +323,132 @@ def build_gmail_service(user_id: str):
         raise
 
 
+# === 背景 token 刷新 ===
+# 把 token refresh 移出訊息處理路徑：快過期的 token 由背景執行緒先刷新，
+# 掃描請求就不用在回覆路徑上多等一次 refresh 往返
+
+_REFRESH_MARGIN = 5 * 60  # 距離過期少於 5 分鐘就先刷新
+_refresh_locks: Dict[str, threading.Lock] = {}
+_refresh_locks_guard = threading.Lock()
+_refresh_worker_started = False
+
+
+def _get_refresh_lock(user_id: str) -> threading.Lock:
+    """取得 per-user 鎖，避免與 OAuth 回調同時改寫 token 檔"""
+    with _refresh_locks_guard:
+        lock = _refresh_locks.get(user_id)
+        if lock is None:
+            lock = _refresh_locks[user_id] = threading.Lock()
+        return lock
+
+
+def refresh_token_if_needed(user_id: str) -> bool:
+    """若 token 即將過期就刷新並寫回存放層，回傳是否有刷新"""
+    with _get_refresh_lock(user_id):
+        try:
+            token_data = _load_token_data(user_id)
+            if token_data is None:
+                return False
+
+            expiry_s = token_data.get("expiry")
+            if expiry_s:
+                expiry = datetime.fromisoformat(expiry_s)
+                if (expiry - datetime.utcnow()).total_seconds() > _REFRESH_MARGIN:
+                    return False  # 還很新鮮，不用刷新
+
+            from google.oauth2.credentials import Credentials
+            from google.auth.transport.requests import Request
+
+            credentials = Credentials(
+                token=token_data.get("token"),
+                refresh_token=token_data.get("refresh_token"),
+                token_uri=token_data.get("token_uri"),
+                client_id=token_data.get("client_id"),
+                client_secret=token_data.get("client_secret"),
+                scopes=token_data.get("scopes")
+            )
+            if not credentials.refresh_token:
+                return False
+
+            credentials.refresh(Request())
+
+            token_data["token"] = credentials.token
+            token_data["expiry"] = (
+                credentials.expiry.isoformat() if credentials.expiry else None
+            )
+            _save_token_data(user_id, token_data)
+
+            logger.info(f"已於背景刷新 token: {user_id}")
+            return True
+
+        except Exception as e:
+            logger.warning(f"背景刷新 token 失敗 ({user_id}): {e}")
+            return False
+
+
+def start_token_refresh_worker(interval: int = 60):
+    """啟動背景執行緒，定期刷新快過期的 token（重複呼叫只會啟動一次）"""
+    global _refresh_worker_started
+    with _refresh_locks_guard:
+        if _refresh_worker_started:
+            return
+        _refresh_worker_started = True
+
+    def _loop():
+        while True:
+            try:
+                db = _token_db()
+                if db is not None:
+                    user_ids = db.list_token_user_ids()
+                else:
+                    user_ids = [p.stem for p in TOKENS_DIR.glob("*.json")]
+                for uid in user_ids:
+                    refresh_token_if_needed(uid)
+            except Exception as e:
+                logger.warning(f"token 刷新巡檢失敗: {e}")
+            time.sleep(interval)
+
+    threading.Thread(target=_loop, name="token-refresh", daemon=True).start()
+    logger.info("token 背景刷新執行緒已啟動")
+
+
+# 購物郵件搜尋字串：模組常數 + 按 days 快取後綴，
+# 每次掃描不必重組（再重新 UTF-8 編碼）同一段中文查詢
+_SHOPPING_QUERY = "subject:(訂單 OR 收據 OR 發票 OR 付款 OR 購買)"
+
+
+@functools.lru_cache(maxsize=32)
+def _shopping_query(days: int) -> str:
+    return f"{_SHOPPING_QUERY} newer_than:{days}d"
+
+
 class GmailShoppingTracker:
     """Gmail 購物郵件追蹤器"""
-    
+
     def __init__(self, user_id: str, db=None):
         self.user_id = user_id
         self.db = db
         self.service = None
-        
+        self._messages = None
+
         if has_token(user_id):
             try:
                 self.service = build_gmail_service(user_id)
+                # 綁定 messages() 資源 handle，後續呼叫重用同一份
+                self._messages = self.service.users().messages()
             except Exception as e:
                 logger.error(f"建立 Gmail 服務失敗: {e}")
     
-    def process_recent_emails(self, days: int = 30, force: bool = False) -> Dict:
+    def process_recent_emails(self, days: int = 30, force: bool = False,
+                              batch_size: int = 100) -> Dict:
         """
         處理最近的購物郵件
-        
+
         Args:
             days: 處理最近幾天的郵件
             force: 是否強制重新處理
-            
+            batch_size: 批次抓取郵件內容的大小（Gmail batch 上限 100）
+
         Returns:
             處理結果統計
         """
@@ -211,24 +465,100 @@ class GmailShoppingTracker:
             return result
         
         try:
-            # 搜尋購物相關郵件
-            query = "subject:(訂單 OR 收據 OR 發票 OR 付款 OR 購買)"
-            messages = self.service.users().messages().list(
-                userId="me",
-                q=query,
-                maxResults=100
-            ).execute()
-            
-            items = messages.get("messages", [])
+            # 搜尋購物相關郵件；newer_than 讓 Gmail 在伺服器端就依
+            # 天數修剪結果，不用抓回來再由客戶端過濾
+            query = _shopping_query(days)
+
+            # 以 nextPageToken 翻頁，一頁最多 500 筆，
+            # 取代原本 maxResults=100 的硬上限（超過就直接漏掉）
+            items: List[Dict] = []
+            page_token = None
+            while True:
+                resp = self._messages.list(
+                    userId="me",
+                    q=query,
+                    maxResults=500,
+                    pageToken=page_token
+                ).execute()
+                items.extend(resp.get("messages", []))
+                page_token = resp.get("nextPageToken")
+                if not page_token:
+                    break
+
             result["total_emails"] = len(items)
-            
+
             logger.info(f"找到 {len(items)} 封可能的購物郵件")
-            
-            # 這裡可以進一步處理每封郵件
+
+            # 先用一趟 $in 查詢剔除已處理的郵件，
+            # 再進 batch 抓取，省掉已處理郵件的抓取與解析
+            message_ids = [item["id"] for item in items]
+            if self.db is not None and not force:
+                try:
+                    message_ids = self.db.filter_unprocessed_message_ids(
+                        self.user_id, message_ids
+                    )
+                except AttributeError:
+                    pass  # 舊介面的 db 沒有批次篩選，照原列表抓
+
+            # 批次抓取郵件內容：N 次 round-trip 縮成 ceil(N/batch_size) 次
+            details = self._fetch_messages_batch(message_ids, batch_size=batch_size)
+
+            # 這裡可以進一步處理每封郵件（details: message_id -> metadata）
             # 實際實作時會解析郵件內容並用 GPT 分析
-            
+
             return result
-            
+
         except Exception as e:
             logger.error(f"處理郵件失敗: {e}")
             return result
+
+    def _fetch_messages_batch(self, message_ids: List[str],
+                              batch_size: int = 100) -> Dict[str, Dict]:
+        """
+        以 Gmail batch endpoint 批次抓取郵件 metadata
+
+        每個 batch 一次 HTTP round-trip 最多帶 100 個 get 請求，
+        取代逐封 messages().get().execute() 的 N+1 模式。
+        metadata 格式搭配 metadataHeaders 只回傳需要的標頭，
+        不帶郵件本文。batch 端點不可用時退回逐封抓取。
+
+        Returns:
+            message_id -> 郵件 metadata 的 dict
+        """
+        details: Dict[str, Dict] = {}
+        if not message_ids:
+            return details
+
+        def _on_message(request_id, response, exception):
+            if exception is not None:
+                logger.warning(f"批次抓取郵件失敗 ({request_id}): {exception}")
+            elif response:
+                details[response.get("id", request_id)] = response
+
+        batch_size = min(batch_size, 100)  # Gmail batch 上限
+        try:
+            for start in range(0, len(message_ids), batch_size):
+                batch = self.service.new_batch_http_request(callback=_on_message)
+                for mid in message_ids[start:start + batch_size]:
+                    batch.add(
+                        self._messages.get(
+                            userId="me", id=mid, format="metadata",
+                            metadataHeaders=["Subject", "Date", "From"]
+                        ),
+                        request_id=mid
+                    )
+                batch.execute()
+        except Exception as e:
+            logger.warning(f"batch 端點不可用，改為逐封抓取: {e}")
+            for mid in message_ids:
+                if mid in details:
+                    continue
+                try:
+                    details[mid] = self._messages.get(
+                        userId="me", id=mid, format="metadata",
+                        metadataHeaders=["Subject", "Date", "From"]
+                    ).execute()
+                except Exception as inner:
+                    logger.warning(f"抓取郵件 {mid} 失敗: {inner}")
+
+        return details
@@ -6,11 +6,25 @@ MongoDB 適配器 - 將 PostgreSQL 操作轉換為 MongoDB
 import os
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
-from pymongo import MongoClient, ASCENDING, DESCENDING
+from pymongo import MongoClient, ReturnDocument, UpdateOne, ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
+from bson import ObjectId
+from bson.decimal128 import Decimal128
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+def _from_money(value):
+    """把 Decimal128 金額轉回 float；其他型別原樣回傳
+
+    expenses 集合與主管理器共用，主管理器寫入的 amount 是
+    Decimal128，讀取端統一轉回 float 讓呼叫端照常算術。
+    """
+    if isinstance(value, Decimal128):
+        return float(value.to_decimal())
+    return value
+
 class DatabaseManager:
     """MongoDB 版本的資料庫管理器，相容 mail_1027 的介面"""
     
@@ -20,7 +34,20 @@ class DatabaseManager:
         if not mongodb_uri:
             raise ValueError("請設定 MONGODB_URI 環境變數")
         
-        self.client = MongoClient(mongodb_uri)
+        # 明確的連線池與壓縮設定：Gmail 攝入是大量小型 upsert/find，
+        # 壓縮省 wire bytes，加大池避免 webhook 併發時搶連線。
+        # compressors 按優先序列出，伺服器或本機沒裝的會自動略過
+        # （zstd 需要 pip install zstandard）
+        self.client = MongoClient(
+            mongodb_uri,
+            maxPoolSize=int(os.getenv("MONGO_POOL_MAX", "100")),
+            minPoolSize=int(os.getenv("MONGO_POOL_MIN", "10")),
+            compressors="zstd,snappy,zlib",
+            zlibCompressionLevel=-1,
+            retryWrites=True,
+            socketTimeoutMS=15000,
+            serverSelectionTimeoutMS=5000
+        )
         self.db = self.client.smartshopsaver
         
         # 建立集合
@@ -28,10 +55,17 @@ class DatabaseManager:
         self.gmail_processed = self.db.gmail_processed
         self.expenses = self.db.expenses
         self.users = self.db.users
+        # OAuth token 集合：_id 即 LINE user_id，
+        # 一次 _id 查找取代 token 檔的 stat + open + JSON 解析
+        self.gmail_tokens = self.db.gmail_tokens
         
+        # 已處理郵件的 process 內快取：(user_id, message_id) 集合。
+        # 處理結果只增不改，命中就完全不碰 Mongo
+        self._processed_cache: set = set()
+
         # 建立索引
         self._create_indexes()
-        
+
         logger.info("MongoDB 適配器初始化完成")
     
     def _create_indexes(self):
@@ -41,30 +75,138 @@ class DatabaseManager:
             ("user_id", ASCENDING),
             ("message_id", ASCENDING)
         ], unique=True)
-        
+
+        # 關鍵字查詢用：user_id + email_date 複合索引配合排序，
+        # 加上文字索引讓 $text 搜尋取代無法用索引的不定錨 regex
+        self.shopping_records.create_index([
+            ("user_id", ASCENDING),
+            ("email_date", DESCENDING)
+        ])
+        try:
+            self.shopping_records.create_index([
+                ("vendor", "text"),
+                ("subject", "text"),
+                ("description", "text"),
+                ("snippet", "text")
+            ])
+        except Exception as e:
+            logger.warning(f"建立文字索引失敗: {e}")
+
+        # search_blob：攝入時預先串好的小寫搜尋欄位，
+        # 讓關鍵字查詢用單一 regex 掃一個欄位，而不是四欄 $or
+        try:
+            self.shopping_records.create_index("search_blob")
+        except Exception as e:
+            logger.warning(f"建立 search_blob 索引失敗: {e}")
+
         # Gmail 處理記錄索引
         self.gmail_processed.create_index([
             ("user_id", ASCENDING),
             ("message_id", ASCENDING)
         ], unique=True)
         
-        # 支出記錄索引
+        # 支出記錄索引；(user_id, source, occurred_at) 完整覆蓋
+        # list_auto_expenses_in_range 的等值 + 範圍 + 排序，免去記憶體排序
         self.expenses.create_index([
             ("user_id", ASCENDING),
             ("created_at", DESCENDING)
         ])
+        self.expenses.create_index([
+            ("user_id", ASCENDING),
+            ("source", ASCENDING),
+            ("occurred_at", DESCENDING)
+        ])
     
+    # ========== Gmail OAuth token 存取 ==========
+
+    def get_token(self, user_id: str) -> Optional[Dict]:
+        """取得用戶的 OAuth token 資料（只投影憑證欄位）"""
+        return self.gmail_tokens.find_one(
+            {"_id": user_id},
+            projection={
+                "token": 1, "refresh_token": 1, "token_uri": 1,
+                "client_id": 1, "client_secret": 1, "scopes": 1, "expiry": 1
+            }
+        )
+
+    def save_token(self, user_id: str, token_data: Dict):
+        """寫入（或更新）用戶的 OAuth token 資料"""
+        self.gmail_tokens.update_one(
+            {"_id": user_id},
+            {"$set": token_data},
+            upsert=True
+        )
+
+    def has_token(self, user_id: str) -> bool:
+        """檢查用戶是否存有 OAuth token（limit=1 的 _id 計數）"""
+        return self.gmail_tokens.count_documents({"_id": user_id}, limit=1) > 0
+
+    def has_tokens(self, user_ids: List[str]) -> set:
+        """一趟 $in 查詢回傳持有 token 的用戶 ID 集合"""
+        if not user_ids:
+            return set()
+        cursor = self.gmail_tokens.find(
+            {"_id": {"$in": list(user_ids)}},
+            projection={"_id": 1}
+        )
+        return {d["_id"] for d in cursor}
+
+    def list_token_user_ids(self) -> List[str]:
+        """列出所有持有 token 的用戶 ID（供背景刷新巡檢）"""
+        return [d["_id"] for d in self.gmail_tokens.find({}, projection={"_id": 1})]
+
     def has_processed_message(self, user_id: str, message_id: str) -> bool:
-        """檢查郵件是否已處理"""
-        result = self.gmail_processed.find_one({
-            "user_id": user_id,
-            "message_id": message_id
-        })
-        return result is not None
-    
-    def mark_message_processed(self, user_id: str, message_id: str, 
-                               subject: str = "", email_date: Any = None):
+        """檢查郵件是否已處理
+
+        先查 process 內快取，同一個 session 重複檢查不再打 Mongo；
+        沒命中才查庫，且只投影 _id 確認存在，不回傳整份文件。
+        """
+        key = (user_id, message_id)
+        if key in self._processed_cache:
+            return True
+
+        exists = self.gmail_processed.find_one(
+            {"user_id": user_id, "message_id": message_id},
+            projection={"_id": 1}
+        ) is not None
+        if exists:
+            self._cache_processed(key)
+        return exists
+
+    def _cache_processed(self, key):
+        """記住已處理的 (user_id, message_id)；超量時整組清掉保底"""
+        if len(self._processed_cache) > 100_000:
+            self._processed_cache.clear()
+        self._processed_cache.add(key)
+
+    def invalidate_processed_cache(self):
+        """清空已處理郵件快取（測試或外部改庫後使用）"""
+        self._processed_cache.clear()
+
+    def filter_unprocessed_message_ids(self, user_id: str,
+                                       ids: List[str]) -> List[str]:
+        """一趟 $in 查詢篩出尚未處理的郵件 ID（保持輸入順序）
+
+        取代逐封 has_processed_message 的 N 趟存在檢查；
+        (user_id, message_id) 唯一索引完整覆蓋這個查詢。
+        查到的已處理 ID 順手塞進快取。
+        """
+        if not ids:
+            return []
+        cursor = self.gmail_processed.find(
+            {"user_id": user_id, "message_id": {"$in": ids}},
+            projection={"message_id": 1, "_id": 0}
+        )
+        seen = {d["message_id"] for d in cursor}
+        for mid in seen:
+            self._cache_processed((user_id, mid))
+        return [i for i in ids if i not in seen]
+
+    def mark_message_processed(self, user_id: str, message_id: str,
+                               subject: str = "", email_date: Any = None,
+                               session=None):
         """標記郵件為已處理"""
+        self._cache_processed((user_id, message_id))
         self.gmail_processed.update_one(
             {"user_id": user_id, "message_id": message_id},
             {"$set": {
@@ -74,17 +216,55 @@ class DatabaseManager:
                 "email_date": email_date,
                 "processed_at": datetime.now()
             }},
-            upsert=True
+            upsert=True,
+            session=session
         )
     
+    def mark_messages_processed_bulk(self, user_id: str, entries: List[Dict]) -> int:
+        """批次標記郵件為已處理
+
+        entries 每筆需含 message_id，可選 subject、email_date。
+        一次 bulk_write 取代逐封 update_one，N 封郵件只付一趟往返；
+        unordered 讓單筆失敗不擋整批。
+        """
+        if not entries:
+            return 0
+        now = datetime.now()
+        for e in entries:
+            self._cache_processed((user_id, e["message_id"]))
+        ops = [
+            UpdateOne(
+                {"user_id": user_id, "message_id": e["message_id"]},
+                {"$set": {
+                    "subject": e.get("subject", ""),
+                    "email_date": e.get("email_date"),
+                    "processed_at": now
+                }},
+                upsert=True
+            )
+            for e in entries
+        ]
+        try:
+            result = self.gmail_processed.bulk_write(ops, ordered=False)
+            return result.upserted_count + result.modified_count
+        except BulkWriteError as e:
+            logger.warning(f"批次標記郵件部分失敗: {e.details.get('writeErrors')}")
+            return e.details.get("nUpserted", 0) + e.details.get("nModified", 0)
+
     def insert_or_update_shopping_record(self, user_id: str, message_id: str,
                                         vendor: str, amount: float,
                                         category: str, email_date: Any,
                                         subject: str = "", snippet: str = "",
                                         confidence: float = 0.5,
                                         raw_source: str = "GMAIL",
-                                        **kwargs) -> str:
-        """插入或更新購物記錄"""
+                                        session=None,
+                                        **kwargs) -> Optional[ObjectId]:
+        """插入或更新購物記錄
+
+        回傳 ObjectId 本身，不先轉 hex 字串：下游把它存進
+        expenses.shopping_record_id 或拿去查詢都直接可用，
+        要給 LINE/JSON 的邊界再 str() 即可。
+        """
         record = {
             "user_id": user_id,
             "message_id": message_id,
@@ -96,66 +276,233 @@ class DatabaseManager:
             "snippet": snippet,
             "confidence": confidence,
             "raw_source": raw_source,
-            "created_at": datetime.now(),
             **kwargs
         }
-        
-        result = self.shopping_records.update_one(
+
+        # 寫入時就把可搜尋欄位串成一個小寫 blob，
+        # 查詢端只需對單一欄位做一次 regex，省掉每次搜尋的多欄比對
+        record["search_blob"] = " ".join(filter(None, [
+            subject, vendor, kwargs.get("description", ""), snippet
+        ])).lower()
+
+        # find_one_and_update 單一指令就帶回 _id，
+        # 取代 update_one + find_one 兩趟（更新既有記錄時尤其常走）
+        doc = self.shopping_records.find_one_and_update(
             {"user_id": user_id, "message_id": message_id},
-            {"$set": record},
-            upsert=True
+            {"$set": record, "$setOnInsert": {"created_at": datetime.now()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+            projection={"_id": 1},
+            session=session
         )
-        
-        if result.upserted_id:
-            return str(result.upserted_id)
-        else:
-            existing = self.shopping_records.find_one(
-                {"user_id": user_id, "message_id": message_id}
+        return doc["_id"] if doc else None
+
+    def record_processed_email(self, user_id: str, message_id: str,
+                               record: Optional[Dict] = None,
+                               subject: str = "",
+                               email_date: Any = None) -> Optional[ObjectId]:
+        """一封郵件的購物記錄與已處理標記包成同一個交易寫入
+
+        原本每封郵件要分別打 shopping_records 與 gmail_processed 兩趟；
+        放進同一個 session 交易後兩個寫入以一段指令序列送出，
+        也不會留下「已標記但沒記錄」的半套狀態。standalone MongoDB
+        不支援交易時退回逐一寫入——兩個 upsert 都冪等，重跑無害。
+        record 為 None 代表這封不是購物信，只標記已處理。
+
+        Args:
+            record: 購物記錄欄位（vendor、amount、category 等），
+                    user_id/message_id 由本方法帶入
+        """
+        def _do(session=None) -> Optional[ObjectId]:
+            rid = None
+            if record is not None:
+                rid = self.insert_or_update_shopping_record(
+                    user_id=user_id, message_id=message_id,
+                    session=session, **record
+                )
+            self.mark_message_processed(
+                user_id, message_id,
+                subject=subject or (record or {}).get("subject", ""),
+                email_date=email_date or (record or {}).get("email_date"),
+                session=session
             )
-            return str(existing["_id"]) if existing else ""
-    
+            return rid
+
+        try:
+            with self.client.start_session() as session:
+                with session.start_transaction():
+                    return _do(session=session)
+        except Exception as e:
+            logger.warning(f"交易寫入不可用，退回逐一寫入: {e}")
+            return _do()
+
+    def insert_or_update_shopping_records_bulk(self, records: List[Dict]) -> int:
+        """批次插入或更新購物記錄
+
+        records 每筆需含 user_id、message_id，其餘欄位照單寫入。
+        攝入一批 Gmail 時把 N 次 upsert 合成一次 bulk_write，
+        round-trip 從 N 趟縮成 1 趟。
+        """
+        if not records:
+            return 0
+        now = datetime.now()
+        ops = []
+        for r in records:
+            doc = dict(r)
+            doc.setdefault("raw_source", "GMAIL")
+            doc.setdefault("confidence", 0.5)
+            doc["created_at"] = now
+            doc["search_blob"] = " ".join(filter(None, [
+                doc.get("subject", ""), doc.get("vendor", ""),
+                doc.get("description", ""), doc.get("snippet", "")
+            ])).lower()
+            ops.append(UpdateOne(
+                {"user_id": doc["user_id"], "message_id": doc["message_id"]},
+                {"$set": doc},
+                upsert=True
+            ))
+        try:
+            result = self.shopping_records.bulk_write(ops, ordered=False)
+            return result.upserted_count + result.modified_count
+        except BulkWriteError as e:
+            logger.warning(f"批次寫入購物記錄部分失敗: {e.details.get('writeErrors')}")
+            return e.details.get("nUpserted", 0) + e.details.get("nModified", 0)
+
+    def insert_auto_expenses_bulk(self, expenses: List[Dict]) -> int:
+        """批次建立 Gmail 自動支出記錄
+
+        expenses 每筆需含 user_id、shopping_record_id、amount、category、
+        description、occurred_at。以 (user_id, shopping_record_id) upsert
+        搭配 $setOnInsert 保持冪等：已存在的支出不動，新支出一趟寫齊。
+        """
+        if not expenses:
+            return 0
+        now = datetime.now()
+        ops = [
+            UpdateOne(
+                {
+                    "user_id": e["user_id"],
+                    "shopping_record_id": e["shopping_record_id"],
+                    "source": "GMAIL_AUTO"
+                },
+                {"$setOnInsert": {
+                    "amount": e["amount"],
+                    "category": e["category"],
+                    "description": e.get("description", ""),
+                    "occurred_at": e.get("occurred_at"),
+                    "created_at": now
+                }},
+                upsert=True
+            )
+            for e in expenses
+        ]
+        try:
+            result = self.expenses.bulk_write(ops, ordered=False)
+            inserted = result.upserted_count
+        except BulkWriteError as e:
+            logger.warning(f"批次建立支出部分失敗: {e.details.get('writeErrors')}")
+            inserted = e.details.get("nUpserted", 0)
+
+        if inserted:
+            # 新支出會改變月度統計，清掉受影響用戶的統計快取
+            try:
+                from agents.mail_agents.expense_agent import invalidate_stats
+                for uid in {e["user_id"] for e in expenses}:
+                    invalidate_stats(uid)
+            except ImportError:
+                pass
+        return inserted
+
     def insert_auto_expense_from_record(self, user_id: str,
-                                       shopping_record_id: str,
+                                       shopping_record_id: Any,
                                        amount: float,
                                        category: str,
                                        description: str,
-                                       occurred_at: Any) -> Optional[str]:
-        """從購物記錄自動建立支出記錄"""
-        expense = {
-            "user_id": user_id,
-            "shopping_record_id": shopping_record_id,
-            "amount": amount,
-            "category": category,
-            "description": description,
-            "occurred_at": occurred_at,
-            "source": "GMAIL_AUTO",
-            "created_at": datetime.now()
-        }
-        
-        existing = self.expenses.find_one({
-            "user_id": user_id,
-            "shopping_record_id": shopping_record_id
-        })
-        
-        if existing:
-            return str(existing["_id"])
-        
-        result = self.expenses.insert_one(expense)
-        return str(result.inserted_id) if result.inserted_id else None
-    
+                                       occurred_at: Any) -> Optional[ObjectId]:
+        """從購物記錄自動建立支出記錄
+
+        整份文件放 $setOnInsert 的 upsert：已存在就原樣不動、
+        不存在才建立，並由同一個指令帶回 _id，
+        取代原本 find_one + insert_one 的兩趟往返。
+        shopping_record_id 可直接傳 upsert 回來的 ObjectId，
+        不必先轉 hex 字串再存。
+        """
+        doc = self.expenses.find_one_and_update(
+            {"user_id": user_id, "shopping_record_id": shopping_record_id},
+            {"$setOnInsert": {
+                "amount": amount,
+                "category": category,
+                "description": description,
+                "occurred_at": occurred_at,
+                "source": "GMAIL_AUTO",
+                "created_at": datetime.now()
+            }},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+            projection={"_id": 1}
+        )
+
+        # 支出可能有新寫入，清掉該用戶的統計快取（清快取很便宜，
+        # 不值得為了分辨新舊多付一趟查詢）
+        try:
+            from agents.mail_agents.expense_agent import invalidate_stats
+            invalidate_stats(user_id)
+        except ImportError:
+            pass
+
+        return doc["_id"] if doc else None
+
     def list_shopping_records(self, user_id: str, start_date: Any,
-                             end_date: Any, limit: int = 100) -> List[Dict]:
-        """列出購物記錄"""
+                             end_date: Any, limit: int = 100,
+                             fields: Optional[List[str]] = None) -> List[Dict]:
+        """列出購物記錄
+
+        fields 指定要回傳的欄位（None 則排除 snippet/search_blob
+        這兩個只服務寫入端的大欄位），配合 batch_size 縮小
+        回傳 BSON 與 cursor 往返次數。
+        """
+        if fields:
+            projection = {f: 1 for f in fields}
+        else:
+            projection = {"snippet": 0, "search_blob": 0}
         records = self.shopping_records.find({
             "user_id": user_id,
             "email_date": {
                 "$gte": start_date,
                 "$lt": end_date
             }
-        }).limit(limit).sort("email_date", DESCENDING)
-        
+        }, projection).limit(limit).sort(
+            "email_date", DESCENDING
+        ).batch_size(min(limit, 500))
+
         return list(records)
     
+    def summarize_shopping(self, user_id: str, start_date: Any,
+                           end_date: Any) -> Dict[str, Any]:
+        """彙總期間內購物記錄的筆數與總額
+
+        單一 $match + $group 聚合在伺服器端算完，只回傳一份小文件，
+        取代 count_documents + list 再用 Python 相加的兩趟全量掃描。
+        """
+        pipeline = [
+            {"$match": {
+                "user_id": user_id,
+                "email_date": {"$gte": start_date, "$lt": end_date}
+            }},
+            {"$group": {
+                "_id": None,
+                "cnt": {"$sum": 1},
+                "total": {"$sum": "$amount"}
+            }}
+        ]
+        cursor = self.shopping_records.aggregate(
+            pipeline, hint=[("user_id", ASCENDING), ("email_date", DESCENDING)]
+        )
+        row = next(iter(cursor), None)
+        if not row:
+            return {"count": 0, "total_amount": 0}
+        return {"count": row["cnt"], "total_amount": row["total"]}
+
     def count_shopping_records(self, user_id: str, start_date: Any,
                               end_date: Any, raw_source: Optional[str] = None) -> int:
         """計算購物記錄數量"""
@@ -173,8 +520,10 @@ class DatabaseManager:
         return self.shopping_records.count_documents(query)
     
     def list_auto_expenses_in_range(self, user_id: str, start_date: str,
-                                   end_date: str, limit: int = 100) -> List[Dict]:
-        """列出自動記帳記錄"""
+                                   end_date: str, limit: int = 100,
+                                   fields: Optional[List[str]] = None) -> List[Dict]:
+        """列出自動記帳記錄（fields 同 list_shopping_records）"""
+        projection = {f: 1 for f in fields} if fields else None
         expenses = self.expenses.find({
             "user_id": user_id,
             "source": "GMAIL_AUTO",
@@ -182,9 +531,15 @@ class DatabaseManager:
                 "$gte": start_date,
                 "$lt": end_date
             }
-        }).limit(limit).sort("occurred_at", DESCENDING)
-        
-        return list(expenses)
+        }, projection).limit(limit).sort(
+            "occurred_at", DESCENDING
+        ).batch_size(min(limit, 500))
+
+        docs = list(expenses)
+        for doc in docs:
+            if "amount" in doc:
+                doc["amount"] = _from_money(doc["amount"])
+        return docs
     
     def close(self):
         """關閉資料庫連接"""